@@ -1,25 +1,61 @@
 import os
+import json
+import asyncio
 import cohere
-import replicate
-import requests  # For downloading the image
 import random  # Import random for selecting a random message
-from io import BytesIO
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 from typing import Any
 from helpers import *
+from clients import get_registry
+from llm_cache import get_cache
+from memory_store import MemoryStore
+from pipeline import Stage, StagePipeline, CheckpointStore
+from prompt_template import PromptTemplate
+from image_pipeline import ImagePipeline
+from slack_stream import StreamingMessage, PLACEHOLDER, partial_json_field
+from tracing import span, record_usage
 from swe_agent import SWEAgent
 
 from abc import ABC, abstractmethod
 
+SUMMARY_PROMPT = """DO NOT USE MARKDOWN FORMATTING. Summarize the text I gave you in 3-4 bullet points. Be CONCISE. This
+        will be outputted to the slack channel for a summarized version of everything you've been thinking. Talk in 1st person as if you are the CEO thinking out loud.
+         Focus on the high-level stuff."""
+
+# Structured output for the fused answer + Slack summary request
+FUSED_SUMMARY_SCHEMA = {
+    "type": "json_object",
+    "schema": {
+        "type": "object",
+        "properties": {
+            "full": {"type": "string"},
+            "summary": {"type": "string"}
+        },
+        "required": ["full", "summary"]
+    }
+}
+
+# Used when old memory entries are compacted in the background
+MEMORY_SUMMARY_PROMPT = """DO NOT USE MARKDOWN FORMATTING. Condense these earlier notes into at most 5 short bullet points.
+        Keep decisions, facts, numbers and open questions, drop everything else."""
+
 class BaseAgent(ABC):
     def __init__(self, name, id, role, cohere_api_key, slack_token, flux_token=None):
         self.name = name  # Agent's name, e.g., "Alice"
         self.id = id
         self.role = role  # Agent's role, e.g., "CTO"
-        self.cohere_client = cohere.Client(cohere_api_key, log_warning_experimental_features=False)  # Initialize Cohere client directly with API key
-        self.memory = []  # Memory to store previous actions or responses
-        self.slack_client = WebClient(token=slack_token)  # Initialize Slack client with token
+        clients = get_registry()  # Clients are shared across agents so their connection pools stay warm
+        self.cohere_client = clients.cohere(cohere_api_key)  # Cohere client for this API key
+        self.memory = MemoryStore(f"{role}:{id}", summarize=self.summarize_memory)  # Persistent, bounded memory of previous actions
+        self.llm_cache = get_cache()  # Shared on-disk cache of LLM completions
+        self.fused_summary = os.getenv("FUSED_SUMMARY", "1") != "0"  # Answer + summary in one LLM call
+        self.slack_client = clients.slack(slack_token)  # Slack client for this bot token
+        # Async twins of the clients above, used by the a* methods so the Dictator can run agents concurrently
+        self.async_cohere_client = clients.async_cohere(cohere_api_key)
+        self.async_slack_client = clients.async_slack(slack_token)
+        self.outbox = clients.outbox(slack_token)  # Posts go through a paced background queue instead of blocking
+        self.stream_replies = os.getenv("STREAM_REPLIES", "1") != "0"  # Post a placeholder and fill it in as the LLM streams
 
     @abstractmethod
     def take_instruction(self, instruction):
@@ -27,23 +63,28 @@ class BaseAgent(ABC):
         pass
 
     def send_message_to_slack(self, message, channel_id):
-        """Send a message to Slack using the Slack SDK."""
-        try:
-            response = self.slack_client.chat_postMessage(
-                channel=channel_id,
-                text=message
-            )
-            #print(f"Message sent to Slack successfully: {response['message']['text']}")
-        except SlackApiError as e:
-            print(f"Failed to send message to Slack: {e.response['error']}")
+        """Queues a message for Slack without blocking. Returns a Future of the Slack response."""
+        return self.outbox.post(channel_id, text=message)
+
+    async def asend_message_to_slack(self, message, channel_id):
+        """Async version of send_message_to_slack."""
+        return self.outbox.post(channel_id, text=message)
+
+    def stream_reply(self, channel_id, placeholder=PLACEHOLDER):
+        """A Slack message to stream a reply into: `with self.stream_reply(channel) as reply: reply.update(text)...`"""
+        return StreamingMessage(self.outbox, channel_id, placeholder)
 
     def store_in_memory(self, instruction, action):
         """Stores the instruction and action in memory."""
-        self.memory.append({"instruction": instruction, "action": action})
+        self.memory.append(instruction, action)
 
     def recall_memory(self):
-        """Recalls previous actions and responses from memory."""
-        return self.memory
+        """Recalls previous actions and responses from memory: summaries of older entries, then the recent ones."""
+        return self.memory.recall()
+
+    def summarize_memory(self, text):
+        """Summarizer for memory compaction."""
+        return self.process_instruction_with_llm(f"{MEMORY_SUMMARY_PROMPT}\n\n{text}")
     
     def process_instruction_with_llm(self, instruction: str) -> str:
         """Uses the Cohere LLM client to process the instruction."""
@@ -52,110 +93,317 @@ class BaseAgent(ABC):
         #print(prompt)
         #print("\n\n\n")
 
-        response = self.cohere_client.generate(
-            model="command-r-08-2024",
-            prompt=prompt,
-            max_tokens=150
+        result = self.llm_cache.cached(
+            "cohere", "command-r-08-2024", prompt, {"max_tokens": 150},
+            lambda: record_usage(self.cohere_client.generate(
+                model="command-r-08-2024",
+                prompt=prompt,
+                max_tokens=150
+            )).generations[0].text.strip()
         )
-        result = response.generations[0].text.strip()
         #print(f"{self.name} processed the instruction and generated: {result}")
         return result
 
+    async def aprocess_instruction_with_llm(self, instruction: str) -> str:
+        """Async version of process_instruction_with_llm."""
+        prompt = f"{instruction}"
+
+        async def call():
+            response = await self.async_cohere_client.generate(
+                model="command-r-08-2024",
+                prompt=prompt,
+                max_tokens=150
+            )
+            record_usage(response)
+            return response.generations[0].text.strip()
+
+        return await self.llm_cache.acached("cohere", "command-r-08-2024", prompt, {"max_tokens": 150}, call)
+
+    def stream_cached(self, provider, model, prompt, params, call, validate=None):
+        """Runs a streaming `call()` through the LLM cache. Returns (text, streamed); streamed is False on a cache hit."""
+        streamed = []
+
+        def run():
+            streamed.append(True)
+            return call()
+
+        return self.llm_cache.cached(provider, model, prompt, params, run, validate), bool(streamed)
+
+    def stream_instruction_with_llm(self, instruction, on_text):
+        """Streaming version of process_instruction_with_llm: on_text(text so far) is called as tokens arrive."""
+        prompt = f"{instruction}"
+
+        def call():
+            text = ""
+            for event in self.cohere_client.generate_stream(model="command-r-08-2024", prompt=prompt, max_tokens=150):
+                if event.event_type == "text-generation":
+                    text += event.text
+                    on_text(text.strip())
+            return text.strip()
+
+        result, streamed = self.stream_cached("cohere", "command-r-08-2024", prompt, {"max_tokens": 150}, call)
+        if not streamed:
+            on_text(result)  # From the cache, all at once
+        return result
+
+    def stream_with_summary(self, instruction, on_text):
+        """Streaming version of process_with_summary. on_text gets the full response as it is generated;
+        the summary arrives with the end of the stream, so it's only in the return value."""
+        if self.fused_summary:
+            prompt = self.fused_prompt(instruction)
+            params = {"max_tokens": 450, "response_format": FUSED_SUMMARY_SCHEMA}
+
+            def call():
+                text = ""
+                for event in self.cohere_client.chat_stream(
+                    model="command-r-08-2024",
+                    message=prompt,
+                    max_tokens=450,
+                    response_format=FUSED_SUMMARY_SCHEMA
+                ):
+                    if event.event_type == "text-generation":
+                        text += event.text
+                        partial = partial_json_field(text, "full")
+                        if partial:
+                            on_text(partial.strip())
+                    elif event.event_type == "stream-end":
+                        record_usage(event.response)
+                return text
+
+            try:
+                text, streamed = self.stream_cached("cohere", "command-r-08-2024", prompt, params, call, validate=self.parse_fused)
+                full, summary = self.parse_fused(text)
+                if not streamed:
+                    on_text(full)
+                return full, summary
+            except Exception as e:
+                print(f"Fused generation failed, falling back to two calls: {e}")
+
+        response = self.stream_instruction_with_llm(instruction, on_text)
+        return response, self.summarize(response)
+
     def get_slack_id(self):
         """Getter method to get specific users slack ID."""
         return self.id
     
     def summarize(self, text: str) -> str:
         """Summarized thoughts for slack output."""
-        prompt = f"""DO NOT USE MARKDOWN FORMATTING. Summarize the text I gave you in 3-4 bullet points. Be CONCISE. This
-        will be outputted to the slack channel for a summarized version of everything you've been thinking. Talk in 1st person as if you are the CEO thinking out loud.
-         Focus on the high-level stuff."""
-        response = self.process_instruction_with_llm(f"{prompt}: {text}")
+        response = self.process_instruction_with_llm(f"{SUMMARY_PROMPT}: {text}")
         return response 
 
+    async def asummarize(self, text: str) -> str:
+        """Async version of summarize."""
+        return await self.aprocess_instruction_with_llm(f"{SUMMARY_PROMPT}: {text}")
+
+    def fused_prompt(self, instruction):
+        """Wraps an instruction so one structured response carries both the answer and its Slack summary."""
+        return f"""{instruction}
+
+Respond with a JSON object with two fields. In "full", write your complete response to the above in at most 120 words. In "summary", apply these instructions to your "full" response: {SUMMARY_PROMPT}"""
+
+    def parse_fused(self, text):
+        response_json = json.loads(text)
+        full, summary = response_json["full"].strip(), response_json["summary"].strip()
+        if not full or not summary:
+            raise ValueError("empty field in fused response")
+        return full, summary
+
+    def process_with_summary(self, instruction):
+        """Returns (full response, Slack summary), in one LLM call when fused_summary is on."""
+        if self.fused_summary:
+            prompt = self.fused_prompt(instruction)
+            params = {"max_tokens": 450, "response_format": FUSED_SUMMARY_SCHEMA}
+            try:
+                return self.parse_fused(self.llm_cache.cached(
+                    "cohere", "command-r-08-2024", prompt, params,
+                    lambda: record_usage(self.cohere_client.chat(
+                        model="command-r-08-2024",
+                        message=prompt,
+                        max_tokens=450,
+                        response_format=FUSED_SUMMARY_SCHEMA
+                    )).text,
+                    validate=self.parse_fused  # A malformed reply isn't cached, so the next call can get a good one
+                ))
+            except Exception as e:
+                print(f"Fused generation failed, falling back to two calls: {e}")
+
+        response = self.process_instruction_with_llm(instruction)
+        return response, self.summarize(response)
+
+    async def aprocess_with_summary(self, instruction):
+        """Async version of process_with_summary."""
+        if self.fused_summary:
+            prompt = self.fused_prompt(instruction)
+            params = {"max_tokens": 450, "response_format": FUSED_SUMMARY_SCHEMA}
+
+            async def call():
+                response = await self.async_cohere_client.chat(
+                    model="command-r-08-2024",
+                    message=prompt,
+                    max_tokens=450,
+                    response_format=FUSED_SUMMARY_SCHEMA
+                )
+                record_usage(response)
+                return response.text
+
+            try:
+                return self.parse_fused(await self.llm_cache.acached("cohere", "command-r-08-2024", prompt, params, call,
+                                                                     validate=self.parse_fused))
+            except Exception as e:
+                print(f"Fused generation failed, falling back to two calls: {e}")
+
+        response = await self.aprocess_instruction_with_llm(instruction)
+        return response, await self.asummarize(response)
+
     @abstractmethod
     def generate_message(self, prompt):
         pass
 
+    async def agenerate_message(self, prompt):
+        """Async version of generate_message. Falls back to running the sync one in a worker thread."""
+        return await asyncio.to_thread(self.generate_message, prompt)
+
+    @abstractmethod
+    def draft_message(self, prompt):
+        """Generates a reply to `prompt` without posting it. The draft goes to post_draft() later, or is dropped."""
+        pass
+
+    async def adraft_message(self, prompt):
+        """Async version of draft_message."""
+        return await asyncio.to_thread(self.draft_message, prompt)
+
+    @abstractmethod
+    def post_draft(self, draft):
+        """Posts a reply made by draft_message (and remembers it), like generate_message would have."""
+        pass
+
+    async def atake_instruction(self, instruction):
+        """Async version of take_instruction. Tool work (git, Replicate) stays sync and runs in a worker thread."""
+        return await asyncio.to_thread(self.take_instruction, instruction)
+
+
+CEO_STAGES = [
+    Stage(
+        "market_research",
+        "Market Research",
+        """DO NOT USE MARKDOWN FORMATTING. I'm the CEO of a tech startup looking to enter the AI-driven healthcare market. I need to get a clear understanding of the current market dynamics. 
+            What are the key trends, challenges, and opportunities in this space? I want to find the major players, the gaps they're not addressing, and where we could make an impact. 
+            Talk in 1st person as if you are the CEO thinking out loud. """,
+    ),
+    Stage(
+        "idea_creation",
+        "Tech Idea Creation",
+        """DO NOT USE MARKDOWN FORMATTING. Now that I've gathered valuable insights from my market research, I need to come up with a tech idea that can really make an impact. 
+            Based on the trends and opportunities I uncovered—{previous_output}—what innovative solution can we develop that solves the biggest pain points in this space? 
+            Talk in 1st person as if you are the CEO thinking out loud.""",
+    ),
+    Stage(
+        "product_creation",
+        "Product Creation",
+        """DO NOT USE MARKDOWN FORMATTING. I've now developed a strong tech idea: {previous_output}. The next step is to conceptualize the product around this idea.
+            I need to think about how we can bring this idea to life in a way that solves the problem effectively, while also creating a product that is easy to use, scalable, and marketable. 
+            Talk in 1st person as if you are the CEO thinking out loud.""",
+    ),
+    Stage(
+        "business_plan",
+        "Business Plan Finalization",
+        """DO NOT USE MARKDOWN FORMATTING. Now that we've conceptualized the product, it's time to finalize the business plan. The product is based on {previous_output}, and I need to think carefully about our strategy moving forward.
+            What's our go-to-market strategy? How should we position ourselves against competitors, and what’s our revenue model? This business plan needs to be forward-looking and adaptable as we grow. 
+            Talk in 1st person as if you are the CEO thinking out loud.""",
+    ),
+]
+
 
 class CEO(BaseAgent):
-    def __init__(self, name, id, cohere_api_key, slack_token):
+    def __init__(self, name, id, cohere_api_key, slack_token, stages=None, checkpoint_dir=None):
         super().__init__(name, id, "CEO", cohere_api_key, slack_token)
-        self.stages = [
-            "market_research",
-            "idea_creation",
-            "product_creation",
-            "business_plan",
-        ]  # List of stages in order
+        self.stages = list(stages or CEO_STAGES)  # List of stages in order
         self.current_stage_index = 0  # Initial stage index
+        self.checkpoint_dir = checkpoint_dir  # Where stage checkpoints go (defaults to the shared cache dir)
 
     def take_instruction(self, instruction):
         """Initial entry point for the CEO to start the feedback loop process."""
         #(f"{self.name} received instruction: {instruction}")
         self.run_stage(instruction)
 
-    def run_stage(self, previous_output):
-        """General function to handle each stage recursively."""
-        if self.current_stage_index >= len(self.stages):
-            print("Feedback loop complete. Business plan is ready for execution.")
-            self.send_message_to_slack("Business plan is ready for execution.", "C07N3SLH5EU")
-            return  # End the recursive process when all stages are done
-        
-        current_stage = self.stages[self.current_stage_index]
-        
-        # Determine the prompt based on the current stage
-        if current_stage == "market_research":
-            prompt = f"""DO NOT USE MARKDOWN FORMATTING. I'm the CEO of a tech startup looking to enter the AI-driven healthcare market. I need to get a clear understanding of the current market dynamics. 
-            What are the key trends, challenges, and opportunities in this space? I want to find the major players, the gaps they're not addressing, and where we could make an impact. 
-            Talk in 1st person as if you are the CEO thinking out loud. """
-            instruction = "Market Research"
-        
-        elif current_stage == "idea_creation":
-            prompt = f"""DO NOT USE MARKDOWN FORMATTING. Now that I've gathered valuable insights from my market research, I need to come up with a tech idea that can really make an impact. 
-            Based on the trends and opportunities I uncovered—{previous_output}—what innovative solution can we develop that solves the biggest pain points in this space? 
-            Talk in 1st person as if you are the CEO thinking out loud."""
-            instruction = "Tech Idea Creation"
-        
-        elif current_stage == "product_creation":
-            prompt = f"""DO NOT USE MARKDOWN FORMATTING. I've now developed a strong tech idea: {previous_output}. The next step is to conceptualize the product around this idea.
-            I need to think about how we can bring this idea to life in a way that solves the problem effectively, while also creating a product that is easy to use, scalable, and marketable. 
-            Talk in 1st person as if you are the CEO thinking out loud."""
-            instruction = "Product Creation"
-        
-        elif current_stage == "business_plan":
-            prompt = f"""DO NOT USE MARKDOWN FORMATTING. Now that we've conceptualized the product, it's time to finalize the business plan. The product is based on {previous_output}, and I need to think carefully about our strategy moving forward.
-            What's our go-to-market strategy? How should we position ourselves against competitors, and what’s our revenue model? This business plan needs to be forward-looking and adaptable as we grow. 
-            Talk in 1st person as if you are the CEO thinking out loud."""
-            instruction = "Business Plan Finalization"
-        
+    def run_stage(self, previous_output, resume=True):
+        """Runs the remaining stages as a checkpointed pipeline, resuming after the last completed stage."""
+        run_id = StagePipeline.run_id_for("ceo", self.stages, previous_output)
+        pipeline = StagePipeline(self.stages, CheckpointStore(run_id, self.checkpoint_dir), self.run_pipeline_stage)
+
+        # Stages finished by an earlier run are restored into memory instead of being paid for again
+        completed = pipeline.completed() if resume else []
+        for record in completed:
+            if not self.memory.contains(record["instruction"], record["output"]):  # Memory persists across restarts too
+                self.store_in_memory(record["instruction"], record["output"])
+        self.current_stage_index = len(completed)
+
+        pipeline.run(previous_output, resume=resume)
+
+        print("Feedback loop complete. Business plan is ready for execution.")
+        self.send_message_to_slack("Business plan is ready for execution.", "C07N3SLH5EU")
+
+    def run_pipeline_stage(self, stage, previous_output):
+        """Does the work for one stage and returns (full output, Slack summary)."""
+        prompt = stage.build_prompt(previous_output)
+
         # Process the prompt with the LLM
-        response = self.process_instruction_with_llm(prompt)
-        self.store_in_memory(instruction, response)
-        summarized_response = self.summarize(response)
-        self.send_message_to_slack(f"{instruction}: {summarized_response}", "C07N3SLH5EU")  # Send to Slack
+        if self.stream_replies:
+            # The stage's thinking shows up in Slack as it's generated, then the message settles on the summary
+            with self.stream_reply("C07N3SLH5EU", f"{stage.instruction}: {PLACEHOLDER}") as reply:
+                response, summarized_response = self.stream_with_summary(prompt, lambda text: reply.update(f"{stage.instruction}: {text}"))
+                reply.finish(f"{stage.instruction}: {summarized_response}")
+            self.store_in_memory(stage.instruction, response)
+        else:
+            response, summarized_response = self.process_with_summary(prompt)
+            self.store_in_memory(stage.instruction, response)
+            self.send_message_to_slack(f"{stage.instruction}: {summarized_response}", "C07N3SLH5EU")  # Send to Slack
 
         # Move to the next stage
         self.current_stage_index += 1
-
-        # Recursively call the function to proceed to the next stage
-        self.run_stage(response)
+        return response, summarized_response
     
     def generate_message(self, prompt):
-        response = self.process_instruction_with_llm(prompt)
+        self.post_draft(self.draft_message(prompt))
+
+    async def agenerate_message(self, prompt):
+        self.post_draft(await self.aprocess_instruction_with_llm(prompt))
+
+    def draft_message(self, prompt):
+        return self.process_instruction_with_llm(prompt)
+
+    def post_draft(self, response):
         self.store_in_memory("Generate Response", response)
         self.send_message_to_slack(f"{trim_quotations(response)}", "C07MF3WH7UJ")
 
 
+LOGO_PROMPT = (
+    "Design a modern, minimalist logo for a tech company called 'Echo', which builds automated 911 caller systems. "
+    "The logo should convey trust, reliability, and quick response. The design should incorporate clean lines, a subtle "
+    "tech feel, and a symbol representing communication or emergency response (e.g., a soundwave or signal). Use colors "
+    "that evoke safety, such as blue or green, but keep the overall design sleek and professional."
+)
+
+LOGO_MESSAGE_PROMPT = (
+    "Generate a friendly, human-like SHORT message from a marketer presenting a draft of a new company logo to the team. "
+    "The logo is for a tech company called 'Echo', which builds automated 911 caller systems. The message should be "
+    "informal, encourage feedback, and describe the design briefly."
+    "Include request for CTO to upload logo to Echo's website: 'Can you please upload the logo to the website ASAP?'."
+)
+
+
 class Marketer(BaseAgent):
     def __init__(self, name, id, role, cohere_api_key, slack_token, flux_token):
         super().__init__(name, id, role, cohere_api_key, slack_token, flux_token)
-        self.slack_client = WebClient(token=slack_token)
 
         # Get Replicate API token from environment variables
         self.replicate_api_token = flux_token
+        self.replicate_client = get_registry().replicate(flux_token)
+        self.image_pipeline = ImagePipeline(self.replicate_client, cache=self.llm_cache)
+        self.logo_variants = int(os.getenv("LOGO_VARIANTS", "1"))  # Drafts generated in parallel per logo request
         self.metadata = {
-            "branding_documents": [],  # Store branding documents
-            "logos": []  # Store logo URLs and related metadata
+            "branding_documents": self.memory.log("branding_documents", hot_size=5),  # Store branding documents
+            "logos": self.memory.log("logos", hot_size=20)  # Store logo URLs and related metadata
         }
 
     def take_instruction(self, instruction):
@@ -173,9 +421,36 @@ class Marketer(BaseAgent):
         self.store_in_memory(instruction, action)
         return action
 
+    async def atake_instruction(self, instruction):
+        """Async version of take_instruction; the LLM call and the Slack reply run concurrently."""
+        response, _ = await asyncio.gather(
+            self.aprocess_instruction_with_llm(instruction),
+            self.ageneric_message(instruction),
+        )
+        action = f"{self.name} processed the instruction: {response}"
+
+        self.store_in_memory(instruction, action)
+        return action
+
     def generic_message(self, text) -> str:
         """General endpoint to have a conversation with the marketing agent."""
-        prompt=f"""
+        if self.stream_replies:
+            with self.stream_reply("C07MF3WH7UJ") as reply:
+                reply.finish(self.stream_instruction_with_llm(self.generic_prompt(text), reply.update))
+            return
+        response = self.process_instruction_with_llm(self.generic_prompt(text))
+        self.send_message_to_slack(f"{response}", "C07MF3WH7UJ")
+
+    async def ageneric_message(self, text) -> str:
+        """Async version of generic_message."""
+        if self.stream_replies:
+            return await asyncio.to_thread(self.generic_message, text)  # The streaming clients are sync
+        response = await self.aprocess_instruction_with_llm(self.generic_prompt(text))
+        await self.asend_message_to_slack(f"{response}", "C07MF3WH7UJ")
+
+    def generic_prompt(self, text):
+        """Builds the conversation prompt for the marketing agent."""
+        return f"""
                 As the marketing lead of a fast-growing tech startup, you're known for your artistic eye. You’ve been brought into a Slack discussion where various artistic challenges are being debated. Read the following message carefully and respond with sound technical advice, thoughtful insights, and clear action points. Your tone should be confident but approachable, demonstrating strong leadership while maintaining open communication with your team.
 
                 Avoid using markdown formatting. Instead, focus on explaining key artistic ideas in a structured, logical manner. Be sure to provide actionable next steps or solutions to address the technical issues discussed.
@@ -183,74 +458,49 @@ class Marketer(BaseAgent):
 
                 Now, respond as the marketing with creative flair. Provide creative thoughts and discuss further iterations. Focus on solutions, but keep it conversational. This is a serious matter. Focus on the task at hand.
                 """
-        response = self.process_instruction_with_llm(prompt)
-        self.send_message_to_slack(f"{response}", "C07MF3WH7UJ")
 
 
 
-    def create_logo(self):
-        """Generates a logo using Replicate API and generates a human-like reply using Cohere, then sends it to Slack."""
+    def create_logo(self, variants=None):
+        """Generates logo variants on Replicate, writes a human-like message with Cohere and uploads the images to Slack."""
         print(f"{self.name} is generating a logo with Replicate...")
+        try:
+            images = self.image_pipeline.generate(LOGO_PROMPT, variants or self.logo_variants, guidance=3.5)
+            return self.share_logos(images)
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+            return "Failed to create a logo."
 
-        # Static prompt for the logo creation
-        logo_prompt = (
-            "Design a modern, minimalist logo for a tech company called 'Echo', which builds automated 911 caller systems. "
-            "The logo should convey trust, reliability, and quick response. The design should incorporate clean lines, a subtle "
-            "tech feel, and a symbol representing communication or emergency response (e.g., a soundwave or signal). Use colors "
-            "that evoke safety, such as blue or green, but keep the overall design sleek and professional."
-        )
-
+    async def acreate_logo(self, variants=None):
+        """Async version of create_logo; the predictions are awaited without holding a thread."""
+        print(f"{self.name} is generating a logo with Replicate...")
         try:
-            # Set up the input for the Replicate API to generate the logo
-            input = {
-                "prompt": logo_prompt,
-                "guidance": 3.5  # Customize guidance if needed
-            }
-
-            # Call Replicate API to generate the image
-            output = replicate.run(
-                "black-forest-labs/flux-dev",
-                input=input
-            )
-            image_url = output[0]  # The first image URL generated
-
-            # Now, generate the human-like message using Cohere
-            message_prompt = (
-                "Generate a friendly, human-like SHORT message from a marketer presenting a draft of a new company logo to the team. "
-                "The logo is for a tech company called 'Echo', which builds automated 911 caller systems. The message should be "
-                "informal, encourage feedback, and describe the design briefly."
-                "Include request for CTO to upload logo to Echo's website: 'Can you please upload the logo to the website ASAP?'."
-            )
+            images = await self.image_pipeline.agenerate(LOGO_PROMPT, variants or self.logo_variants, guidance=3.5)
+            return await asyncio.to_thread(self.share_logos, images)
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+            return "Failed to create a logo."
 
-            # Call the Cohere API to generate the message
-            cohere_response = self.cohere_client.generate(
+    def share_logos(self, images):
+        """Uploads the generated images to Slack straight from memory and records them. Returns the action."""
+        # Call the Cohere API to generate the message (served from the cache on re-runs)
+        generated_message = self.llm_cache.cached(
+            "cohere", "command-xlarge-nightly", LOGO_MESSAGE_PROMPT, {"max_tokens": 100, "temperature": 0.8},
+            lambda: record_usage(self.cohere_client.generate(
                 model='command-xlarge-nightly',  # Use a large model for high-quality text
-                prompt=message_prompt,
+                prompt=LOGO_MESSAGE_PROMPT,
                 max_tokens=100,
                 temperature=0.8  # Adjust the temperature for more creativity
-            )
+            )).generations[0].text.strip()
+        )
 
-            # Extract the generated message from Cohere's response
-            generated_message = cohere_response.generations[0].text.strip()
+        message = "Can you change the logo image to this?" if len(images) == 1 else "Can you change the logo image to one of these?"
+        self.send_images_to_slack(message, images)
 
-            # Combine the generated message with the image URL
-            # message = f"{generated_message}\n\n{image_url}"
-            message="Can you change the logo image to this? {image_url}"
+        for image in images:
+            self.metadata["logos"].append(dict(image.metadata(), description=generated_message, prompt=LOGO_PROMPT))
 
-            # Send the Cohere-generated message with the image link to Slack
-            self.send_image_link_to_slack(message)
-
-            self.metadata["logos"].append({
-                "url": image_url,
-                "description": generated_message,
-                "prompt": logo_prompt  # Storing the prompt for future context
-            })
-
-            action = f"{self.name} shared a draft logo: {image_url}"
-            return action
-        except Exception as e:
-            print(f"An unexpected error occurred: {e}")
-            return "Failed to create a logo."
+        return f"{self.name} shared {len(images)} draft logo(s): {', '.join(image.url for image in images)}"
 
     def create_branding_document(self):
         """Generates a branding document using Cohere and formats it as structured text for Slack."""
@@ -273,16 +523,17 @@ class Marketer(BaseAgent):
             """
 
             # Call the Cohere API to generate the branding document text
-            response = self.cohere_client.generate(
-                model='command-xlarge-nightly',
-                prompt=prompt,
-                max_tokens=500,
-                temperature=0.8
+            branding_document = self.llm_cache.cached(
+                "cohere", "command-xlarge-nightly", prompt, {"max_tokens": 500, "temperature": 0.8},
+                lambda: record_usage(self.cohere_client.generate(
+                    model='command-xlarge-nightly',
+                    prompt=prompt,
+                    max_tokens=500,
+                    temperature=0.8
+                )).generations[0].text.strip()
             )
 
             print("Cohere response received.")
-            # Extract the generated document from the response
-            branding_document = response.generations[0].text.strip()
 
             # Check if the branding document is valid
             if not branding_document:
@@ -316,26 +567,15 @@ class Marketer(BaseAgent):
     
     def send_text_to_slack(self, text):
         """Sends a text message to a Slack channel."""
-        try:
-            response = self.slack_client.chat_postMessage(
-                channel="C07MF3WH7UJ",  # Replace with your Slack channel ID
-                text=text
-            )
-            print("Branding document sent to Slack successfully!")
-        except SlackApiError as e:
-            print(f"Slack API error: {e.response['error']}")
+        self.outbox.post("C07MF3WH7UJ", text=text)  # Replace with your Slack channel ID
+        print("Branding document queued for Slack.")
+
+    def send_images_to_slack(self, message, images):
+        """Uploads the images (bytes in memory, nothing written to disk) with `message` as the comment."""
+        uploads = [{"content": image.data, "filename": image.filename, "title": f"Logo draft {image.variant + 1}"} for image in images]
+        self.outbox.post("C07MF3WH7UJ", method="files_upload_v2", file_uploads=uploads, initial_comment=message)  # Replace with your Slack channel ID
+        print(f"{len(images)} logo image(s) queued for upload to Slack.")
 
-    def send_image_link_to_slack(self, message):
-        """Sends the generated message along with the image link to a Slack channel."""
-        try:
-            response = self.slack_client.chat_postMessage(
-                channel="C07MF3WH7UJ",  # Replace with your Slack channel ID
-                text=message
-            )
-            print("Cohere-generated message with image URL sent to Slack successfully!")
-        except SlackApiError as e:
-            print(f"Slack API error: {e.response['error']}")
-    
     def format_branding_document(self, branding_document):
         """
         Formats the branding document text dynamically by applying bullet points and basic formatting
@@ -376,14 +616,47 @@ class Marketer(BaseAgent):
         # potentially change
         return self.take_instruction(text)
 
+    async def agenerate_message(self, text):
+        return await self.atake_instruction(text)
+
+    def draft_message(self, text):
+        """take_instruction's two LLM calls, without posting: (instruction, response, Slack reply)."""
+        return text, self.process_instruction_with_llm(text), self.process_instruction_with_llm(self.generic_prompt(text))
+
+    def post_draft(self, draft):
+        instruction, response, reply = draft
+        self.send_message_to_slack(f"{reply}", "C07MF3WH7UJ")
+        action = f"{self.name} processed the instruction: {response}"
+        self.store_in_memory(instruction, action)
+        return action
+
+
+# Static part of the CTO's conversation prompt. It comes before the message so it can be served from the provider's prompt cache
+CTO_PROMPT_PREFIX = """
+                As the CTO of a fast-growing tech startup, you're known for your deep technical expertise and ability to simplify complex subjects. You’ve been brought into a Slack discussion where various technical challenges are being debated. Read the message at the end carefully and respond with sound technical advice, thoughtful insights, and clear action points. Your tone should be confident but approachable, demonstrating strong leadership while maintaining open communication with your team.
+
+                Avoid using markdown formatting. Instead, focus on explaining key technical ideas in a structured, logical manner. Use precise language that non-technical and technical members alike can understand. Be sure to provide actionable next steps or solutions to address the technical issues discussed.
+
+                Example topics that might arise:
+                - Architecture design decisions (e.g., microservices vs monolithic architecture)
+                - Cloud infrastructure choices (e.g., AWS, Azure, GCP)
+                - Software scalability challenges
+                - DevOps pipelines and automation best practices
+                - Implementing security protocols
+                - Talking about the codebase and best practices
+
+                Respond as the CTO with sound technical knowledge. Assign another employee a task directly. Make the task specific. Focus on solutions, but keep it conversational. Be extremely serious.
+"""
 
 
 class CTOAgent(BaseAgent):
-    def __init__(self, name, id, cohere_api_key, slack_token, github_repo_path, github_token):
+    def __init__(self, name, id, cohere_api_key, slack_token, github_repo_path, github_token, repo_url=None):
         super().__init__(name, id, "CTO", cohere_api_key, slack_token)
         self.github_repo_path = github_repo_path  # Path to the local GitHub repository
         self.github_token = github_token  # GitHub Personal Access Token (for HTTPS authentication)
+        self.repo_url = repo_url or os.getenv("GITHUB_REPO_URL", "https://github.com/rajansagarwal/stealth-startup-dev.git")  # Where code() pushes
         self.swe_agent = SWEAgent(self.github_repo_path)  # Initialize the SWEAgent to handle project changes
+        self.prompt_template = PromptTemplate("cto_reply", CTO_PROMPT_PREFIX)
 
     def take_instruction(self, instruction):
         """Process an instruction to implement code-related changes."""
@@ -392,6 +665,10 @@ class CTOAgent(BaseAgent):
 
     def code(self, task_description):
         """Generates code changes and pushes them to the linked repository."""
+        with span("cto.code", agent=self.name):
+            self._code(task_description)
+
+    def _code(self, task_description):
         print(f"{self.name} is executing the code function.")
 
         # Step 1: Map the project directory
@@ -403,7 +680,9 @@ class CTOAgent(BaseAgent):
         # Step 3: Ask for confirmation to implement the changes
         """ user_input = input("Do you want to implement the proposed changes? (Y/N): ")
         if user_input.strip().upper() == 'Y': """
-        self.swe_agent.implement_feature(proposed_changes)
+        if not self.swe_agent.implement_feature(proposed_changes):
+            print("Changes could not be applied cleanly; nothing was pushed.")
+            return
         print("Changes implemented. Pushing to GitHub...")
         self.push_changes_to_github()
         """ else:
@@ -414,11 +693,13 @@ class CTOAgent(BaseAgent):
         self.swe_agent.commit_changes()  # Commit changes using SWEAgent
         print(f"Changes have been committed to the repository at {self.github_repo_path}.")
 
-        # Push the committed changes to the GitHub repository
+        # Push the committed changes to the GitHub repository; the token goes through the credential helper, not the URL
         try:
-            repo_url = f"https://{self.github_token}@github.com/rajansagarwal/stealth-startup-dev.git"
-            os.system(f'git -C {self.github_repo_path} push {repo_url}')
-            print(f"Changes pushed to {repo_url}.")
+            repo_url = self.repo_url
+            if self.swe_agent.git.push(repo_url, token=self.github_token):
+                print(f"Changes pushed to {repo_url} ({self.swe_agent.git.report_timings()}).")
+            else:
+                print(f"Failed to push changes to {repo_url}.")
         except Exception as e:
             print(f"Failed to push changes: {e}")
 
@@ -435,23 +716,31 @@ class CTOAgent(BaseAgent):
 
     def generate_message(self, text) -> str:
         """General endpoint to have a conversation with the CTO agent."""
-        prompt=f"""
-                As the CTO of a fast-growing tech startup, you're known for your deep technical expertise and ability to simplify complex subjects. You’ve been brought into a Slack discussion where various technical challenges are being debated. Read the following message carefully and respond with sound technical advice, thoughtful insights, and clear action points. Your tone should be confident but approachable, demonstrating strong leadership while maintaining open communication with your team.
-
-                Avoid using markdown formatting. Instead, focus on explaining key technical ideas in a structured, logical manner. Use precise language that non-technical and technical members alike can understand. Be sure to provide actionable next steps or solutions to address the technical issues discussed.
-
-                Example topics that might arise:
-                - Architecture design decisions (e.g., microservices vs monolithic architecture)
-                - Cloud infrastructure choices (e.g., AWS, Azure, GCP)
-                - Software scalability challenges
-                - DevOps pipelines and automation best practices
-                - Implementing security protocols
-                - Talking about the codebase and best practices
-
+        if self.stream_replies:
+            # The full answer streams into the message, which then settles on the summary that is normally posted
+            with self.stream_reply("C07MF3WH7UJ") as reply:
+                _, summary = self.stream_with_summary(self.generic_prompt(text), reply.update)
+                reply.finish(f"{summary}")
+            return
+        self.post_draft(self.draft_message(text))
+
+    async def agenerate_message(self, text) -> str:
+        """Async version of generate_message."""
+        if self.stream_replies:
+            return await asyncio.to_thread(self.generate_message, text)  # The streaming clients are sync
+        _, summary = await self.aprocess_with_summary(self.generic_prompt(text))
+        self.post_draft(summary)
+
+    def draft_message(self, text):
+        _, summary = self.process_with_summary(self.generic_prompt(text))
+        return summary
+
+    def post_draft(self, summary):
+        self.send_message_to_slack(f"{summary}", "C07MF3WH7UJ")
+
+    def generic_prompt(self, text):
+        """Builds the conversation prompt for the CTO agent: the static instructions, then the message."""
+        return self.prompt_template.render(f"""
                 The message you're responding to: {text}
-
-                Now, respond as the CTO with sound technical knowledge. Assign another employee a task directly. Make the task specific. Focus on solutions, but keep it conversational. Be extremely serious.
-                """
-        response = self.process_instruction_with_llm(prompt)
-        self.send_message_to_slack(f"{self.summarize(response)}", "C07MF3WH7UJ")
+                """)
 
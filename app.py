@@ -1,9 +1,12 @@
 import os
+import asyncio
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 from dotenv import load_dotenv
 from agent import CEO, CTOAgent, Marketer
 from dictator import Dictator
+from clients import get_registry
+from tracing import get_metrics
 import time
 
 # Load environment variables from .env file
@@ -21,7 +24,7 @@ repo_path = "../stealth-startup-dev"  # Path to the external repo
 PAT = os.getenv("GITHUB_PAT")
 ceo_slack_id = "U07M0K20NB1"
 cto_slack_id = "U07MUQUCU6M"
-client = WebClient(token=slack_token)
+client = get_registry().slack(slack_token)  # Same client instance the CEO uses
 #ceo_slack_id = os.getenv("CEO_SLACK_ID")  # The Slack ID for the CEO
 
 # Initialize agents
@@ -59,6 +62,13 @@ dictator = Dictator(name="Dictator", cohere_api_key=cohere_api_key, employees=em
 channel_id = "C07MF3WH7UJ"  # Replace with your actual Slack channel ID
 messages = []
 
-for event in dictator.events:
-    time.sleep(5)
-    dictator.process_event(event, channel_id)
+if os.getenv("DICTATOR_ASYNC") == "1":
+    # Run the events on one asyncio loop; DICTATOR_CONCURRENCY > 1 lets independent events overlap
+    asyncio.run(dictator.arun(channel_id, concurrency=int(os.getenv("DICTATOR_CONCURRENCY", "1"))))
+else:
+    for event in dictator.events:
+        time.sleep(5)
+        dictator.process_event(event, channel_id)
+dictator.close()
+
+print(f"Where the time went:\n{get_metrics().report()}")
@@ -0,0 +1,419 @@
+import re
+import json
+import time
+import zlib
+import random
+import asyncio
+import threading
+from collections import Counter
+from types import SimpleNamespace
+
+import httpx
+import groq
+from cohere.core.api_error import ApiError
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.slack_response import SlackResponse
+from replicate.exceptions import ReplicateError
+
+WORDS = ("we", "should", "focus", "on", "dispatch", "latency", "customers", "market", "pricing", "pilot", "counties",
+         "call", "volume", "integration", "logo", "brand", "trust", "roadmap", "ship", "next", "week", "data")
+
+
+class FakeConfig:
+    """How a fake backend behaves: per-call latency (seconds, plus uniform jitter), the share of calls that fail
+    with a server error, and an optional rate limit (calls per second with a burst) past which calls get a 429.
+    Streaming calls deliver their first chunk after the latency and the rest `chunk_interval` seconds apart."""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit=None, burst=None, seed=0, chunk_interval=0.0):
+        self.latency = latency
+        self.chunk_interval = chunk_interval
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.burst = burst or (max(1, int(rate_limit)) if rate_limit else None)
+        self.seed = seed
+
+
+class FakeBackend:
+    """Shared bookkeeping for one provider: call counts, injected latency, errors and rate limiting."""
+
+    def __init__(self, name, config, rate_limit_error, server_error):
+        self.name = name
+        self.config = config
+        self.rate_limit_error = rate_limit_error
+        self.server_error = server_error
+        self.calls = Counter()
+        self.failures = Counter()
+        self.random = random.Random(f"{name}:{config.seed}")
+        self.tokens = config.burst or 0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _admit(self, method):
+        """Counts the call and decides its fate. Returns the latency to simulate or raises the injected error."""
+        with self._lock:
+            self.calls[method] += 1
+            if self.config.rate_limit:
+                now = time.monotonic()
+                self.tokens = min(self.config.burst, self.tokens + (now - self.updated) * self.config.rate_limit)
+                self.updated = now
+                if self.tokens < 1:
+                    self.failures[f"{method}:429"] += 1
+                    raise self.rate_limit_error()
+                self.tokens -= 1
+            if self.config.error_rate and self.random.random() < self.config.error_rate:
+                self.failures[f"{method}:5xx"] += 1
+                raise self.server_error()
+            return self.config.latency + self.random.uniform(0, self.config.jitter)
+
+    def before(self, method):
+        delay = self._admit(method)
+        if delay:
+            time.sleep(delay)
+
+    async def abefore(self, method):
+        delay = self._admit(method)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def counts(self):
+        with self._lock:
+            return Counter({f"{self.name}.{method}": count for method, count in self.calls.items()})
+
+
+def fake_text(seed, words=40):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def fake_embedding(text, dims=64):
+    """Bag-of-words hashed into `dims` buckets, so related texts land near each other."""
+    vector = [0.0] * dims
+    for word in re.findall(r"\w+", text.lower()):
+        vector[zlib.crc32(word.encode("utf-8")) % dims] += 1.0
+    return vector
+
+
+def _billed(prompt, text):
+    """Cohere-style usage metadata, counting words as tokens."""
+    return SimpleNamespace(billed_units=SimpleNamespace(input_tokens=len(prompt.split()), output_tokens=len(text.split())))
+
+
+def _schema_properties(response_format):
+    if not response_format:
+        return {}
+    return (response_format.get("schema") or {}).get("properties", {})
+
+
+def _chunks(text, words=3):
+    parts = re.findall(r"\S+\s*", text)
+    return ["".join(parts[index:index + words]) for index in range(0, len(parts), words)]
+
+
+class FakeCohere:
+    """Stands in for cohere.Client: generate, chat (plain, routing schema and fused answer/summary), their
+    streaming versions and embed."""
+
+    def __init__(self, backend, reply_words=40):
+        self.backend = backend
+        self.reply_words = reply_words
+        self._turn = 0
+
+    def _chat_text(self, message, response_format):
+        properties = _schema_properties(response_format)
+        if "employees" in properties:
+            # Routing: rotate through the employees listed in the prompt
+            ids = re.findall(r"- ID: (\S+)", message)
+            self._turn += 1
+            ordered = ids[self._turn % len(ids):] + ids[:self._turn % len(ids)] if ids else []
+            return json.dumps({
+                "employees": [{"id": employee_id, "response_type": "message"} for employee_id in ordered[:3]],
+                "progress": 0,
+                "value": fake_text(message, 6),
+            })
+        if "full" in properties:
+            return json.dumps({"full": fake_text(message, self.reply_words), "summary": fake_text(message[::-1], 20)})
+        return fake_text(message, self.reply_words)
+
+    def generate(self, model=None, prompt="", max_tokens=None, temperature=None, **kwargs):
+        self.backend.before("generate")
+        text = fake_text(prompt, self.reply_words)
+        return SimpleNamespace(generations=[SimpleNamespace(text=text)], meta=_billed(prompt, text))
+
+    def chat(self, message="", model=None, temperature=None, max_tokens=None, response_format=None, **kwargs):
+        self.backend.before("chat")
+        text = self._chat_text(message, response_format)
+        return SimpleNamespace(text=text, meta=_billed(message, text))
+
+    def embed(self, texts=(), model=None, input_type=None, **kwargs):
+        self.backend.before("embed")
+        return SimpleNamespace(embeddings=[fake_embedding(text) for text in texts], meta=_billed(" ".join(texts), ""))
+
+    def _stream(self, method, prompt, text):
+        self.backend.before(method)
+        for index, chunk in enumerate(_chunks(text)):
+            if index and self.backend.config.chunk_interval:
+                time.sleep(self.backend.config.chunk_interval)
+            yield SimpleNamespace(event_type="text-generation", text=chunk)
+        yield SimpleNamespace(event_type="stream-end", finish_reason="COMPLETE", response=SimpleNamespace(text=text, meta=_billed(prompt, text)))
+
+    def generate_stream(self, model=None, prompt="", max_tokens=None, temperature=None, **kwargs):
+        return self._stream("generate_stream", prompt, fake_text(prompt, self.reply_words))
+
+    def chat_stream(self, message="", model=None, temperature=None, max_tokens=None, response_format=None, **kwargs):
+        return self._stream("chat_stream", message, self._chat_text(message, response_format))
+
+
+class FakeAsyncCohere(FakeCohere):
+    """Stands in for cohere.AsyncClient."""
+
+    async def generate(self, model=None, prompt="", max_tokens=None, temperature=None, **kwargs):
+        await self.backend.abefore("generate")
+        text = fake_text(prompt, self.reply_words)
+        return SimpleNamespace(generations=[SimpleNamespace(text=text)], meta=_billed(prompt, text))
+
+    async def chat(self, message="", model=None, temperature=None, max_tokens=None, response_format=None, **kwargs):
+        await self.backend.abefore("chat")
+        text = self._chat_text(message, response_format)
+        return SimpleNamespace(text=text, meta=_billed(message, text))
+
+    async def embed(self, texts=(), model=None, input_type=None, **kwargs):
+        await self.backend.abefore("embed")
+        return SimpleNamespace(embeddings=[fake_embedding(text) for text in texts], meta=_billed(" ".join(texts), ""))
+
+
+class FakeGroq:
+    """Stands in for groq.Groq. Code requests get a valid change set that adds one new component per call."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self._changes = 0
+
+    def _create(self, messages=(), model=None, max_tokens=None, temperature=None, **kwargs):
+        self.backend.before("chat.completions.create")
+        prompt = messages[-1]["content"] if messages else ""
+        if "Example changes" in prompt:
+            self._changes += 1
+            path = f"components/Generated{self._changes}.js"
+            body = f"export default function Generated{self._changes}() {{\n  return <div>{fake_text(self._changes, 8)}</div>\n}}\n"
+            if '"original" and "updated"' in prompt:
+                content = json.dumps({path: {"original": "", "updated": body}})
+            else:
+                content = json.dumps({path: {"edits": [{"search": "", "replace": body}]}})
+        else:
+            content = fake_text(prompt, 20)
+        usage = SimpleNamespace(prompt_tokens=len(prompt.split()), completion_tokens=len(content.split()))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+
+class FakeSlackWorkspace:
+    """Channels shared by every fake Slack client. Each bot token posts as its own user id."""
+
+    def __init__(self, users=None):
+        self.users = dict(users or {})  # token -> user id
+        self.channels = {}  # channel -> messages, oldest first
+        self._ts = 1700000000.0
+        self._lock = threading.Lock()
+
+    def user_for(self, token):
+        return self.users.setdefault(token, f"U{zlib.crc32(str(token).encode()):08X}")
+
+    def post(self, channel, user, text, **extra):
+        with self._lock:
+            self._ts += 0.0001
+            message = dict(extra, type="message", user=user, text=text or "", ts=f"{self._ts:.6f}")
+            self.channels.setdefault(channel, []).append(message)
+            return message
+
+    def update(self, channel, ts, text):
+        with self._lock:
+            for message in self.channels.get(channel, []):
+                if message["ts"] == ts:
+                    message["text"] = text
+                    return message
+        return None
+
+    def history(self, channel, limit=100, oldest=None, cursor=None):
+        with self._lock:
+            messages = [m for m in self.channels.get(channel, []) if oldest is None or float(m["ts"]) > float(oldest)]
+        messages = messages[::-1]  # Newest first, like conversations.history
+        offset = int(cursor or 0)
+        page = messages[offset:offset + limit]
+        has_more = offset + limit < len(messages)
+        return {
+            "ok": True,
+            "messages": [dict(message) for message in page],
+            "has_more": has_more,
+            "response_metadata": {"next_cursor": str(offset + limit) if has_more else ""},
+        }
+
+
+def _slack_error(status, error, headers=None):
+    response = SlackResponse(client=None, http_verb="POST", api_url="https://slack.com/api/fake", req_args={},
+                             data={"ok": False, "error": error}, headers=headers or {}, status_code=status)
+    return SlackApiError(f"The server responded with: {error}", response)
+
+
+def _uploaded_files(content, filename, title, file_uploads):
+    """The files of a files_upload_v2 call, given either as one content/filename/title or as a file_uploads list."""
+    uploads = file_uploads or [{"content": content, "filename": filename, "title": title}]
+    return [{"name": upload.get("filename"), "title": upload.get("title"), "size": len(upload.get("content") or b"")} for upload in uploads]
+
+
+class FakeSlack:
+    """Stands in for slack_sdk's WebClient."""
+
+    def __init__(self, backend, workspace, token):
+        self.backend = backend
+        self.workspace = workspace
+        self.token = token
+        self.user = workspace.user_for(token)
+
+    def chat_postMessage(self, channel, text=None, **kwargs):
+        self.backend.before("chat_postMessage")
+        message = self.workspace.post(channel, self.user, text)
+        return {"ok": True, "channel": channel, "ts": message["ts"], "message": message}
+
+    def chat_update(self, channel, ts, text=None, **kwargs):
+        self.backend.before("chat_update")
+        self.workspace.update(channel, ts, text)
+        return {"ok": True, "channel": channel, "ts": ts}
+
+    def files_upload_v2(self, channel=None, content=None, filename=None, title=None, initial_comment=None, file_uploads=None, **kwargs):
+        self.backend.before("files_upload_v2")
+        message = self.workspace.post(channel, self.user, initial_comment or "", files=_uploaded_files(content, filename, title, file_uploads))
+        return {"ok": True, "files": message["files"]}
+
+    def conversations_history(self, channel, limit=100, oldest=None, cursor=None, **kwargs):
+        self.backend.before("conversations_history")
+        return self.workspace.history(channel, limit, oldest, cursor)
+
+
+class FakeAsyncSlack(FakeSlack):
+    """Stands in for slack_sdk's AsyncWebClient."""
+
+    async def chat_postMessage(self, channel, text=None, **kwargs):
+        await self.backend.abefore("chat_postMessage")
+        message = self.workspace.post(channel, self.user, text)
+        return {"ok": True, "channel": channel, "ts": message["ts"], "message": message}
+
+    async def chat_update(self, channel, ts, text=None, **kwargs):
+        await self.backend.abefore("chat_update")
+        self.workspace.update(channel, ts, text)
+        return {"ok": True, "channel": channel, "ts": ts}
+
+    async def files_upload_v2(self, channel=None, content=None, filename=None, title=None, initial_comment=None, file_uploads=None, **kwargs):
+        await self.backend.abefore("files_upload_v2")
+        message = self.workspace.post(channel, self.user, initial_comment or "", files=_uploaded_files(content, filename, title, file_uploads))
+        return {"ok": True, "files": message["files"]}
+
+    async def conversations_history(self, channel, limit=100, oldest=None, cursor=None, **kwargs):
+        await self.backend.abefore("conversations_history")
+        return self.workspace.history(channel, limit, oldest, cursor)
+
+
+class FakePrediction:
+    """Stands in for replicate's Prediction: it succeeds once `render_time` has passed, checked on each reload."""
+
+    def __init__(self, replicate, id, render_time):
+        self.replicate = replicate
+        self.id = id
+        self.status = "starting"
+        self.output = None
+        self.error = None
+        self._ready_at = time.monotonic() + render_time
+
+    async def async_reload(self):
+        await self.replicate.backend.abefore("predictions.get")
+        if self.status == "starting" and time.monotonic() >= self._ready_at:
+            self.status = "succeeded"
+            self.output = [f"https://replicate.delivery/fake/{self.id}.webp"]
+
+    async def async_cancel(self):
+        await self.replicate.backend.abefore("predictions.cancel")
+        self.status = "canceled"
+
+
+class FakeReplicate:
+    """Stands in for replicate.Client. Predictions take a few backend latencies to render."""
+
+    RENDER_LATENCIES = 3
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._images = 0
+        self.models = SimpleNamespace(predictions=SimpleNamespace(async_create=self._async_create))
+
+    def run(self, model, input=None, **kwargs):
+        self.backend.before("run")
+        self._images += 1
+        return [f"https://replicate.delivery/fake/{self._images}.png"]
+
+    async def _async_create(self, model, input=None, **params):
+        await self.backend.abefore("predictions.create")
+        self._images += 1
+        return FakePrediction(self, self._images, self.backend.config.latency * self.RENDER_LATENCIES)
+
+
+def fake_image(url, size=64 * 1024):
+    """Deterministic bytes standing in for the image at `url`."""
+    return random.Random(url).randbytes(size)
+
+
+def _groq_error(status):
+    request = httpx.Request("POST", "https://api.groq.com/openai/v1/chat/completions")
+    response = httpx.Response(status, request=request, headers={"retry-after": "1"})
+    error = groq.RateLimitError if status == 429 else groq.InternalServerError
+    return error(f"Error code: {status}", response=response, body=None)
+
+
+class FakeStack:
+    """One fake of every backend, wired into a ClientRegistry with install()."""
+
+    def __init__(self, config=None, configs=None, users=None, reply_words=40):
+        configs = configs or {}
+        config = config or FakeConfig()
+        self.cohere = FakeBackend("cohere", configs.get("cohere", config),
+                                  lambda: ApiError(status_code=429, body={"message": "rate limited"}),
+                                  lambda: ApiError(status_code=503, body={"message": "unavailable"}))
+        self.groq = FakeBackend("groq", configs.get("groq", config), lambda: _groq_error(429), lambda: _groq_error(503))
+        self.slack = FakeBackend("slack", configs.get("slack", config),
+                                 lambda: _slack_error(429, "ratelimited", {"Retry-After": "1"}),
+                                 lambda: _slack_error(500, "internal_error"))
+        self.replicate = FakeBackend("replicate", configs.get("replicate", config),
+                                     lambda: ReplicateError(status=429, detail="rate limited"),
+                                     lambda: ReplicateError(status=503, detail="unavailable"))
+        self.workspace = FakeSlackWorkspace(users)
+        self.reply_words = reply_words
+
+    def backends(self):
+        return [self.cohere, self.groq, self.slack, self.replicate]
+
+    def install(self, registry):
+        """Makes `registry` hand out fakes for every provider."""
+        registry.override("cohere", lambda key: FakeCohere(self.cohere, self.reply_words))
+        registry.override("async_cohere", lambda key: FakeAsyncCohere(self.cohere, self.reply_words))
+        registry.override("groq", lambda key: FakeGroq(self.groq))
+        registry.override("slack", lambda token: FakeSlack(self.slack, self.workspace, token))
+        registry.override("async_slack", lambda token: FakeAsyncSlack(self.slack, self.workspace, token))
+        registry.override("replicate", lambda token: FakeReplicate(self.replicate))
+        # Image downloads from replicate.delivery are served in-process
+        registry.override("async_http", lambda provider: httpx.AsyncClient(transport=httpx.MockTransport(self.serve_file)))
+        return self
+
+    async def serve_file(self, request):
+        await self.replicate.abefore("download")
+        return httpx.Response(200, content=fake_image(str(request.url)), headers={"content-type": "image/webp"})
+
+    def counts(self):
+        total = Counter()
+        for backend in self.backends():
+            total.update(backend.counts())
+        return total
+
+    def failures(self):
+        total = Counter()
+        for backend in self.backends():
+            total.update({f"{backend.name}.{key}": count for key, count in backend.failures.items()})
+        return total
@@ -0,0 +1,88 @@
+import os
+import json
+
+import git
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(content)
+
+
+def component_source(index, lines):
+    body = "\n".join(f"      <li key=\"item-{index}-{line}\">Item {line} of component {index}</li>" for line in range(lines))
+    return f"""import styles from './Component{index}.module.css';
+
+export default function Component{index}({{ title }}) {{
+  return (
+    <section className={{styles.section}}>
+      <h2>{{title ?? 'Component {index}'}}</h2>
+      <ul>
+{body}
+      </ul>
+    </section>
+  );
+}}
+"""
+
+
+def generate_nextjs_repo(path, pages=8, components=30, component_lines=20, noise_files=20):
+    """Writes a small Next.js app router project under `path`, commits it and creates a bare remote next to it.
+
+    Besides the app/ and components/ trees the agent maps, it adds node_modules/ and .next/ noise that the
+    scanner must skip. Returns (repo path, bare remote path).
+    """
+    write(os.path.join(path, "package.json"), json.dumps({
+        "name": "echo-site",
+        "private": True,
+        "scripts": {"dev": "next dev", "build": "next build", "test": "echo \"no tests\""},
+        "dependencies": {"next": "14.2.13", "react": "18.3.1", "react-dom": "18.3.1"},
+    }, indent=2))
+    write(os.path.join(path, ".gitignore"), "node_modules/\n.next/\n")
+    write(os.path.join(path, "next.config.js"), "module.exports = { reactStrictMode: true };\n")
+    write(os.path.join(path, "app", "layout.js"), """export const metadata = { title: 'Echo', description: 'AI-assisted 911 dispatch' };
+
+export default function RootLayout({ children }) {
+  return (
+    <html lang="en">
+      <body>{children}</body>
+    </html>
+  );
+}
+""")
+    imports = "\n".join(f"import Component{index} from '../components/Component{index}';" for index in range(min(components, 5)))
+    usages = "\n".join(f"      <Component{index} />" for index in range(min(components, 5)))
+    write(os.path.join(path, "app", "page.js"), f"""{imports}
+
+export default function Home() {{
+  return (
+    <main className="flex min-h-screen flex-col items-center justify-between p-24">
+      <h1 className="text-4xl font-bold">Welcome to Echo</h1>
+{usages}
+    </main>
+  );
+}}
+""")
+    for page in range(pages):
+        write(os.path.join(path, "app", f"page{page}", "page.js"), f"""export default function Page{page}() {{
+  return <main><h1>Page {page}</h1><p>Details about feature {page} of the Echo dispatch platform.</p></main>;
+}}
+""")
+    for index in range(components):
+        write(os.path.join(path, "components", f"Component{index}.js"), component_source(index, component_lines))
+        write(os.path.join(path, "components", f"Component{index}.module.css"), ".section {\n  padding: 1rem;\n}\n")
+    for index in range(noise_files):
+        write(os.path.join(path, "node_modules", f"pkg{index}", "index.js"), "module.exports = {};\n" * 50)
+        write(os.path.join(path, ".next", "cache", f"chunk{index}.js"), "/* build output */\n" * 50)
+
+    repo = git.Repo.init(path)
+    with repo.config_writer() as config:
+        config.set_value("user", "name", "Bench")
+        config.set_value("user", "email", "bench@example.com")
+    repo.git.add(A=True)
+    repo.index.commit("Initial Next.js app")
+
+    remote = f"{path.rstrip(os.sep)}-remote.git"
+    git.Repo.init(remote, bare=True)
+    return path, remote
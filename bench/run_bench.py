@@ -0,0 +1,194 @@
+"""Offline end-to-end benchmarks for the agent orchestration.
+
+Drives Dictator.process_event, CEO.run_stage and CTOAgent.code against in-process fakes of Cohere, Groq, Slack
+and Replicate (bench/fakes.py) and a generated Next.js repo, then reports throughput, p50/p99 latency and backend
+calls per iteration for each scenario. Nothing touches the network, so runs are comparable across commits:
+
+    python bench/run_bench.py --iterations 20 --latency-ms 30 --jitter-ms 10
+    python bench/run_bench.py --scenarios cto_code --error-rate 0.05 --json bench_output.json
+"""
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+from collections import Counter
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+CHANNEL = "C07MF3WH7UJ"  # The channel the agents post to
+USERS = {"xoxb-ceo": "U_CEO", "xoxb-cto": "U_CTO", "xoxb-marketer": "U_MARKETER"}
+SCENARIOS = ["dictator_discussion", "dictator_logo", "ceo_run_stage", "cto_code"]
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of `values`."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(1, min(len(ordered), int(round(fraction * len(ordered) + 0.5))))
+    return ordered[rank - 1]
+
+
+def isolate(workdir, cache):
+    """Points every on-disk cache, log and checkpoint at `workdir`. Must run before the repo modules are imported."""
+    os.environ["HOME"] = workdir  # The shared cache dir lives under ~/.cache
+    os.environ["LLM_CACHE_PATH"] = os.path.join(workdir, "llm_cache.sqlite3")
+    os.environ["AGENT_MEMORY_PATH"] = os.path.join(workdir, "agent_memory.sqlite3")
+    os.environ["ROUTING_LOG"] = os.path.join(workdir, "routing.jsonl")
+    os.environ["TRACE_PATH"] = os.path.join(workdir, "traces.jsonl")
+    os.environ["LLM_CACHE_BYPASS"] = "0" if cache else "1"  # Measure the orchestration, not cache hits
+    os.environ["COHERE_TOKENIZER"] = ""  # No Hugging Face downloads; fall back to estimated token counts
+    os.environ["GROQ_TOKENIZER"] = ""
+    os.environ.setdefault("GROQ_API_KEY", "fake")
+
+
+class Bench:
+    def __init__(self, args, workdir):
+        from clients import get_registry
+        from slack_outbox import SlackOutbox, METHOD_LIMITS
+        from agent import CEO, CTOAgent, Marketer
+        from dictator import Dictator, Event
+        from fakes import FakeStack, FakeConfig
+        from nextjs_fixture import generate_nextjs_repo
+
+        config = FakeConfig(args.latency_ms / 1000, args.jitter_ms / 1000, args.error_rate, args.rate_limit or None, seed=args.seed,
+                            chunk_interval=args.chunk_interval_ms / 1000)
+        self.registry = get_registry()
+        self.stack = FakeStack(config, users=USERS, reply_words=args.reply_words).install(self.registry)
+        if args.slack_pacing == "off":
+            unpaced = {method: (1000.0, 1000) for method in METHOD_LIMITS}
+            self.registry.override("outbox", lambda token: SlackOutbox(self.registry.slack(token), limits=unpaced))
+
+        repo_path, remote = generate_nextjs_repo(os.path.join(workdir, "echo-site"), components=args.components)
+        self.ceo = CEO("Ian Korovinsky", "U_CEO", "fake", "xoxb-ceo", checkpoint_dir=os.path.join(workdir, "checkpoints"))
+        self.cto = CTOAgent("Elijah Kurien", "U_CTO", "fake", "xoxb-cto", repo_path, "fake-token", repo_url=remote)
+        self.marketer = Marketer("Lily Zhang", "U_MARKETER", "Marketing Specialist", "fake", "xoxb-marketer", "fake")
+        self.marketer.logo_variants = args.logo_variants
+        self.marketer.image_pipeline.poll_interval = args.latency_ms / 1000  # Poll on the fakes' timescale
+        employees = {agent.id: agent for agent in (self.ceo, self.cto, self.marketer)}
+        roles = {"CEO": self.ceo, "CTO": self.cto, "Marketer": self.marketer}
+        self.dictator = Dictator("Dictator", "fake", employees, CHANNEL, self.registry.slack("xoxb-ceo"), roles,
+                                 poll_interval=0, max_rounds=args.rounds)
+        self.dictator.speculative = args.speculative
+        self.discussion = Event("Discuss thoughts about the logo design", ("CTO", "CEO", "Marketer"))
+        self.logo = Event("Design a new logo", ("Marketer",), tool_used=True, metadata={"task": "Design a new company logo"})
+
+    def dictator_discussion(self, iteration):
+        self.stack.workspace.post(CHANNEL, "U_HUMAN", f"Round {iteration}: what does everyone think of the new logo?")
+        self.dictator.process_event(self.discussion, CHANNEL)
+
+    def dictator_logo(self, iteration):
+        self.dictator.process_event(self.logo, CHANNEL)
+
+    def ceo_run_stage(self, iteration):
+        self.ceo.run_stage(f"the AI-driven healthcare market, take {iteration}", resume=False)
+
+    def cto_code(self, iteration):
+        self.cto.code(f"Add a new section component number {iteration} to the homepage")
+
+    def flush(self):
+        self.dictator.flush_outboxes()
+
+    def run(self, name, iterations, warmup, verbose):
+        step = getattr(self, name)
+        latencies, errors = [], []
+        calls = Counter()
+        for iteration in range(warmup + iterations):
+            before = self.stack.counts()
+            output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+            start = time.perf_counter()
+            try:
+                with output:
+                    step(iteration)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+            elapsed = time.perf_counter() - start
+            with (contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())):
+                self.flush()  # Outbox sends happen in the background; let them land before the next iteration
+            if iteration >= warmup:
+                latencies.append(elapsed)
+                calls.update(self.stack.counts() - before)
+
+        total = sum(latencies)
+        return {
+            "scenario": name,
+            "iterations": iterations,
+            "errors": len(errors),
+            "first_error": errors[0] if errors else None,
+            "throughput_per_s": iterations / total if total else 0.0,
+            "mean_ms": total / iterations * 1000 if iterations else 0.0,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "max_ms": max(latencies) * 1000 if latencies else 0.0,
+            "calls_per_iteration": {method: count / iterations for method, count in sorted(calls.items())},
+        }
+
+
+def print_report(results, failures):
+    print(f"{'scenario':<22}{'iters':>6}{'errors':>7}{'it/s':>9}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for result in results:
+        print(f"{result['scenario']:<22}{result['iterations']:>6}{result['errors']:>7}{result['throughput_per_s']:>9.2f}"
+              f"{result['mean_ms']:>10.1f}{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}{result['max_ms']:>10.1f}")
+    for result in results:
+        calls = ", ".join(f"{method}={count:g}" for method, count in result["calls_per_iteration"].items())
+        print(f"\n{result['scenario']} calls per iteration: {calls or 'none'}")
+        if result["first_error"]:
+            print(f"  first error: {result['first_error']}")
+    if failures:
+        print("\nInjected failures: " + ", ".join(f"{key}={count}" for key, count in sorted(failures.items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline latency benchmarks for the agent orchestration.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma separated, from: {', '.join(SCENARIOS)}")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Fake backend latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=5.0, help="Uniform extra latency per call")
+    parser.add_argument("--chunk-interval-ms", type=float, default=2.0, help="Gap between chunks of a streamed reply")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of backend calls that fail with a 5xx")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Backend calls per second before 429s (0 = unlimited)")
+    parser.add_argument("--rounds", type=int, default=3, help="Discussion rounds per dictator_discussion iteration")
+    parser.add_argument("--components", type=int, default=30, help="Components in the generated Next.js repo")
+    parser.add_argument("--reply-words", type=int, default=40, help="Length of fake LLM replies")
+    parser.add_argument("--slack-pacing", choices=["real", "off"], default="off", help="Use Slack's real rate limits in the outbox")
+    parser.add_argument("--logo-variants", type=int, default=1, help="Logo drafts generated per dictator_logo iteration")
+    parser.add_argument("--speculative", action="store_true", help="Draft replies for every routed employee at once")
+    parser.add_argument("--cache", action="store_true", help="Leave the LLM cache on (it is bypassed by default)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the agents' own output")
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    workdir = tempfile.mkdtemp(prefix="agent-bench-")
+    isolate(workdir, args.cache)
+    with (contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())):
+        bench = Bench(args, workdir)
+    results = [bench.run(name, args.iterations, args.warmup, args.verbose) for name in scenarios]
+    bench.dictator.close()
+
+    print(f"Fake backends: {args.latency_ms:g}ms +{args.jitter_ms:g}ms jitter, error rate {args.error_rate:g}, "
+          f"rate limit {args.rate_limit or 'none'}; work dir {workdir}\n")
+    print_report(results, bench.stack.failures())
+
+    from tracing import get_metrics
+    print(f"\nSpans across all scenarios (traces in {os.environ['TRACE_PATH']}):\n{get_metrics().report()}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump({"args": vars(args), "results": results, "failures": dict(bench.stack.failures()),
+                       "metrics": get_metrics().snapshot()}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
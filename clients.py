@@ -0,0 +1,116 @@
+import os
+import threading
+
+import cohere
+import httpx
+import replicate
+from groq import Groq
+from slack_sdk import WebClient
+from slack_sdk.web.async_client import AsyncWebClient
+
+from slack_outbox import SlackOutbox
+from tracing import HTTP_HOOKS, ASYNC_HTTP_HOOKS
+
+
+class ClientRegistry:
+    """Process-wide API clients, so every agent reuses the same warm keep-alive connections.
+
+    Cohere and Groq clients share one httpx connection pool per provider (sync and async), and clients are
+    cached per API key/token, so all agents with the same credentials get the same instance. Slack's
+    clients are cached per token. Pool size and timeouts come from the constructor or CLIENT_* env vars.
+    The async pools belong to whichever event loop uses them first, so keep async work on one loop.
+    override() swaps any kind of client for another factory, which is how the benchmarks run offline.
+    """
+
+    def __init__(self, max_connections=None, max_keepalive_connections=None, keepalive_expiry=None, timeout=None):
+        self.limits = httpx.Limits(
+            max_connections=max_connections or int(os.getenv("CLIENT_POOL_SIZE", "20")),
+            max_keepalive_connections=max_keepalive_connections or int(os.getenv("CLIENT_POOL_KEEPALIVE", "10")),
+            keepalive_expiry=keepalive_expiry or float(os.getenv("CLIENT_KEEPALIVE_EXPIRY", "60")),
+        )
+        self.timeout = timeout or float(os.getenv("CLIENT_TIMEOUT", "120"))
+        self._clients = {}
+        self.overrides = {}  # kind -> factory(key)
+        self._lock = threading.RLock()  # Re-entrant: client factories fetch the shared pool through _get too
+
+    def _get(self, key, factory):
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = factory()
+            return self._clients[key]
+
+    def _build(self, kind, key, factory):
+        override = self.overrides.get(kind)
+        return self._get((kind, key), (lambda: override(key)) if override else factory)
+
+    def override(self, kind, factory):
+        """Builds clients of `kind` ("http", "async_http", "cohere", "async_cohere", "groq", "slack", "async_slack",
+        "replicate" or "outbox") with factory(key) from now on. Clients of that kind built earlier are forgotten."""
+        with self._lock:
+            self.overrides[kind] = factory
+            self._clients = {key: client for key, client in self._clients.items() if key[0] != kind}
+
+    def http_client(self, provider):
+        """Shared sync httpx pool for a provider. Its requests are counted on the current trace span."""
+        return self._build("http", provider, lambda: httpx.Client(limits=self.limits, timeout=self.timeout, event_hooks=HTTP_HOOKS))
+
+    def async_http_client(self, provider):
+        """Shared async httpx pool for a provider."""
+        return self._build("async_http", provider, lambda: httpx.AsyncClient(limits=self.limits, timeout=self.timeout, event_hooks=ASYNC_HTTP_HOOKS))
+
+    def cohere(self, api_key):
+        return self._build("cohere", api_key, lambda: cohere.Client(
+            api_key,
+            timeout=self.timeout,
+            httpx_client=self.http_client("cohere"),
+            log_warning_experimental_features=False,
+        ))
+
+    def async_cohere(self, api_key):
+        return self._build("async_cohere", api_key, lambda: cohere.AsyncClient(
+            api_key,
+            timeout=self.timeout,
+            httpx_client=self.async_http_client("cohere"),
+            log_warning_experimental_features=False,
+        ))
+
+    def groq(self, api_key):
+        return self._build("groq", api_key, lambda: Groq(
+            api_key=api_key,
+            timeout=self.timeout,
+            http_client=self.http_client("groq"),
+        ))
+
+    def slack(self, token):
+        return self._build("slack", token, lambda: WebClient(token=token, timeout=int(self.timeout)))
+
+    def async_slack(self, token):
+        return self._build("async_slack", token, lambda: AsyncWebClient(token=token, timeout=int(self.timeout)))
+
+    def replicate(self, api_token):
+        return self._build("replicate", api_token, lambda: replicate.Client(api_token=api_token, timeout=httpx.Timeout(self.timeout)))
+
+    def outbox(self, token):
+        """Background, rate-limit aware sender for the Slack client of `token`."""
+        return self._build("outbox", token, lambda: SlackOutbox(self.slack(token)))
+
+    def close(self):
+        """Flushes the Slack outboxes and closes the shared sync pools (async pools are closed by their loop's shutdown)."""
+        with self._lock:
+            for key, client in self._clients.items():
+                if key[0] == "outbox":
+                    client.flush(client.flush_timeout)
+            for key, client in self._clients.items():
+                if key[0] == "http":
+                    client.close()
+            self._clients = {}
+
+
+_registry = None
+
+
+def get_registry():
+    global _registry
+    if _registry is None:
+        _registry = ClientRegistry()
+    return _registry
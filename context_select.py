@@ -0,0 +1,99 @@
+import re
+import math
+from collections import Counter
+
+TOKEN_RE = re.compile(r"[A-Za-z][a-z]+|[A-Z]+(?![a-z])|\d+")
+
+
+def tokenize(text):
+    """Lowercased word tokens, splitting camelCase, snake_case and paths."""
+    return [token.lower() for token in TOKEN_RE.findall(text)]
+
+
+def flatten_project_map(project_map, prefix=""):
+    """Turns the nested map from SWEAgent.map_directory into {relative path: record}."""
+    files = {}
+    for name, node in project_map.items():
+        path = f"{prefix}/{name}" if prefix else name
+        if isinstance(node, dict) and ('content' in node or 'error' in node or 'skipped' in node) and 'extension' in node:
+            files[path] = node
+        elif isinstance(node, dict):
+            files.update(flatten_project_map(node, path))
+    return files
+
+
+class BM25Index:
+    """Okapi BM25 over a list of (key, text) documents."""
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.keys = [key for key, _ in documents]
+        self.term_freqs = [Counter(tokenize(text)) for _, text in documents]
+        self.lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0
+        doc_freq = Counter()
+        for tf in self.term_freqs:
+            doc_freq.update(tf.keys())
+        n = len(documents)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+
+    def scores(self, query):
+        """Returns {key: score} for documents sharing at least one term with the query."""
+        terms = set(tokenize(query))
+        results = {}
+        for key, tf, length in zip(self.keys, self.term_freqs, self.lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / self.avg_length) if self.avg_length else self.k1
+            for term in terms:
+                freq = tf.get(term)
+                if freq:
+                    score += self.idf[term] * freq * (self.k1 + 1) / (freq + norm)
+            if score > 0:
+                results[key] = max(score, results.get(key, 0.0))
+        return results
+
+
+def chunk_file(path, content, lines_per_chunk=40):
+    """Splits a file into line chunks; the path is prepended so file names count as matches."""
+    lines = content.splitlines()
+    if not lines:
+        return [(path, path)]
+    return [
+        (path, path + "\n" + "\n".join(lines[start:start + lines_per_chunk]))
+        for start in range(0, len(lines), lines_per_chunk)
+    ]
+
+
+def rank_files(files, query):
+    """Ranks file paths by their best chunk's BM25 score against the query; unmatched files keep map order."""
+    documents = []
+    for path, record in files.items():
+        documents.extend(chunk_file(path, record.get('content', '')))
+    scores = BM25Index(documents).scores(query) if documents else {}
+    order = {path: i for i, path in enumerate(files)}
+    return sorted(files, key=lambda path: (-scores.get(path, 0.0), order[path]))
+
+
+def select_context(project_map, query, budget, measure=len):
+    """Picks the files most relevant to `query` whose full contents fit in `budget`.
+
+    `measure(text)` sizes a file's contents (characters by default). Returns (selected, omitted) where
+    selected is {path: content} in relevance order and omitted lists the remaining paths.
+    """
+    files = flatten_project_map(project_map)
+    selected = {}
+    omitted = []
+    used = 0
+    for path in rank_files(files, query):
+        content = files[path].get('content')
+        if content is None:
+            omitted.append(path)
+            continue
+        cost = measure(path) + measure(content)
+        if used + cost <= budget:
+            selected[path] = content
+            used += cost
+        else:
+            omitted.append(path)
+    return selected, omitted
@@ -1,12 +1,24 @@
 import os
+import asyncio
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import cohere
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 from dotenv import load_dotenv
 from agent import CEO
+from slack_history import ChannelHistory
+from llm_cache import get_cache
+from clients import get_registry
+from prompt_budget import PromptBudget, Section
+from prompt_template import PromptTemplate, stability_report
+from router import LocalRouter
+from semantic_index import SemanticIndex, cohere_embedder
+from tracing import span, annotate, record_usage
 import json
+import hashlib
 import math
-import random
 import time
 
 """ 
@@ -20,6 +32,48 @@ client = WebClient(token=slack_token)
 cohere_api_key = os.getenv("COHERE_API_KEY")
 ceo_agent = Agent(name="Alice", role="CEO", cohere_api_key=cohere_api_key) """
 
+# JSON schema the manager LLM must answer with when routing a discussion round
+ROUTING_SCHEMA = {
+  "type": "json_object",
+  "schema": {
+    "type": "object",
+    "properties": {
+      "progress": {
+        "type": "integer"
+      },
+      "value": {
+        "type": "string"
+      },
+      "employees": {
+        "type": "array",
+        "items": {
+          "type": "object",
+          "properties": {
+            "id": {
+              "type": "string"
+            },
+            "response_type": {
+              "type": "string"
+            }
+          },
+          "required": ["id", "response_type"]
+        }
+      }
+    },
+    "required": ["employees", "progress", "value"]
+  }
+}
+
+# Static instructions lead every prompt so repeated rounds share the longest possible prefix; the
+# per-employee/per-event context follows, and the conversation itself always comes last
+ROUTING_PREFIX = """You are the manager of a startup. Based on the input provided, determine the top 3 employees that should respond. The employee can have either a tool response or a message response, determine which response that this should be.
+
+Determine the IDs of the top 3 employees in order that they should respond and the response they should provide (tool or message). Ensure they are in the right JSON format. Regarding the event below, give a specific topic that was not used before for continuation of the conversation to discuss and store it in "value". Give a "progress" of 1 to end the conversation. Otherwise, give a 0 to continue this conversation."""
+
+EMPLOYEE_PREFIX = """Echo is a 911 dispatching service that uses AI to help manage emergency calls. Your current goal is to do Market Research and evaluate (1) Customers (2) Industry and (3) Market insights and the conversation should NOT stray away from this topic. If it does, take initiative to come back to it until it is complete.
+
+Make your message short and informal. Only write the response text without quotations and do not give any prefix. Remember that you are the employee of Echo, an AI-driven service to help manage dispatching. Do not repeat from the past message. Only provide a response for the person, do not include any preamble describing the response. Do not add comments, it is very important that you only provide the final output without any additional comments or remarks. Do not meeting or dicussing. Speak casually, you are close with everyone as you are already all on the team. Do not use the word Great in your response."""
+
 class Event:
     def __init__(self, name, roles, tool_used=False, metadata=None):
         self.name = name  # The event's name, e.g., "Conduct market research"
@@ -31,15 +85,28 @@ class Event:
         return f"Event(name={self.name}, roles={self.roles}, tool_used={self.tool_used}, metadata={self.metadata})"
 
 
+class Draft:
+    """A reply being generated ahead of its round: a concurrent Future (sync path) or an asyncio Task (async path)."""
+
+    def __init__(self, employee_id, after_ts, future):
+        self.employee_id = employee_id
+        self.after_ts = after_ts  # ts of the newest message the draft was written against
+        self.future = future
+
+
 class Dictator:
-    def __init__(self, name, cohere_api_key, employees, channel_id, slack_client, roles_to_agents):
+    def __init__(self, name, cohere_api_key, employees, channel_id, slack_client, roles_to_agents, async_slack_client=None, poll_interval=5, max_rounds=8, router=None):
         self.current_event_index = 0
         self.cohere_api_key = cohere_api_key
         self.channel_id = channel_id
         self.employees = employees
         #self.channel_id = channel_id  # Replace with your actual Slack channel ID
         self.slack = slack_client
+        self.async_slack = async_slack_client or get_registry().async_slack(slack_client.token)
         self.roles_to_agents = roles_to_agents
+        self.poll_interval = poll_interval  # Seconds to wait between discussion rounds
+        self.max_rounds = max_rounds  # Discussion rounds per multi-agent event
+        self.histories = {}  # channel_id -> ChannelHistory
 
          # Define events with metadata, assign roles and tool usage flags
         self.events = [
@@ -52,11 +119,55 @@ class Dictator:
         ]
 
         # Initialize Cohere Client
-        self.cohere_client = cohere.Client(self.cohere_api_key, log_warning_experimental_features=False)
+        self.cohere_client = get_registry().cohere(self.cohere_api_key)
+        self.async_cohere_client = get_registry().async_cohere(self.cohere_api_key)
+        self.llm_cache = get_cache()
+        self.prompt_budget = PromptBudget("cohere", "default")
+        self.routing_template = PromptTemplate("routing", ROUTING_PREFIX, self.prompt_budget)
+        self.employee_template = PromptTemplate("employee_reply", EMPLOYEE_PREFIX, self.prompt_budget)
+
+        # Obvious routing decisions are made locally; the manager LLM only gets the unclear rounds
+        aliases = {}
+        for role, agent in roles_to_agents.items():
+            aliases.setdefault(agent.id, []).append(role)
+        self.router = router or LocalRouter(employees, aliases, enabled=os.getenv("LOCAL_ROUTER", "1") != "0")
+
+        # Embedding index over agent memory and channel transcripts, for pulling older context into replies.
+        # Off unless SEMANTIC_RECALL=1: it costs embed calls on every round
+        self.semantic_recall = os.getenv("SEMANTIC_RECALL", "0") == "1"
+        self.recall_k = 4
+        self.recall_index = SemanticIndex(cohere_embedder(self.cohere_client), self.llm_cache)
+
+        # Speculative replies: every employee the manager routes to drafts a reply at once, and the following
+        # rounds post those drafts in routing order instead of generating from scratch
+        self.speculative = os.getenv("SPECULATIVE_REPLIES", "0") == "1"
+        self.drafts = deque()
+        self._draft_pool = None  # Started by the first speculative round
+
+    @property
+    def draft_pool(self):
+        if self._draft_pool is None:
+            self._draft_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="draft")
+        return self._draft_pool
+
+    def close(self):
+        """Drops pending drafts and stops the draft threads."""
+        self.cancel_drafts()
+        if self._draft_pool is not None:
+            self._draft_pool.shutdown(wait=False, cancel_futures=True)
+            self._draft_pool = None
+
+    def __del__(self):
+        if getattr(self, "_draft_pool", None) is not None:  # Also runs after a failed __init__
+            self._draft_pool.shutdown(wait=False, cancel_futures=True)
 
     # Employees = {id: ID, agent: Agent}
     def process_event(self, event, channel_id):
         """Processes a single event by assigning tasks to agents based on roles and tool flags."""
+        with span("dictator.event", event=event.name, roles=",".join(event.roles)):
+            self._process_event(event, channel_id)
+
+    def _process_event(self, event, channel_id):
         print(f"Processing Event: {event.name}")
 
         # Fetch the latest messages from Slack for context
@@ -83,75 +194,297 @@ class Dictator:
                         # Call the regular agent method to participate in the conversation
                         agent.take_instruction(event.name)
 
-    
+    async def aprocess_event(self, event, channel_id):
+        """Async version of process_event. Single-agent roles of an event run concurrently."""
+        with span("dictator.event", event=event.name, roles=",".join(event.roles)):
+            await self._aprocess_event(event, channel_id)
+
+    async def _aprocess_event(self, event, channel_id):
+        print(f"Processing Event: {event.name}")
+
+        if len(event.roles) > 1:
+            print(f"Initiating a discussion between: {', '.join(event.roles)}")
+            await self.ainitiate_discussion(event, channel_id)
+            return
+
+        tasks = []
+        for role in event.roles:
+            if role in self.roles_to_agents:
+                agent = self.roles_to_agents[role]
+                print(f"Assigning task to {agent.name} ({agent.role})")
+
+                if event.tool_used:
+                    if role == "CTO":
+                        tasks.append(agent.atake_instruction(event.metadata.get("task", "")))
+                    elif role == "Marketer":
+                        print("Creating logo...")
+                        tasks.append(agent.acreate_logo())
+                else:
+                    tasks.append(agent.atake_instruction(event.name))
+        await asyncio.gather(*tasks)
+
+    async def arun(self, channel_id, events=None, concurrency=1):
+        """Runs events on one event loop, up to `concurrency` of them at a time (in order when 1)."""
+        events = self.events if events is None else events
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_one(event):
+            async with semaphore:
+                await asyncio.sleep(self.poll_interval)
+                await self.aprocess_event(event, channel_id)
+
+        await asyncio.gather(*(run_one(event) for event in events))
+
+    def get_history(self, channel_id):
+        """Returns the history tracker for a channel, creating it on first use."""
+        if channel_id not in self.histories:
+            self.histories[channel_id] = ChannelHistory(channel_id, window=6)
+        return self.histories[channel_id]
+
+    def flush_outboxes(self, timeout=30):
+        """Waits for the agents' queued Slack posts to go out, so the next history fetch sees the latest replies."""
+        outboxes = {id(agent.outbox): agent.outbox for agent in self.employees.values() if getattr(agent, "outbox", None)}
+        for outbox in outboxes.values():
+            outbox.flush(timeout)
 
     def initiate_discussion(self, event, channel_id):
+        history = self.get_history(channel_id)
         counter = 0
-        while counter < 8:
-            time.sleep(5)
-            try:
-                response = self.slack.conversations_history(channel=channel_id, limit=6)
-                #print(response)
-                messages = response['messages']
-                if len(messages) > 0:
-                    self.process_message(messages)
-            except SlackApiError as e:
-                print(f"Error retrieving messages: {e.response['error']}")
-                messages = []
-                return
+        while counter < self.max_rounds:
+            time.sleep(self.poll_interval)
             counter += 1
+            with span("dictator.round", round=f"{counter}/{self.max_rounds}") as current:
+                self.flush_outboxes()
+                try:
+                    new_messages = history.fetch(self.slack)
+                except SlackApiError as e:
+                    print(f"Error retrieving messages: {e.response['error']}")
+                    return
+                # The history outlives events, so a new discussion always gets its first round on what's there
+                if not new_messages and (counter > 1 or not history.transcript):
+                    print("No new messages since the last round, skipping routing.")
+                    current.set(skipped=True)
+                    continue
+                self.process_message(history.window(), event)
+        self.cancel_drafts()
+        print(f"Prompt prefix stability:\n{stability_report()}")
 
-    def process_message(self, messages):
-        prompt = self.build_prompt(messages)
-        response = self.cohere_client.chat(
-            message=prompt,
-            temperature=0.5,
-            max_tokens=600,
-            response_format={
-  "type": "json_object",
-  "schema": {
-    "type": "object",
-    "properties": {
-      "progress": {
-        "type": "integer"
-      },
-      "value": {
-        "type": "string"
-      },
-      "employees": {
-        "type": "array",
-        "items": {
-          "type": "object",
-          "properties": {
-            "id": {
-              "type": "string"
-            },
-            "response_type": {
-              "type": "string"
-            }
-          },
-          "required": ["id", "response_type"]
-        }
-      }
-    },
-    "required": ["employees", "progress", "value"]
-  }
-}
+    async def ainitiate_discussion(self, event, channel_id):
+        """Async version of initiate_discussion; waiting between rounds does not block other events."""
+        history = self.get_history(channel_id)
+        for counter in range(1, self.max_rounds + 1):
+            await asyncio.sleep(self.poll_interval)
+            with span("dictator.round", round=f"{counter}/{self.max_rounds}") as current:
+                await asyncio.to_thread(self.flush_outboxes)
+                try:
+                    new_messages = await history.afetch(self.async_slack)
+                except SlackApiError as e:
+                    print(f"Error retrieving messages: {e.response['error']}")
+                    return
+                # The history outlives events, so a new discussion always gets its first round on what's there
+                if not new_messages and (counter > 1 or not history.transcript):
+                    print("No new messages since the last round, skipping routing.")
+                    current.set(skipped=True)
+                    continue
+                await self.aprocess_message(history.window(), event)
+        self.cancel_drafts()
+        print(f"Prompt prefix stability:\n{stability_report()}")
+
+    def process_message(self, messages, event=None):
+        if self.speculative and self.post_next_draft(messages, event):
+            return
+        candidates, progress = self.route(messages, event)
+        if not candidates:
+            return
+
+        employee_id = candidates[0]
+        agent = self.employees[employee_id]
+        with span("agent.reply", agent=agent.name, role=agent.role):
+            relevant = self.recall_relevant(messages)
+            if self.speculative and progress != 1:
+                # The other candidates write their replies while this one is generated and posted
+                for other_id in candidates[1:]:
+                    prompt = self.build_employee_prompt(other_id, messages, relevant)
+                    future = self.draft_pool.submit(contextvars.copy_context().run, self.draft_reply, other_id, prompt)
+                    self.drafts.append(Draft(other_id, messages[0].get('ts'), future))
+            agent.generate_message(self.build_employee_prompt(employee_id, messages, relevant))
+
+    def route(self, messages, event=None):
+        """Decides who replies: (employee ids in the order they should reply, progress). Progress 1 means the
+        manager considers the discussion finished; it is only known when the manager LLM was asked."""
+        start = time.perf_counter()
+        with span("dictator.route") as current:
+            decision = self.router.route(messages, event)
+            candidates, progress, response = [decision.employee_id] if decision.employee_id else [], 0, None
+            if decision.escalate:
+                response = self.route_with_llm(messages, event)
+                candidates, progress = self.routing_candidates(response, messages)
+            employee_id = candidates[0] if candidates else None
+            current.set(source="llm" if decision.escalate else "local", confidence=decision.confidence, responder=employee_id)
+        self.router.record(messages, event, decision, employee_id, "llm" if decision.escalate else "local", time.perf_counter() - start, response)
+        return candidates, progress
+
+    def draft_reply(self, employee_id, prompt):
+        agent = self.employees[employee_id]
+        with span("agent.draft", agent=agent.name, role=agent.role):
+            return agent.draft_message(prompt)
+
+    def next_draft(self, messages):
+        """Pops the next usable draft. Drafts are dropped when someone outside the team spoke after they were
+        written (they no longer answer the conversation) or when their author wrote the latest message."""
+        if any(message.get('user') not in self.employees for message in self.messages_after(messages, self.drafts[0].after_ts if self.drafts else None)):
+            print(f"New messages from outside the team, dropping {len(self.drafts)} draft(s).")
+            self.cancel_drafts()
+        while self.drafts:
+            draft = self.drafts.popleft()
+            if draft.employee_id != messages[0].get('user'):
+                return draft
+            draft.future.cancel()
+        return None
+
+    @staticmethod
+    def messages_after(messages, ts):
+        if ts is None:
+            return []
+        return [message for message in messages if float(message.get('ts', 0)) > float(ts)]
+
+    def cancel_drafts(self):
+        """Drops the queued drafts. Ones still waiting are cancelled; ones already running finish unused."""
+        while self.drafts:
+            self.drafts.popleft().future.cancel()
+
+    def post_next_draft(self, messages, event=None):
+        """Posts the next queued draft. The manager is still asked about the round (at the same time as the
+        draft finishes) so an ended discussion cancels the remaining drafts. Returns False if no draft was posted."""
+        draft = self.next_draft(messages)
+        if draft is None:
+            return False
+        routing = self.draft_pool.submit(contextvars.copy_context().run, self.route, messages, event)
+        try:
+            text = draft.future.result()
+        except Exception as e:
+            print(f"Draft reply from {self.get_employee_name(draft.employee_id)} failed: {e}")
+            routing.result()
+            return False
+        _, progress = routing.result()
+        if progress == 1 and self.drafts:
+            print(f"Discussion wrapped up, cancelling {len(self.drafts)} draft(s).")
+            self.cancel_drafts()
+        agent = self.employees[draft.employee_id]
+        with span("agent.reply", agent=agent.name, role=agent.role, drafted=True):
+            agent.post_draft(text)
+        return True
+
+    async def aprocess_message(self, messages, event=None):
+        """Async version of process_message."""
+        if self.speculative and await self.apost_next_draft(messages, event):
+            return
+        candidates, progress = await self.aroute(messages, event)
+        if not candidates:
+            return
+
+        employee_id = candidates[0]
+        agent = self.employees[employee_id]
+        with span("agent.reply", agent=agent.name, role=agent.role):
+            relevant = await asyncio.to_thread(self.recall_relevant, messages)
+            if self.speculative and progress != 1:
+                for other_id in candidates[1:]:
+                    prompt = self.build_employee_prompt(other_id, messages, relevant)
+                    self.drafts.append(Draft(other_id, messages[0].get('ts'), asyncio.create_task(self.adraft_reply(other_id, prompt))))
+            await agent.agenerate_message(self.build_employee_prompt(employee_id, messages, relevant))
+
+    async def aroute(self, messages, event=None):
+        """Async version of route."""
+        start = time.perf_counter()
+        with span("dictator.route") as current:
+            decision = self.router.route(messages, event)
+            candidates, progress, response = [decision.employee_id] if decision.employee_id else [], 0, None
+            if decision.escalate:
+                response = await self.aroute_with_llm(messages, event)
+                candidates, progress = self.routing_candidates(response, messages)
+            employee_id = candidates[0] if candidates else None
+            current.set(source="llm" if decision.escalate else "local", confidence=decision.confidence, responder=employee_id)
+        self.router.record(messages, event, decision, employee_id, "llm" if decision.escalate else "local", time.perf_counter() - start, response)
+        return candidates, progress
+
+    async def adraft_reply(self, employee_id, prompt):
+        agent = self.employees[employee_id]
+        with span("agent.draft", agent=agent.name, role=agent.role):
+            return await agent.adraft_message(prompt)
+
+    async def apost_next_draft(self, messages, event=None):
+        """Async version of post_next_draft."""
+        draft = self.next_draft(messages)
+        if draft is None:
+            return False
+        routing = asyncio.create_task(self.aroute(messages, event))
+        try:
+            text = await draft.future
+        except Exception as e:
+            print(f"Draft reply from {self.get_employee_name(draft.employee_id)} failed: {e}")
+            await routing
+            return False
+        _, progress = await routing
+        if progress == 1 and self.drafts:
+            print(f"Discussion wrapped up, cancelling {len(self.drafts)} draft(s).")
+            self.cancel_drafts()
+        agent = self.employees[draft.employee_id]
+        with span("agent.reply", agent=agent.name, role=agent.role, drafted=True):
+            agent.post_draft(text)
+        return True
+
+    def route_with_llm(self, messages, event=None):
+        """Asks the manager LLM who should respond. Returns the raw ROUTING_SCHEMA JSON text."""
+        prompt = self.build_prompt(messages, event)
+        max_tokens = self.prompt_budget.max_output(prompt, 600)
+        return self.llm_cache.cached(
+            "cohere", "default", prompt, {"temperature": 0.5, "max_tokens": max_tokens, "response_format": ROUTING_SCHEMA},
+            lambda: record_usage(self.cohere_client.chat(
+                message=prompt,
+                temperature=0.5,
+                max_tokens=max_tokens,
+                response_format=ROUTING_SCHEMA
+            )).text
+        )
+
+    async def aroute_with_llm(self, messages, event=None):
+        """Async version of route_with_llm."""
+        prompt = self.build_prompt(messages, event)
+        max_tokens = self.prompt_budget.max_output(prompt, 600)
+
+        async def call():
+            response = await self.async_cohere_client.chat(
+                message=prompt,
+                temperature=0.5,
+                max_tokens=max_tokens,
+                response_format=ROUTING_SCHEMA
+            )
+            record_usage(response)
+            return response.text
+
+        return await self.llm_cache.acached(
+            "cohere", "default", prompt, {"temperature": 0.5, "max_tokens": max_tokens, "response_format": ROUTING_SCHEMA}, call
         )
-        
-        response_json = json.loads(response.text)
-        print("\n\n\n\n")
-        print(response_json)
-        print("\n\n\n\n")
-    
+
+    def pick_responder(self, response_text, messages):
+        """Parses the routing response and returns the first employee that should reply, if any."""
+        candidates, _ = self.routing_candidates(response_text, messages)
+        return candidates[0] if candidates else None
+
+    def routing_candidates(self, response_text, messages):
+        """Parses the routing response: (employees that may reply, in order, without duplicates or the last speaker; progress)."""
+        response_json = json.loads(response_text)
+
         # Access the "employees" key to retrieve the list of objects
         employees = response_json.get("employees", [])
         progress = response_json.get("progress", 0)
         topic = response_json.get("value", "")
+        annotate(progress=progress, topic=topic, candidates=len(employees))
 
         # Now you can iterate over the employees and handle the data
         #print(self.employees)
        # print(self.employees['U07M0K20NB1'].id)
+        candidates = []
         for employee in employees:
             employee_id = employee.get("id")
             response_type = employee.get("response_type")
@@ -159,39 +492,84 @@ class Dictator:
             # Process the employee's information
             print(f"CURRENTLY AT {self.get_employee_name(employee_id)}")
             if employee_id in self.employees and employee_id != messages[0]['user']:
-                prompt = f"""You are {self.get_employee_name(employee_id)}, the {self.employees[employee_id].role} of Echo. Echo is a 911 dispatching service that uses AI to help manage emergency calls. You are responding to a message from a team member. You are a technical person with management of the codebase. Your current goal is to do Market Research and evaluate (1) Customers (2) Industry and (3) Market insights and the conversation should NOT stray away from this topic. If it does, take initiative to come back to it until it is complete."""
-                
-                prompt += "\n\nThis is the previous conversation. Continue on after the last message"
-                for message in messages[::-1]:
-                    prompt += f"\n{self.get_employee_name(message['user'])}: {message['text']}"
-                
-                prompt += f"""\n\nMake your message short and informal. Only write the response text without quotations and do not give any prefix. 
-                Remember that you are the employee of Echo, an AI-driven service to help manage dispatching. Do not repeat from the past message. Only provide a response for the person, do not include any preamble describing the response. Do not add comments, it is very important that you only provide the final output without any additional comments or remarks. Do not meeting or dicussing. Speak casually, you are close with everyone as you are already all on the team. Do not use the word Great in your response."""
-                print("\n\n", prompt)
-                self.employees[employee_id].generate_message(prompt)
-                break
+                if employee_id not in candidates:
+                    candidates.append(employee_id)
             else:
                 print(f"Employee with ID {employee_id} not found.")
-            
+        return candidates, progress
 
-        
-    def build_prompt(self, messages):
-        prompt = """You are the manager of a startup. Based on the input provided, determine the top 3 employees that should respond. The employee can have either a tool response or a message response, determine which response that this should be.""" 
+    def index_context(self):
+        """Adds memory entries and transcript messages the index hasn't seen yet. Only new items get embedded."""
+        items = []
+        for history in self.histories.values():
+            for message in history.transcript:
+                if message.get('text'):
+                    items.append({"key": f"slack:{message['ts']}", "text": f"{self.get_employee_name(message.get('user'))}: {message['text']}"})
+        for agent in self.employees.values():
+            for entry in agent.recall_memory():
+                digest = hashlib.sha1(f"{entry['instruction']}\0{entry['action']}".encode("utf-8")).hexdigest()
+                items.append({"key": f"memory:{agent.id}:{digest}", "text": f"{agent.name} ({entry['instruction']}): {entry['action']}"})
+        self.recall_index.add(items)
 
-        prompt += "\n\nThe following messages were received:"
-        for message in messages:
-            prompt += f"\n{self.get_employee_name(message['user'])}: \"{message['text']}\"\n"
-
-        prompt += "Determine the IDs of the to 3 employees in order that they should respond and the response they should provide (tool or message). Ensure they are in the right JSON format. Pick from the following employees:"
-        employees_list = list(self.employees.values())
-        random.shuffle(employees_list)
-        print(employees_list)
-        for employee in employees_list:
-            prompt += f"\n- ID: {employee.id}"
-        
-        prompt += f"\n\Regarding this event {self.events[self.current_event_index]}, give a specific topic that was not used before for continuation of the conversation to discuss and store it in \"value\". Give a \"progress\" of 1 to end the conversation. Otherwise, give a 0 to continue this conversation."
+    def recall_relevant(self, messages):
+        """The indexed items most related to the latest messages, leaving out the ones already in the window."""
+        if not self.semantic_recall or not messages:
+            return []
+        with span("dictator.recall") as current:
+            try:
+                self.index_context()
+                query = "\n".join(message.get('text', '') for message in messages[:2])
+                exclude = {f"slack:{message['ts']}" for message in messages if 'ts' in message}
+                relevant = [item["text"] for item, _ in self.recall_index.search(query, self.recall_k, exclude, min_score=0.2)]
+                current.set(indexed=len(self.recall_index.items), recalled=len(relevant))
+                return relevant
+            except Exception as e:
+                print(f"Semantic recall failed, continuing without it: {e}")
+                current.set(failed=True)
+                return []
+
+    def build_employee_prompt(self, employee_id, messages, relevant=None):
+        def role():
+            return f"\n\nYou are {self.get_employee_name(employee_id)}, the {self.employees[employee_id].role} of Echo. You are responding to a message from a team member. You are a technical person with management of the codebase."
+
+        recalled = ""
+        if relevant:
+            recalled = "\n\nEarlier context that may be relevant:" + "".join(f"\n- {text}" for text in relevant)
+
+        header = "\n\nThis is the previous conversation. Continue on after the last message"
+        history = ""
+        for message in messages[::-1]:
+            history += f"\n{self.get_employee_name(message['user'])}: {message['text']}"
+
+        # Recalled context goes first when space runs out, then the oldest messages; 150 is the agents' max_tokens
+        prompt = self.employee_template.render([
+            Section("recalled", recalled, priority=0),
+            Section("header", header),
+            Section("history", history, priority=1, keep="tail"),
+        ], role_key=employee_id, role_render=role, reserve_output_tokens=150)
+        annotate(prompt_chars=len(prompt), recalled=len(relevant or []))  # Traced on the agent.reply span instead of printed
         return prompt
 
+    def build_prompt(self, messages, event=None):
+        event = event or self.events[self.current_event_index]
+
+        # The employee list is kept in a fixed order (no shuffling) so it stays part of the cacheable prefix
+        def role():
+            text = "\n\nPick from the following employees:"
+            for employee in self.employees.values():
+                text += f"\n- ID: {employee.id}"
+            return text + f"\n\nThe event: {event}"
+
+        received = ""
+        for message in messages:
+            received += f"\n{self.get_employee_name(message['user'])}: \"{message['text']}\"\n"
+
+        # Messages arrive newest first, so trimming keeps the head
+        return self.routing_template.render([
+            Section("header", "\n\nThe following messages were received:"),
+            Section("received", received, priority=1, keep="head"),
+        ], role_key=repr(event), role_render=role, reserve_output_tokens=600)
+
     def get_employee_name(self, employee_id):
         #print("\n\nLOOKING FOR ", employee_id)
         #print(self.employees)
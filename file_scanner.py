@@ -0,0 +1,197 @@
+import os
+import re
+import mmap
+from concurrent.futures import ThreadPoolExecutor
+
+# Always skipped on top of .gitignore: dependency/build trees and lockfiles that are huge and useless to the model
+DEFAULT_IGNORES = [
+    ".git/",
+    "node_modules/",
+    # Build output only at the project root, so e.g. src/components/build/ is still mapped
+    "/.next/",
+    "/out/",
+    "/build/",
+    "/dist/",
+    "/coverage/",
+    "package-lock.json",
+    "yarn.lock",
+    "pnpm-lock.yaml",
+    "*.min.js",
+    "*.map",
+    "*.txn-tmp",  # FileTransaction's staged files, if a crash left any behind
+]
+
+
+class IgnoreRules:
+    """A small .gitignore matcher: globs, `dir/` patterns, anchored `/patterns`, `**` and `!negation`. Last match wins.
+
+    As in git, a pattern with a slash (other than a trailing one) is matched against the whole path from the
+    project root, anything else against the name at any depth; `**/` stands for zero or more whole directories.
+    """
+
+    def __init__(self, patterns):
+        self.rules = []
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith("#"):
+                continue
+            negate = pattern.startswith("!")
+            pattern = pattern[1:] if negate else pattern
+            dir_only = pattern.endswith("/")
+            pattern = pattern.rstrip("/")
+            anchored = "/" in pattern
+            regex = self.translate(pattern.lstrip("/"))
+            self.rules.append((re.compile(regex if anchored else f"(?:.*/)?{regex}"), negate, dir_only))
+
+    @staticmethod
+    def translate(pattern):
+        """Regex for a gitignore glob, where `*` and `?` never cross a `/`."""
+        parts = []
+        i = 0
+        while i < len(pattern):
+            if pattern.startswith("**/", i):
+                parts.append("(?:.*/)?")
+                i += 3
+            elif pattern.startswith("**", i):
+                parts.append(".*")
+                i += 2
+            elif pattern[i] == "*":
+                parts.append("[^/]*")
+                i += 1
+            elif pattern[i] == "?":
+                parts.append("[^/]")
+                i += 1
+            elif pattern[i] == "[" and "]" in pattern[i + 2:]:
+                end = pattern.index("]", i + 2)
+                body = pattern[i + 1:end]
+                parts.append("[" + ("^" + body[1:] if body.startswith("!") else body) + "]")
+                i = end + 1
+            else:
+                parts.append(re.escape(pattern[i]))
+                i += 1
+        return "".join(parts)
+
+    @classmethod
+    def for_project(cls, project_path, extra_patterns=None):
+        """Rules from the project's root .gitignore plus DEFAULT_IGNORES and any extra globs."""
+        patterns = list(DEFAULT_IGNORES) + list(extra_patterns or [])
+        gitignore = os.path.join(project_path, ".gitignore")
+        if os.path.exists(gitignore):
+            with open(gitignore, 'r', encoding='utf-8', errors='replace') as file:
+                patterns.extend(file.read().splitlines())
+        return cls(patterns)
+
+    def ignored(self, rel_path, is_dir):
+        rel_path = rel_path.replace(os.sep, "/")
+        result = False
+        for regex, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.fullmatch(rel_path):
+                result = not negate
+        return result
+
+
+class FileScanner:
+    """Walks project directories with ignore rules and reads text files in parallel under per-file and total size caps.
+
+    Files that look binary (a NUL byte in the first 8 KB, or not UTF-8) are skipped, and files bigger than
+    `mmap_threshold` are decoded straight from a memory map instead of being read into a buffer first.
+    """
+
+    def __init__(self, project_path, ignore_patterns=None, max_file_bytes=512 * 1024, max_total_bytes=8 * 1024 * 1024,
+                 mmap_threshold=64 * 1024, max_workers=8):
+        self.project_path = project_path
+        self.rules = IgnoreRules.for_project(project_path, ignore_patterns)
+        self.max_file_bytes = max_file_bytes
+        self.max_total_bytes = max_total_bytes
+        self.mmap_threshold = mmap_threshold
+        self.max_workers = max_workers
+
+    def walk(self, directory):
+        """Returns [(path, stat)] for every non-ignored file under `directory`, in a stable order."""
+        files = []
+        if not os.path.isdir(directory):
+            return files
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            try:
+                entries = sorted(os.scandir(current), key=lambda entry: entry.name)
+            except OSError as e:
+                print(f"Could not list {current}: {e}")
+                continue
+            subdirs = []
+            for entry in entries:
+                rel_path = os.path.relpath(entry.path, self.project_path)
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if self.rules.ignored(rel_path, is_dir):
+                    continue
+                if is_dir:
+                    subdirs.append(entry.path)
+                elif entry.is_file():
+                    files.append((entry.path, entry.stat()))
+            stack.extend(reversed(subdirs))
+        return files
+
+    def within_total(self, files, total=0):
+        """Splits files into those that fit under max_total_bytes (in walk order, starting from `total` bytes
+        already used) and the rest. Returns (kept, dropped, new total)."""
+        kept, dropped = [], []
+        for path, stat in files:
+            size = stat.st_size if stat.st_size <= self.max_file_bytes else 0  # Oversized files are skipped anyway
+            if self.max_total_bytes is not None and total + size > self.max_total_bytes:
+                dropped.append((path, stat))
+            else:
+                kept.append((path, stat))
+                total += size
+        return kept, dropped, total
+
+    def read_many(self, paths):
+        """Reads files on a thread pool. Returns {path: record} in the same format as read_file."""
+        if not paths:
+            return {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return dict(zip(paths, pool.map(self.read_file, paths)))
+
+    def read_file(self, file_path):
+        extension = os.path.splitext(file_path)[1]
+        try:
+            size = os.path.getsize(file_path)
+            if size > self.max_file_bytes:
+                return self.skipped(file_path, f"larger than {self.max_file_bytes} bytes", size)
+            with open(file_path, 'rb') as file:
+                if size >= self.mmap_threshold:
+                    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        if self.looks_binary(mapped[:8192]):
+                            return self.skipped(file_path, "binary", size)
+                        content = str(mapped, 'utf-8')
+                else:
+                    data = file.read()
+                    if self.looks_binary(data[:8192]):
+                        return self.skipped(file_path, "binary", size)
+                    content = data.decode('utf-8')
+            return {
+                'content': content,
+                'size': len(content),
+                'extension': extension
+            }
+        except UnicodeDecodeError:
+            return self.skipped(file_path, "binary", os.path.getsize(file_path))
+        except Exception as e:
+            return {
+                'error': str(e),
+                'size': 0,
+                'extension': extension
+            }
+
+    def skipped(self, file_path, reason, size):
+        return {
+            'skipped': reason,
+            'size': size,
+            'extension': os.path.splitext(file_path)[1]
+        }
+
+    @staticmethod
+    def looks_binary(sample):
+        return b"\0" in sample
@@ -0,0 +1,111 @@
+import os
+import uuid
+import shutil
+
+TEMP_SUFFIX = ".txn-tmp"  # On staged files and backups; FileScanner ignores it, so ones left by a crash aren't mapped
+
+
+class FileTransaction:
+    """Applies a batch of file writes all-or-nothing.
+
+    write() stages content in a temp file next to its target. commit() fsyncs every staged file in one
+    batch, swaps them in with os.replace, then fsyncs the touched directories once. If anything fails,
+    rollback() restores the original files from hard-link backups and removes files and directories the
+    transaction created.
+    """
+
+    def __init__(self):
+        self.staged = []  # (target, temp path)
+        self.replaced = []  # (target, backup path or None if the target is new)
+        self.created_dirs = []
+        self.committed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.rollback()
+        elif not self.committed:
+            self.commit()
+        return False
+
+    def write(self, path, content):
+        """Stages `content` for `path`; nothing is visible at `path` until commit()."""
+        directory = os.path.dirname(os.path.abspath(path))
+        self._makedirs(directory)
+        temp_path = os.path.join(directory, f".{os.path.basename(path)}.{uuid.uuid4().hex[:12]}{TEMP_SUFFIX}")
+        # 0o666 like open() uses, so the kernel applies the umask and new files get the usual mode
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        self.staged.append((path, temp_path))
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(content)
+
+    def _makedirs(self, directory):
+        missing = []
+        while not os.path.isdir(directory):
+            missing.append(directory)
+            directory = os.path.dirname(directory)
+        for path in reversed(missing):
+            os.mkdir(path)
+            self.created_dirs.append(path)
+
+    def commit(self):
+        # Batch the durability work: one fsync per staged file up front, one per directory at the end
+        for _, temp_path in self.staged:
+            with open(temp_path, 'rb') as file:
+                os.fsync(file.fileno())
+
+        for target, temp_path in self.staged:
+            backup = None
+            if os.path.exists(target):
+                backup = f"{temp_path[:-len(TEMP_SUFFIX)]}.orig{TEMP_SUFFIX}"
+                try:
+                    os.link(target, backup)
+                except OSError:
+                    shutil.copy2(target, backup)
+                shutil.copymode(target, temp_path)
+            self.replaced.append((target, backup))
+            os.replace(temp_path, target)
+
+        for directory in {os.path.dirname(os.path.abspath(target)) for target, _ in self.staged}:
+            self._fsync_dir(directory)
+        for _, backup in self.replaced:
+            if backup:
+                os.remove(backup)
+        self.committed = True
+
+    def rollback(self):
+        """Undoes whatever part of the transaction already happened. Safe to call more than once."""
+        if self.committed:
+            return
+        for target, backup in reversed(self.replaced):
+            try:
+                if backup:
+                    os.replace(backup, target)
+                elif os.path.exists(target):
+                    os.remove(target)
+            except OSError as e:
+                print(f"Failed to roll back {target}: {e}")
+        self.replaced = []
+        for _, temp_path in self.staged:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self.staged = []
+        for directory in reversed(self.created_dirs):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
+        self.created_dirs = []
+
+    @staticmethod
+    def _fsync_dir(directory):
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return  # Not supported on this platform
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
@@ -0,0 +1,106 @@
+import os
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import git
+
+from tracing import span
+
+# Credential helper handed to git for the push only, through GIT_CONFIG_* in its environment, so nothing is
+# written to the repo config. The token is passed the same way and never lands in a URL, the config or the
+# process list.
+CREDENTIAL_HELPER = "!f() { echo username=x-access-token; echo password=$AGENT_GIT_TOKEN; }; f"
+
+
+class GitBackend:
+    """Keeps one GitPython Repo handle per project and does staging, commits and pushes through it."""
+
+    def __init__(self, repo_path, remote_name="agent-origin"):
+        self.repo_path = repo_path
+        self.remote_name = remote_name
+        self.timings = {}  # step -> seconds for the most recent commit/push
+        self._repo = None
+
+    @property
+    def repo(self):
+        if self._repo is None:
+            # The project may be a subdirectory of the repo (e.g. a landing/ app inside a monorepo)
+            self._repo = git.Repo(self.repo_path, search_parent_directories=True)
+        return self._repo
+
+    def repo_relative(self, path):
+        """`path` (relative to the project, or absolute) relative to the repo's working tree, as the index wants it."""
+        full_path = os.path.realpath(os.path.join(self.repo_path, path))
+        return os.path.relpath(full_path, os.path.realpath(self.repo.working_tree_dir))
+
+    @contextmanager
+    def timed(self, step, **attributes):
+        """Times one git step into `timings` and traces it as a git.<step> span."""
+        start = time.perf_counter()
+        try:
+            with span(f"git.{step}", **attributes) as current:
+                yield current
+        finally:
+            self.timings[step] = time.perf_counter() - start
+
+    def commit(self, paths, message):
+        """Stages only `paths` (relative to the project) and commits them. Returns the new commit sha, or None if nothing changed."""
+        self.timings = {}
+        paths = [self.repo_relative(path) for path in paths]
+        with self.timed("stage", files=len(paths)):
+            present = [path for path in paths if os.path.exists(os.path.join(self.repo.working_tree_dir, path))]
+            missing = [path for path in paths if path not in present]
+            if present:
+                self.repo.index.add(present)
+            if missing:
+                self.repo.index.remove(missing, ignore_unmatch=True)
+            self.repo.index.write()
+
+        with self.timed("diff"):
+            changed = not self.repo.head.is_valid() or bool(self.repo.index.diff("HEAD"))
+        if not changed:
+            print("Nothing to commit.")
+            return None
+
+        with self.timed("commit"):
+            commit = self.repo.index.commit(message)
+        return commit.hexsha
+
+    def ensure_remote(self, url):
+        """Points the agent remote at `url` (token free)."""
+        with self.timed("remote"):
+            if self.remote_name in [remote.name for remote in self.repo.remotes]:
+                remote = self.repo.remote(self.remote_name)
+                if remote.url != url:
+                    remote.set_url(url)
+            else:
+                remote = self.repo.create_remote(self.remote_name, url)
+        return remote
+
+    @staticmethod
+    def credential_env(url, token):
+        """Environment for one git command that gives it the token for `url` through CREDENTIAL_HELPER."""
+        env = {"GIT_TERMINAL_PROMPT": "0"}
+        parts = urlsplit(url)
+        if parts.scheme in ("http", "https"):  # Local and ssh remotes don't go through credential helpers
+            # Git only matches a credential section with a path when credential.useHttpPath is on, so key it by host
+            env.update(GIT_CONFIG_COUNT="1", GIT_CONFIG_KEY_0=f"credential.{parts.scheme}://{parts.netloc}.helper",
+                       GIT_CONFIG_VALUE_0=CREDENTIAL_HELPER, AGENT_GIT_TOKEN=token or "")
+        return env
+
+    def push(self, url, token=None, branch=None):
+        """Pushes the current branch to `url` through the agent remote. Returns True on success."""
+        remote = self.ensure_remote(url)
+        branch = branch or self.repo.active_branch.name
+        with self.timed("push", branch=branch) as current:
+            with self.repo.git.custom_environment(**self.credential_env(url, token)):
+                results = remote.push(f"HEAD:refs/heads/{branch}")
+            failed = [info for info in results if info.flags & info.ERROR]
+            current.set(rejected=bool(failed))
+        for info in failed:
+            print(f"Push of {info.local_ref} failed: {info.summary.strip()}")
+        return bool(results) and not failed
+
+    def report_timings(self):
+        return ", ".join(f"{step}={seconds * 1000:.0f}ms" for step, seconds in self.timings.items())
@@ -1,4 +1,10 @@
 def trim_quotations(s):
     if s.startswith(('\'', '"')) and s.endswith(('\'', '"')):
         return s[1:-1]
-    return s
\ No newline at end of file
+    return s
+
+
+def extractive_summary(text, max_chars=1500):
+    """Fallback summary without an LLM: the first line of every entry, cut to max_chars."""
+    lines = [line.strip()[:200] for line in text.splitlines() if line.strip()]
+    return "\n".join(lines)[:max_chars]
@@ -0,0 +1,169 @@
+import os
+import io
+import json
+import time
+import asyncio
+import random
+import hashlib
+import threading
+
+from clients import get_registry
+from llm_cache import get_cache, DEFAULT_CACHE_DIR
+from tracing import span, current_span
+
+IMAGE_MODEL = "black-forest-labs/flux-dev"
+POLL_INTERVAL = 0.5  # Seconds before the first status check; doubles up to MAX_POLL_INTERVAL
+MAX_POLL_INTERVAL = 4.0
+PREDICTION_TIMEOUT = 300.0  # Give up on (and cancel) a prediction after this many seconds
+MAX_IMAGE_BYTES = 20 * 1024 * 1024  # Slack's upload limit is far higher, but no logo should come close
+DOWNLOAD_CHUNK = 64 * 1024
+DONE_STATUSES = {"succeeded", "failed", "canceled"}
+EXTENSIONS = {"image/png": "png", "image/jpeg": "jpg", "image/webp": "webp", "image/gif": "gif"}
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def background_loop():
+    """Event loop on a daemon thread that all image work runs on.
+
+    Replicate's client and the download pool bind to the first loop that uses them, so they always get this one
+    no matter which thread or loop the caller is on.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="image-pipeline", daemon=True).start()
+        return _loop
+
+
+class GeneratedImage:
+    def __init__(self, data, content_type, url, variant, seed=None, cached=False):
+        self.data = data
+        self.content_type = content_type
+        self.url = url
+        self.variant = variant
+        self.seed = seed  # The Replicate seed, so an image can be made again
+        self.cached = cached
+        self.sha256 = hashlib.sha256(data).hexdigest()
+
+    @property
+    def filename(self):
+        return f"{self.sha256[:12]}.{EXTENSIONS.get(self.content_type, 'png')}"
+
+    def metadata(self):
+        return {"url": self.url, "sha256": self.sha256, "content_type": self.content_type, "size": len(self.data), "variant": self.variant,
+                "seed": self.seed}
+
+
+class ImagePipeline:
+    """Generates images on Replicate without blocking the caller.
+
+    Each variant is its own prediction (same prompt, a fresh random seed): they're created together, polled with
+    backoff and downloaded straight into memory. Finished images are kept on disk by content hash under
+    `image_dir`, with the request -> image mapping in the LLM cache, so a repeated request skips Replicate.
+    """
+
+    def __init__(self, replicate_client, model=IMAGE_MODEL, cache=None, image_dir=None, poll_interval=POLL_INTERVAL,
+                 timeout=PREDICTION_TIMEOUT, max_bytes=MAX_IMAGE_BYTES):
+        self.client = replicate_client
+        self.model = model
+        self.cache = cache or get_cache()
+        self.image_dir = image_dir or os.getenv("IMAGE_CACHE_DIR") or os.path.join(DEFAULT_CACHE_DIR, "images")
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+
+    def generate(self, prompt, variants=1, **params):
+        """Blocks until every variant is done. Returns the images that made it (raises if none did)."""
+        future = asyncio.run_coroutine_threadsafe(self._generate(prompt, variants, params, current_span()), background_loop())
+        return future.result()
+
+    async def agenerate(self, prompt, variants=1, **params):
+        """Async version of generate; awaits the work on the pipeline's own loop."""
+        future = asyncio.run_coroutine_threadsafe(self._generate(prompt, variants, params, current_span()), background_loop())
+        return await asyncio.wrap_future(future)
+
+    async def _generate(self, prompt, variants, params, parent):
+        with span("replicate.generate", parent, model=self.model, variants=variants, prompt_chars=len(prompt)) as current:
+            results = await asyncio.gather(*(self._variant(prompt, variant, params) for variant in range(variants)), return_exceptions=True)
+            images = [result for result in results if isinstance(result, GeneratedImage)]
+            failures = [result for result in results if not isinstance(result, GeneratedImage)]
+            for failure in failures:
+                print(f"A logo variant failed: {failure}")
+            current.set(images=len(images), failed=len(failures))
+            if not images:
+                raise failures[0]
+            return images
+
+    async def _variant(self, prompt, variant, params):
+        key = self.cache.make_key("replicate", self.model, prompt, dict(params, variant=variant))
+        image = None if self.cache.bypass or self.cache.refresh else self._load(key, variant)
+        if image is not None:
+            return image
+        seed = random.randrange(2 ** 31)  # Seeding with the variant number gave the same images on every request
+        url = await self._predict(dict(params, prompt=prompt, seed=seed))
+        data, content_type = await self._download(url)
+        image = GeneratedImage(data, content_type, url, variant, seed)
+        if not self.cache.bypass:
+            await asyncio.to_thread(self._store, key, image)
+        return image
+
+    async def _predict(self, input):
+        """Creates a prediction and polls it to completion. Returns the output image URL."""
+        with span("replicate.prediction", model=self.model, seed=input.get("seed"), polls=0) as current:
+            prediction = await self.client.models.predictions.async_create(self.model, input=input)
+            deadline = time.monotonic() + self.timeout
+            interval = self.poll_interval
+            while prediction.status not in DONE_STATUSES:
+                if time.monotonic() > deadline:
+                    await prediction.async_cancel()
+                    raise TimeoutError(f"Prediction {prediction.id} still {prediction.status} after {self.timeout:g}s")
+                await asyncio.sleep(interval)
+                interval = min(interval * 2, MAX_POLL_INTERVAL)
+                await prediction.async_reload()
+                current.add("polls")
+            current.set(status=prediction.status)
+            if prediction.status != "succeeded":
+                raise RuntimeError(f"Prediction {prediction.id} {prediction.status}: {prediction.error}")
+            output = prediction.output[0] if isinstance(prediction.output, list) else prediction.output
+            return getattr(output, "url", output)  # A plain URL string or a replicate FileOutput
+
+    async def _download(self, url):
+        """Streams the image into memory, refusing anything over max_bytes. Returns (bytes, content type)."""
+        with span("replicate.download") as current:
+            buffer = io.BytesIO()
+            async with get_registry().async_http_client("replicate_files").stream("GET", url) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK):
+                    buffer.write(chunk)
+                    if buffer.tell() > self.max_bytes:
+                        raise ValueError(f"Image at {url} is over {self.max_bytes} bytes")
+                content_type = response.headers.get("content-type", "image/png").split(";")[0]
+            current.set(bytes=buffer.tell())
+            return buffer.getvalue(), content_type
+
+    def _path(self, sha256):
+        return os.path.join(self.image_dir, sha256[:2], sha256)
+
+    def _load(self, key, variant):
+        value = self.cache.get(key)
+        if value is None:
+            return None
+        entry = json.loads(value)
+        try:
+            with open(self._path(entry["sha256"]), 'rb') as file:
+                data = file.read()
+        except OSError:
+            return None  # The image file was cleaned up; generate it again
+        return GeneratedImage(data, entry["content_type"], entry["url"], variant, entry.get("seed"), cached=True)
+
+    def _store(self, key, image):
+        path = self._path(image.sha256)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(f"{path}.tmp", 'wb') as file:
+                file.write(image.data)
+            os.replace(f"{path}.tmp", path)
+        self.cache.set(key, json.dumps(image.metadata()))
@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+from tracing import span
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "stealth-startup")
+
+
+class LLMCache:
+    """Disk-backed cache of LLM completions keyed on (provider, model, prompt, sampling params).
+
+    Entries live in a small SQLite file. Reads bump the entry's access time so eviction is LRU,
+    entries older than `ttl` seconds are treated as misses, and the store is trimmed back under
+    `max_entries` / `max_bytes` after writes. `bypass` skips the cache entirely, `refresh` skips
+    reads but still stores the fresh result.
+    """
+
+    def __init__(self, path=None, ttl=None, max_entries=10000, max_bytes=100 * 1024 * 1024, bypass=False, refresh=False):
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, "llm_cache.sqlite3")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    @staticmethod
+    def make_key(provider, model, prompt, params=None):
+        """Content address for a request: sha256 over a canonical JSON encoding."""
+        payload = json.dumps(
+            {"provider": provider, "model": model, "prompt": prompt, "params": params or {}},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key):
+        """Returns the cached value for `key`, or None on a miss or an expired entry."""
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            now = time.time()
+            if self.ttl is not None and now - created_at > self.ttl:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            return value
+
+    def set(self, key, value):
+        """Stores `value` (a string) under `key` and evicts entries past the size limits."""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now),
+            )
+            self._evict(conn, now)
+            conn.commit()
+
+    def _evict(self, conn, now):
+        if self.ttl is not None:
+            conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.ttl,))
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if (self.max_entries is None or count <= self.max_entries) and (self.max_bytes is None or total <= self.max_bytes):
+            return
+        # Walk from least recently used and drop until both limits hold
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed_at ASC").fetchall():
+            if (self.max_entries is None or count <= self.max_entries) and (self.max_bytes is None or total <= self.max_bytes):
+                break
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            count -= 1
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM entries")
+            conn.commit()
+
+    def cached(self, provider, model, prompt, params, call, validate=None):
+        """Returns the cached completion for the request, calling `call()` (which must return a string) on a miss.
+
+        `validate(value)`, if given, must not raise for a value to be stored; a stored value that fails it counts
+        as a miss and is replaced. Every request is traced as an llm.<provider> span with its sizes and whether
+        the cache answered it.
+        """
+        with span(f"llm.{provider}", model=model, prompt_chars=len(prompt), cache_hit=False) as current:
+            if self.bypass:
+                value = call()
+            else:
+                key, value = self._lookup(provider, model, prompt, params, current, validate)
+                if value is None:
+                    value = call()
+                    if value and self._valid(value, validate):
+                        self.set(key, value)
+            current.set(completion_chars=len(value or ""))
+            return value
+
+    async def acached(self, provider, model, prompt, params, call, validate=None):
+        """Async version of cached; `call()` returns an awaitable."""
+        with span(f"llm.{provider}", model=model, prompt_chars=len(prompt), cache_hit=False) as current:
+            if self.bypass:
+                value = await call()
+            else:
+                key, value = self._lookup(provider, model, prompt, params, current, validate)
+                if value is None:
+                    value = await call()
+                    if value and self._valid(value, validate):
+                        self.set(key, value)
+            current.set(completion_chars=len(value or ""))
+            return value
+
+    def _lookup(self, provider, model, prompt, params, current, validate=None):
+        """Cache read for cached/acached; counts the hit or miss and marks the span. Returns (key, value or None)."""
+        key = self.make_key(provider, model, prompt, params)
+        value = None if self.refresh else self.get(key)
+        if value is not None and not self._valid(value, validate):
+            value = None  # E.g. malformed JSON cached before validation existed; it gets overwritten
+        if value is not None:
+            self.hits += 1
+            current.set(cache_hit=True)
+        else:
+            self.misses += 1
+        return key, value
+
+    @staticmethod
+    def _valid(value, validate):
+        if validate is None:
+            return True
+        try:
+            validate(value)
+            return True
+        except Exception:
+            return False
+
+
+def _env_number(name, cast, default=None):
+    value = os.getenv(name)
+    return cast(value) if value not in (None, "") else default
+
+
+_default_cache = None
+
+
+def get_cache():
+    """Process-wide cache configured from the LLM_CACHE_* environment variables."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = LLMCache(
+            path=os.getenv("LLM_CACHE_PATH"),
+            ttl=_env_number("LLM_CACHE_TTL", float),
+            max_entries=_env_number("LLM_CACHE_MAX_ENTRIES", int, 10000),
+            max_bytes=_env_number("LLM_CACHE_MAX_BYTES", int, 100 * 1024 * 1024),
+            bypass=os.getenv("LLM_CACHE_BYPASS") == "1",
+            refresh=os.getenv("LLM_CACHE_REFRESH") == "1",
+        )
+    return _default_cache
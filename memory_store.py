@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import deque
+
+from helpers import extractive_summary
+from llm_cache import DEFAULT_CACHE_DIR
+
+MAX_SUMMARY_INPUT_CHARS = 12000  # Keeps a compaction prompt well inside the summarizer's context window
+
+
+class MemoryStore:
+    """Agent memory that stays cheap to read however long the company runs.
+
+    Every entry is appended to a SQLite file shared by all agents (one `owner` per agent), so memory survives
+    restarts. Entries that haven't been summarized yet are kept in RAM: the newest `hot_size` (the hot window)
+    and any older ones still waiting for compaction. Once more than `compact_threshold` (by default hot_size +
+    compact_batch) raw entries pile up on disk, a background thread folds the oldest ones (everything outside the
+    hot window, `compact_batch` at a time) into a summary via `summarize(text)`, and the oldest summaries are
+    folded again once there are more than `max_summaries`. recall() is therefore about max_summaries +
+    compact_threshold items at most.
+    """
+
+    def __init__(self, owner, path=None, hot_size=50, compact_threshold=None, compact_batch=100, max_summaries=20, summarize=None):
+        self.owner = owner
+        self.path = path or os.getenv("AGENT_MEMORY_PATH") or os.path.join(DEFAULT_CACHE_DIR, "agent_memory.sqlite3")
+        self.hot_size = hot_size
+        self.compact_threshold = hot_size + compact_batch if compact_threshold is None else compact_threshold
+        self.compact_batch = compact_batch
+        self.max_summaries = max_summaries
+        self.summarize = summarize or extractive_summary
+        self._lock = threading.RLock()
+        self._compactor = None
+        self._conn = None
+
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(
+                "SELECT instruction, action FROM entries WHERE owner = ? AND kind = 'memory' ORDER BY id", (owner,)
+            ).fetchall()
+            entries = [{"instruction": instruction, "action": action} for instruction, action in rows]
+            split = max(len(entries) - hot_size, 0)
+            self.pending = deque(entries[:split])  # Out of the hot window but not compacted yet, oldest first
+            self.hot = deque(entries[split:], maxlen=hot_size)
+            self.summaries = [
+                {"count": count, "summary": summary}
+                for count, summary in conn.execute("SELECT count, summary FROM summaries WHERE owner = ? ORDER BY id", (owner,))
+            ]
+            self.raw_count = conn.execute("SELECT COUNT(*) FROM entries WHERE owner = ? AND kind = 'memory'", (owner,)).fetchone()[0]
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, owner TEXT NOT NULL, kind TEXT NOT NULL, "
+                "instruction TEXT NOT NULL, action TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_owner ON entries (owner, kind, id)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, owner TEXT NOT NULL, count INTEGER NOT NULL, "
+                "summary TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def append(self, instruction, action):
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT INTO entries (owner, kind, instruction, action, created_at) VALUES (?, 'memory', ?, ?, ?)",
+                (self.owner, str(instruction), str(action), time.time()),
+            )
+            conn.commit()
+            entry = {"instruction": instruction, "action": action}
+            if len(self.hot) == self.hot_size:  # The oldest hot entry is about to drop out of the window
+                self.pending.append(self.hot[0] if self.hot else entry)
+            self.hot.append(entry)
+            self.raw_count += 1
+            if self.raw_count > self.compact_threshold and not self.compacting():
+                self._compactor = threading.Thread(target=self.compact, name=f"memory-compact-{self.owner}", daemon=True)
+                self._compactor.start()
+
+    def recall(self):
+        """Summaries of compacted history (oldest first), then entries waiting for compaction and the hot window,
+        as instruction/action dicts."""
+        with self._lock:
+            folded = [{"instruction": f"Summary of {item['count']} earlier entries", "action": item["summary"]} for item in self.summaries]
+            return folded + list(self.pending) + list(self.hot)
+
+    def contains(self, instruction, action):
+        with self._lock:
+            return any(entry["instruction"] == instruction and entry["action"] == action for entry in (*self.pending, *self.hot))
+
+    def compacting(self):
+        return self._compactor is not None and self._compactor.is_alive()
+
+    def wait(self, timeout=None):
+        """Waits for a running background compaction to finish."""
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join(timeout)
+
+    def compact(self):
+        """Folds raw entries outside the hot window into summaries. The LLM call happens outside the lock."""
+        while True:
+            with self._lock:
+                conn = self._connect()
+                if self.raw_count <= self.hot_size:
+                    break
+                rows = conn.execute(
+                    "SELECT id, instruction, action FROM entries WHERE owner = ? AND kind = 'memory' ORDER BY id LIMIT ?",
+                    (self.owner, min(self.compact_batch, self.raw_count - self.hot_size)),
+                ).fetchall()
+            if not rows:
+                break
+
+            summary = self._summarize("\n".join(f"{instruction}: {action}" for _, instruction, action in rows))
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT INTO summaries (owner, count, summary, created_at) VALUES (?, ?, ?, ?)",
+                    (self.owner, len(rows), summary, time.time()),
+                )
+                conn.execute("DELETE FROM entries WHERE owner = ? AND kind = 'memory' AND id <= ?", (self.owner, rows[-1][0]))
+                conn.commit()
+                self.summaries.append({"count": len(rows), "summary": summary})
+                self.raw_count -= len(rows)
+                for _ in range(min(len(rows), len(self.pending))):
+                    self.pending.popleft()
+
+        if len(self.summaries) > self.max_summaries:
+            self._fold_summaries()
+
+    def _fold_summaries(self):
+        """Merges the oldest half of the summaries into one."""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT id, count, summary FROM summaries WHERE owner = ? ORDER BY id LIMIT ?",
+                (self.owner, max(2, len(self.summaries) // 2)),
+            ).fetchall()
+        count = sum(row[1] for row in rows)
+        summary = self._summarize("\n".join(row[2] for row in rows))
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM summaries WHERE owner = ? AND id <= ?", (self.owner, rows[-1][0]))
+            # Takes the place of the summaries it replaces, so it has to sort first
+            conn.execute(
+                "INSERT INTO summaries (id, owner, count, summary, created_at) VALUES (?, ?, ?, ?, ?)",
+                (rows[0][0], self.owner, count, summary, time.time()),
+            )
+            conn.commit()
+            self.summaries = [{"count": count, "summary": summary}] + self.summaries[len(rows):]
+
+    def _summarize(self, text):
+        text = text[-MAX_SUMMARY_INPUT_CHARS:]
+        try:
+            summary = self.summarize(text)
+            if summary and summary.strip():
+                return summary.strip()
+        except Exception as e:
+            print(f"Memory summarization failed, keeping an extract instead: {e}")
+        return extractive_summary(text)
+
+    def log(self, kind, hot_size=20, max_records=500):
+        """A bounded, persistent list of records (dicts) of one kind, e.g. the Marketer's logos."""
+        return RecordLog(self, kind, hot_size, max_records)
+
+
+class RecordLog:
+    """List-like view over one kind of record: append() persists it, only the newest `hot_size` stay in RAM
+    and only the newest `max_records` on disk."""
+
+    def __init__(self, store, kind, hot_size=20, max_records=500):
+        self.store = store
+        self.kind = kind
+        self.max_records = max_records
+        with store._lock:
+            rows = store._connect().execute(
+                "SELECT action FROM entries WHERE owner = ? AND kind = ? ORDER BY id DESC LIMIT ?",
+                (store.owner, kind, hot_size),
+            ).fetchall()
+        self.items = deque((json.loads(row[0]) for row in reversed(rows)), maxlen=hot_size)
+
+    def append(self, record):
+        with self.store._lock:
+            conn = self.store._connect()
+            conn.execute(
+                "INSERT INTO entries (owner, kind, instruction, action, created_at) VALUES (?, ?, '', ?, ?)",
+                (self.store.owner, self.kind, json.dumps(record, ensure_ascii=False), time.time()),
+            )
+            conn.execute(
+                "DELETE FROM entries WHERE owner = ? AND kind = ? AND id <= "
+                "(SELECT id FROM entries WHERE owner = ? AND kind = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (self.store.owner, self.kind, self.store.owner, self.kind, self.max_records),
+            )
+            conn.commit()
+        self.items.append(record)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        return list(self.items)[index]
@@ -0,0 +1,107 @@
+import re
+import difflib
+
+
+class PatchError(Exception):
+    """Raised when an edit can't be applied: its search block isn't in the file, or it's empty for a non-empty file."""
+
+
+HUNK_HEADER = re.compile(r"^@@ -\d+(?:,(\d+))? \+\d+(?:,(\d+))? @@")
+
+
+def parse_unified_diff(diff_text):
+    """Turns the hunks of a unified diff into search/replace edits (context + removed -> context + added).
+
+    The line counts in each @@ header say where a hunk ends, so a removed line that itself starts with "--"
+    (a markdown rule, an SQL comment) isn't mistaken for a "---" file header. Headers without counts fall back
+    to treating "--- " / "+++ " lines as file headers.
+    """
+    edits = []
+    search, replace = None, None
+    old_left = new_left = None  # Lines the current hunk still has to consume, None if its header had no counts
+    for line in diff_text.splitlines():
+        in_hunk = search is not None and (old_left is None or old_left > 0 or new_left > 0)
+        if line.startswith("@@") and not (in_hunk and old_left is not None):
+            if search is not None:
+                edits.append({"search": "\n".join(search), "replace": "\n".join(replace)})
+            search, replace = [], []
+            counts = HUNK_HEADER.match(line)
+            old_left = new_left = None
+            if counts:
+                old_left = int(counts.group(1)) if counts.group(1) is not None else 1
+                new_left = int(counts.group(2)) if counts.group(2) is not None else 1
+        elif not in_hunk or line.startswith("\\"):
+            continue
+        elif old_left is None and line.startswith(("--- ", "+++ ")):
+            continue
+        elif line.startswith("-"):
+            search.append(line[1:])
+            old_left = old_left - 1 if old_left is not None else None
+        elif line.startswith("+"):
+            replace.append(line[1:])
+            new_left = new_left - 1 if new_left is not None else None
+        else:
+            context = line[1:] if line.startswith(" ") else line
+            search.append(context)
+            replace.append(context)
+            if old_left is not None:
+                old_left, new_left = old_left - 1, new_left - 1
+    if search is not None:
+        edits.append({"search": "\n".join(search), "replace": "\n".join(replace)})
+    return edits
+
+
+def _find_block(lines, search_lines, threshold):
+    """Returns (start, end) of the line window best matching search_lines, ignoring indentation, or None."""
+    size = len(search_lines)
+    if size == 0 or size > len(lines):
+        return None
+    wanted = [line.strip() for line in search_lines]
+    stripped = [line.strip() for line in lines]
+
+    for start in range(len(lines) - size + 1):
+        if stripped[start:start + size] == wanted:
+            return start, start + size
+
+    # Fuzzy pass: the model often gets a word or some whitespace wrong in the context it copies back
+    wanted_text = "\n".join(wanted)
+    best, best_ratio = None, threshold
+    for start in range(len(lines) - size + 1):
+        matcher = difflib.SequenceMatcher(None, "\n".join(stripped[start:start + size]), wanted_text, autojunk=False)
+        if matcher.real_quick_ratio() < best_ratio or matcher.quick_ratio() < best_ratio:
+            continue
+        ratio = matcher.ratio()
+        if ratio >= best_ratio:
+            best, best_ratio = (start, start + size), ratio
+    return best
+
+
+def apply_edits(content, edits, threshold=0.85):
+    """Applies search/replace edits in order. An empty search fills an empty (new) file; for a file with content
+    it's an error, so a bad or truncated edit can't silently replace the whole file."""
+    for edit in edits:
+        search, replace = edit.get("search", ""), edit.get("replace", "")
+        if not search.strip():
+            if content.strip():
+                raise PatchError("edit has an empty search block but the file is not empty")
+            content = replace
+            continue
+        if search in content:
+            content = content.replace(search, replace, 1)
+            continue
+        lines = content.split("\n")
+        block = _find_block(lines, search.strip("\n").split("\n"), threshold)
+        if block is None:
+            raise PatchError(f"could not find a match for:\n{search}")
+        start, end = block
+        replace_lines = replace.strip("\n").split("\n") if replace.strip("\n") else []
+        content = "\n".join(lines[:start] + replace_lines + lines[end:])
+    return content
+
+
+def apply_change(content, change, threshold=0.85):
+    """Applies one file's change in either hunk format: {"edits": [...]} or {"diff": "<unified diff>"}."""
+    edits = change.get("edits")
+    if edits is None:
+        edits = parse_unified_diff(change.get("diff", ""))
+    return apply_edits(content, edits, threshold)
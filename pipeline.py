@@ -0,0 +1,107 @@
+import os
+import json
+import hashlib
+
+from llm_cache import DEFAULT_CACHE_DIR
+from tracing import span
+
+
+class Stage:
+    """One step of a stage pipeline. `prompt` may reference the previous stage's output as {previous_output}."""
+
+    def __init__(self, name, instruction, prompt):
+        self.name = name  # Stage key, e.g. "market_research"
+        self.instruction = instruction  # Human readable label used in memory and Slack, e.g. "Market Research"
+        self.prompt = prompt
+
+    def build_prompt(self, previous_output):
+        return self.prompt.replace("{previous_output}", f"{previous_output}")
+
+    def __repr__(self):
+        return f"Stage(name={self.name}, instruction={self.instruction})"
+
+
+class CheckpointStore:
+    """Stores completed stage outputs for one pipeline run as a small JSON file."""
+
+    def __init__(self, run_id, directory=None):
+        self.run_id = run_id
+        self.directory = directory or os.path.join(DEFAULT_CACHE_DIR, "checkpoints")
+        self.path = os.path.join(self.directory, f"{run_id}.json")
+
+    def load(self):
+        """Returns the completed stages in order as dicts with stage, instruction, output and summary."""
+        if not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                return json.load(file).get("completed", [])
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Ignoring unreadable checkpoint {self.path}: {e}")
+            return []
+
+    def save(self, completed):
+        """Atomically replaces the checkpoint with the given list of completed stages."""
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({"run_id": self.run_id, "completed": completed}, file, ensure_ascii=False, indent=2)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class StagePipeline:
+    """Runs stages in order, checkpointing after each one so a restarted run resumes after the last completed stage.
+    The checkpoint is removed once every stage has run.
+
+    `step(stage, previous_output)` does the work for a stage and returns (output, summary).
+    """
+
+    def __init__(self, stages, store, step):
+        self.stages = list(stages)
+        self.store = store
+        self.step = step
+
+    @staticmethod
+    def run_id_for(prefix, stages, initial_input):
+        """Stable run id so the same input and stage list resume the same checkpoint."""
+        key = json.dumps([initial_input, [stage.name for stage in stages]])
+        return f"{prefix}-{hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]}"
+
+    def completed(self):
+        """Checkpointed stages that still match the current stage list, in order."""
+        completed = []
+        for stage, record in zip(self.stages, self.store.load()):
+            if record.get("stage") != stage.name:
+                break  # Stage list changed since the checkpoint was written
+            completed.append(record)
+        return completed
+
+    def run(self, initial_input, resume=True):
+        """Runs the remaining stages and returns the list of all completed stage records."""
+        completed = self.completed() if resume else []
+        if not resume:
+            self.store.clear()
+        previous_output = completed[-1]["output"] if completed else initial_input
+        if completed:
+            print(f"Resuming after stage '{completed[-1]['stage']}' ({len(completed)}/{len(self.stages)} done).")
+
+        with span("pipeline.run", run_id=self.store.run_id, resumed=len(completed)):
+            for stage in self.stages[len(completed):]:
+                with span("pipeline.stage", stage=stage.name):
+                    output, summary = self.step(stage, previous_output)
+                completed.append({
+                    "stage": stage.name,
+                    "instruction": stage.instruction,
+                    "output": output,
+                    "summary": summary,
+                })
+                self.store.save(completed)
+                previous_output = output
+        self.store.clear()  # Finished: only an interrupted run should resume, the next one starts over
+        return completed
@@ -0,0 +1,96 @@
+import os
+import json
+import hashlib
+
+from llm_cache import DEFAULT_CACHE_DIR
+
+
+class ProjectIndex:
+    """Persistent map of project files to their last read result, keyed by relative path, mtime and size.
+
+    A file is only read again when its mtime or size changed since it was indexed, so re-mapping an
+    unchanged project costs one stat per file instead of a full read.
+    """
+
+    def __init__(self, project_path, index_path=None):
+        self.project_path = os.path.abspath(project_path)
+        if index_path is None:
+            digest = hashlib.sha256(self.project_path.encode("utf-8")).hexdigest()[:16]
+            index_path = os.path.join(DEFAULT_CACHE_DIR, "project_index", f"{digest}.json")
+        self.index_path = index_path
+        self.entries = {}  # rel_path -> {"mtime_ns", "size", "record"}
+        self.dirty = False
+        self.reads = 0  # Files actually read since the last save, handy for checking the index works
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get("project_path") == self.project_path:
+                self.entries = data.get("entries", {})
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Ignoring unreadable project index {self.index_path}: {e}")
+
+    def save(self):
+        """Writes the index to disk if anything changed."""
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({"project_path": self.project_path, "entries": self.entries}, file, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+        self.dirty = False
+        self.reads = 0
+
+    def relpath(self, full_path):
+        return os.path.relpath(os.path.abspath(full_path), self.project_path)
+
+    def lookup(self, full_path, stat=None):
+        """Returns the indexed record for a file if it is still fresh, otherwise None."""
+        entry = self.entries.get(self.relpath(full_path))
+        if entry is None:
+            return None
+        stat = stat or os.stat(full_path)
+        if entry["mtime_ns"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+            return None
+        return entry["record"]
+
+    def store(self, full_path, record, stat=None):
+        """Indexes `record` as the current read result for a file."""
+        stat = stat or os.stat(full_path)
+        self.entries[self.relpath(full_path)] = {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "record": record,
+        }
+        self.dirty = True
+
+    def read(self, full_path, reader):
+        """Returns the record for a file, calling `reader(full_path)` only if the file changed."""
+        stat = os.stat(full_path)
+        record = self.lookup(full_path, stat)
+        if record is None:
+            record = reader(full_path)
+            self.reads += 1
+            self.store(full_path, record, stat)
+        return record
+
+    def update_file(self, full_path, content):
+        """Indexes content we just wrote ourselves, without reading the file back."""
+        self.store(full_path, {
+            'content': content,
+            'size': len(content),
+            'extension': os.path.splitext(full_path)[1]
+        })
+
+    def prune(self, directory, seen):
+        """Drops entries under `directory` whose files were not seen in the latest walk."""
+        prefix = self.relpath(directory) + os.sep
+        seen = {self.relpath(path) for path in seen}
+        for rel_path in [p for p in self.entries if p.startswith(prefix) and p not in seen]:
+            del self.entries[rel_path]
+            self.dirty = True
@@ -0,0 +1,183 @@
+import os
+import re
+import threading
+from tokenizers import Tokenizer
+from huggingface_hub import hf_hub_download
+
+# Context window (prompt + completion) per model
+CONTEXT_WINDOWS = {
+    "llama3-70b-8192": 8192,
+    "command-r-08-2024": 128000,
+    "command-xlarge-nightly": 4096,
+    "default": 128000,  # Cohere chat without an explicit model
+}
+
+# Hugging Face tokenizer per provider, overridable with COHERE_TOKENIZER / GROQ_TOKENIZER (a hub name or a tokenizer.json path)
+TOKENIZER_NAMES = {
+    "cohere": os.getenv("COHERE_TOKENIZER", "Cohere/command-nightly"),
+    "groq": os.getenv("GROQ_TOKENIZER", "Xenova/llama-3-tokenizer"),
+}
+
+CHARS_PER_TOKEN = 3.5  # Conservative estimate used when no tokenizer can be loaded
+# Seconds the hub lookup may take before the download gives up. Reading the file itself stops after
+# HF_HUB_DOWNLOAD_TIMEOUT seconds (10 by default) without data, so a stalled download can't hold up exit for long.
+TOKENIZER_TIMEOUT = float(os.getenv("TOKENIZER_TIMEOUT", "10"))
+
+_tokenizers = {}  # provider -> Tokenizer, or None if it couldn't be loaded
+_loading = {}  # provider -> thread downloading its tokenizer
+_lock = threading.Lock()
+
+
+def load_tokenizer(provider, wait=False):
+    """The tokenizer for a provider, memoized. Returns None if it can't be loaded (e.g. offline).
+
+    A tokenizer that has to come from the Hugging Face hub is downloaded on a background thread, and until
+    it's there this returns None so token counts are estimated; pass wait=True to block for it instead.
+    """
+    with _lock:
+        if provider in _tokenizers:
+            return _tokenizers[provider]
+        name = TOKENIZER_NAMES.get(provider)
+        if not name or os.path.exists(name):
+            _tokenizers[provider] = _read_tokenizer(name)  # A local file is quick to read
+            return _tokenizers[provider]
+        if provider not in _loading:
+            _loading[provider] = threading.Thread(target=_download_tokenizer, args=(provider, name), name=f"tokenizer-{provider}")
+            _loading[provider].start()
+        thread = _loading[provider]
+    if wait:
+        thread.join()
+    return _tokenizers.get(provider)
+
+
+def _read_tokenizer(name):
+    if not name:
+        return None
+    try:
+        if not os.path.exists(name):
+            name = hf_hub_download(name, "tokenizer.json", etag_timeout=TOKENIZER_TIMEOUT)
+        return Tokenizer.from_file(name)
+    except Exception as e:
+        print(f"Could not load tokenizer {name} ({e}); estimating token counts instead.")
+        return None
+
+
+def _download_tokenizer(provider, name):
+    tokenizer = _read_tokenizer(name)
+    with _lock:
+        _tokenizers[provider] = tokenizer
+
+
+def compact_whitespace(text):
+    """Cheap compaction for code and logs: strips trailing spaces and squeezes runs of blank lines."""
+    text = re.sub(r"[ \t]+\n", "\n", text)
+    return re.sub(r"\n{3,}", "\n\n", text)
+
+
+class Section:
+    """A piece of a prompt.
+
+    Sections with a lower `priority` are trimmed first; `priority=None` means the section is never trimmed.
+    `keep` says which end survives trimming ("head" or "tail"), `compact` is tried before trimming, and
+    `min_tokens` is the size below which the section is dropped instead of cut further. `tokens` is an
+    already known token count for `text`, so static sections aren't re-counted on every prompt.
+    """
+
+    def __init__(self, name, text, priority=None, keep="head", compact=None, min_tokens=0, tokens=None):
+        self.name = name
+        self.text = text
+        self.priority = priority
+        self.keep = keep
+        self.compact = compact
+        self.min_tokens = min_tokens
+        self.tokens = tokens
+
+    def __repr__(self):
+        return f"Section(name={self.name}, priority={self.priority}, chars={len(self.text)})"
+
+
+class PromptBudget:
+    """Measures prompt sections in tokens, trims the low priority ones to fit the model's window and sizes max_tokens."""
+
+    def __init__(self, provider, model, context_window=None, min_output_tokens=64):
+        self.provider = provider
+        self.model = model
+        self.context_window = context_window or CONTEXT_WINDOWS.get(model, 8192)
+        self.min_output_tokens = min_output_tokens
+        self.last_report = {}
+        load_tokenizer(provider)  # Starts a hub download now, so it's usually done before the first prompt
+
+    @property
+    def tokenizer(self):
+        return load_tokenizer(self.provider)
+
+    def count(self, text):
+        """Token count of `text` (estimated if the tokenizer is unavailable)."""
+        if not text:
+            return 0
+        tokenizer = self.tokenizer
+        if tokenizer is None:
+            return int(len(text) / CHARS_PER_TOKEN) + 1
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+    def truncate(self, text, max_tokens, keep="head"):
+        """Cuts `text` to at most `max_tokens`, keeping its head or tail, and marks the cut."""
+        if max_tokens <= 0:
+            return ""
+        tokenizer = self.tokenizer
+        marker = "\n...[truncated]...\n"
+        if tokenizer is None:
+            limit = max(int(max_tokens * CHARS_PER_TOKEN) - len(marker), 0)
+            if len(text) <= limit:
+                return text
+            return text[:limit] + marker if keep == "head" else marker + text[-limit:]
+        encoding = tokenizer.encode(text, add_special_tokens=False)
+        if len(encoding.ids) <= max_tokens:
+            return text
+        budget = max(max_tokens - self.count(marker), 0)
+        if budget == 0:
+            return ""
+        if keep == "head":
+            return text[:encoding.offsets[budget - 1][1]] + marker
+        return marker + text[encoding.offsets[-budget][0]:]
+
+    def fit(self, sections, reserve_output_tokens=None):
+        """Joins sections into one prompt that leaves `reserve_output_tokens` (default min_output_tokens) of the window free."""
+        reserve = self.min_output_tokens if reserve_output_tokens is None else reserve_output_tokens
+        available = self.context_window - reserve
+        texts = {section.name: section.text for section in sections}
+        sizes = {section.name: section.tokens if section.tokens is not None else self.count(section.text) for section in sections}
+        overflow = sum(sizes.values()) - available
+
+        trimmed = []
+        trimmable = sorted((s for s in sections if s.priority is not None), key=lambda s: s.priority)
+        for section in trimmable:
+            if overflow <= 0:
+                break
+            if section.compact is not None:
+                compacted = section.compact(texts[section.name])
+                size = self.count(compacted)
+                overflow -= sizes[section.name] - size
+                texts[section.name], sizes[section.name] = compacted, size
+                if overflow <= 0:
+                    trimmed.append(section.name)
+                    break
+            target = sizes[section.name] - overflow
+            if target < section.min_tokens:
+                target = 0
+            text = self.truncate(texts[section.name], target, section.keep)
+            size = self.count(text)
+            overflow -= sizes[section.name] - size
+            texts[section.name], sizes[section.name] = text, size
+            trimmed.append(section.name)
+
+        prompt = "".join(texts[section.name] for section in sections)
+        self.last_report = {"sections": sizes, "prompt_tokens": sum(sizes.values()), "trimmed": trimmed}
+        if trimmed:
+            print(f"Prompt over budget for {self.model}, trimmed: {', '.join(trimmed)}")
+        return prompt
+
+    def max_output(self, prompt, desired):
+        """max_tokens for a completion: `desired`, capped by what is left of the window after `prompt`."""
+        left = self.context_window - self.count(prompt)
+        return max(min(desired, left), min(self.min_output_tokens, max(left, 1)))
@@ -0,0 +1,89 @@
+import hashlib
+import threading
+
+from prompt_budget import Section
+
+TEMPLATES = []  # Every template created, for stability_report()
+
+
+class PromptTemplate:
+    """A prompt with a fixed layout: static prefix, then role context, then the volatile tail.
+
+    Providers cache the longest prompt prefix they've seen recently, so everything that never changes goes
+    first and everything that changes every round goes last. The prefix is rendered (and token counted)
+    once, role context once per role key. Each render records the hash of its stable part (prefix + role);
+    report() says how often that part repeated an earlier one, i.e. how often the provider could reuse it.
+    """
+
+    def __init__(self, name, prefix, budget=None):
+        self.name = name
+        self.prefix = prefix
+        self.budget = budget
+        self.prefix_tokens = budget.count(prefix) if budget else None
+        self.roles = {}  # role key -> (text, tokens)
+        self.renders = 0
+        self.reused = 0
+        self.stable_tokens = 0
+        self.prompt_tokens = 0
+        self._hashes = set()
+        self._lock = threading.Lock()
+        TEMPLATES.append(self)
+
+    def role(self, key, render):
+        """Role context for `key`, rendered by `render()` the first time it's asked for."""
+        if key not in self.roles:
+            text = render()
+            self.roles[key] = (text, self.budget.count(text) if self.budget else None)
+        return self.roles[key]
+
+    def render(self, tail, role_key=None, role_render=None, reserve_output_tokens=None):
+        """Builds the prompt from the cached prefix/role and `tail`, a list of Sections (or one string).
+
+        Only tail sections are ever trimmed to fit the budget, so the stable part is byte-identical across calls.
+        """
+        if isinstance(tail, str):
+            tail = [Section("tail", tail)]
+        role_text, role_tokens = self.role(role_key, role_render) if role_render is not None else ("", 0)
+        stable = self.prefix + role_text
+
+        if self.budget is not None:
+            prompt = self.budget.fit(
+                [Section("prefix", self.prefix, tokens=self.prefix_tokens), Section("role", role_text, tokens=role_tokens)] + list(tail),
+                reserve_output_tokens=reserve_output_tokens,
+            )
+            stable_tokens, prompt_tokens = self.prefix_tokens + role_tokens, self.budget.last_report["prompt_tokens"]
+        else:
+            prompt = stable + "".join(section.text for section in tail)
+            stable_tokens, prompt_tokens = len(stable), len(prompt)  # Characters when there is no budget to count with
+
+        digest = hashlib.sha1(stable.encode("utf-8")).hexdigest()
+        with self._lock:
+            self.renders += 1
+            if digest in self._hashes:
+                self.reused += 1
+            self._hashes.add(digest)
+            self.stable_tokens += stable_tokens
+            self.prompt_tokens += prompt_tokens
+        return prompt
+
+    def report(self):
+        return {
+            "template": self.name,
+            "renders": self.renders,
+            "distinct_prefixes": len(self._hashes),
+            "prefix_reuse": self.reused / self.renders if self.renders else 0.0,
+            "stable_share": self.stable_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+        }
+
+
+def stability_report():
+    """One line per template that has been rendered: how often its stable prefix repeated, and how much of the prompt it is."""
+    lines = []
+    for template in TEMPLATES:
+        if template.renders:
+            stats = template.report()
+            lines.append(
+                f"{stats['template']}: {stats['renders']} renders, {stats['distinct_prefixes']} distinct prefixes, "
+                f"{stats['prefix_reuse']:.0%} reused, {stats['stable_share']:.0%} of prompt tokens stable"
+            )
+    return "\n".join(lines)
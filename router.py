@@ -0,0 +1,145 @@
+import os
+import re
+import json
+import time
+import threading
+
+# Extra words that point at a role besides the role's own name
+ROLE_ALIASES = {
+    "CEO": ["chief executive"],
+    "CTO": ["chief technology officer", "engineering"],
+    "Marketer": ["marketing", "branding"],
+}
+
+SLACK_MENTION = re.compile(r"<@([A-Z0-9]+)(?:\|[^>]*)?>")
+
+
+class RoutingDecision:
+    def __init__(self, employee_id, confidence, reason, escalate=False, scores=None):
+        self.employee_id = employee_id
+        self.confidence = confidence
+        self.reason = reason
+        self.escalate = escalate  # True when the manager LLM should make the call instead
+        self.scores = scores or {}
+
+    def __repr__(self):
+        return f"RoutingDecision(employee_id={self.employee_id}, confidence={self.confidence:.2f}, reason={self.reason}, escalate={self.escalate})"
+
+
+class LocalRouter:
+    """Picks the next speaker of a discussion round without an LLM call when the answer is obvious.
+
+    Handles the common cases: a Slack `<@id>` mention, a name or role mentioned in the latest message,
+    a single remaining candidate, and two employees going back and forth. The last speaker is never picked.
+    Anything below `min_confidence`, and every `escalate_every`-th round in a row decided locally (so the
+    manager still checks progress and picks a fresh topic), is escalated to the LLM. With ROUTING_LOG set (or a
+    `log_path`), every decision is appended to that JSONL file so the heuristics can be tuned against what the
+    LLM would have done.
+    """
+
+    def __init__(self, employees, aliases=None, min_confidence=0.75, escalate_every=3, log_path=None, enabled=True):
+        self.employees = employees  # {id: agent}
+        self.min_confidence = min_confidence
+        self.escalate_every = escalate_every
+        self.enabled = enabled
+        self.log_path = log_path if log_path is not None else os.getenv("ROUTING_LOG")  # Off unless asked for; it holds message text
+        self.local_streak = 0  # Rounds decided locally since the last LLM call
+        self.patterns = self.build_patterns(aliases or {})
+        self._lock = threading.Lock()
+
+    def build_patterns(self, aliases):
+        """One word-boundary regex per employee over their full name, first name, role and any extra aliases."""
+        patterns = {}
+        for employee_id, agent in self.employees.items():
+            words = [agent.name, agent.name.split()[0], agent.role] + list(aliases.get(employee_id, []))
+            words += [extra for word in words for extra in ROLE_ALIASES.get(word, [])]
+            words = sorted({word.strip() for word in words if word and word.strip()}, key=len, reverse=True)
+            patterns[employee_id] = re.compile(r"\b(?:" + "|".join(re.escape(word) for word in words) + r")\b", re.IGNORECASE)
+        return patterns
+
+    def route(self, messages, event=None):
+        """Decides who replies to `messages` (newest first). Returns a RoutingDecision."""
+        if not self.enabled or not messages:
+            return RoutingDecision(None, 0.0, "local routing disabled" if not self.enabled else "no messages", escalate=True)
+
+        last_speaker = messages[0].get("user")
+        candidates = [employee_id for employee_id in self.employees if employee_id != last_speaker]
+        decision = self.decide(messages, candidates)
+
+        if decision.confidence < self.min_confidence:
+            decision.escalate = True
+        elif self.escalate_every and self.local_streak >= self.escalate_every:
+            decision.escalate = True
+            decision.reason += "; periodic progress check"
+        return decision
+
+    def decide(self, messages, candidates):
+        if not candidates:
+            return RoutingDecision(None, 0.0, "no candidates besides the last speaker")
+        if len(candidates) == 1:
+            return RoutingDecision(candidates[0], 1.0, "only one candidate left")
+
+        text = messages[0].get("text", "")
+
+        # Explicit Slack mentions are unambiguous
+        mentioned = [employee_id for employee_id in SLACK_MENTION.findall(text) if employee_id in candidates]
+        if mentioned:
+            confidence = 1.0 if len(set(mentioned)) == 1 else 0.8
+            return RoutingDecision(mentioned[0], confidence, "slack mention", scores={employee_id: 1.0 for employee_id in mentioned})
+
+        # Names and roles; the earliest mention in the message wins, several different ones lower the confidence
+        positions = {}
+        for employee_id in candidates:
+            match = self.patterns[employee_id].search(text)
+            if match:
+                positions[employee_id] = match.start()
+        if positions:
+            first = min(positions, key=positions.get)
+            confidence = 0.9 if len(positions) == 1 else 0.7
+            return RoutingDecision(first, confidence, "name or role mention", scores={employee_id: 0.9 for employee_id in positions})
+
+        # Back-and-forth: hand the turn back to whoever spoke before the last speaker
+        speakers = []
+        for message in messages:
+            user = message.get("user")
+            if not speakers or speakers[-1] != user:
+                speakers.append(user)
+        if len(speakers) > 1 and speakers[1] in candidates:
+            alternating = len(speakers) > 2 and speakers[2] == speakers[0]
+            confidence = 0.8 if alternating else 0.6
+            return RoutingDecision(speakers[1], confidence, "alternating speakers", scores={speakers[1]: confidence})
+
+        # Otherwise whoever has been quiet the longest; a guess, so it escalates
+        seen = {user: index for index, user in reversed(list(enumerate(speakers)))}
+        quietest = max(candidates, key=lambda employee_id: seen.get(employee_id, len(speakers)))
+        return RoutingDecision(quietest, 0.5, "quietest candidate", scores={quietest: 0.5})
+
+    def record(self, messages, event, decision, employee_id, source, elapsed, llm_response=None):
+        """Logs the full routing decision and updates the local streak."""
+        self.local_streak = self.local_streak + 1 if source == "local" else 0
+        if not self.log_path:
+            return
+        entry = {
+            "time": time.time(),
+            "event": getattr(event, "name", None),
+            "last_speaker": messages[0].get("user") if messages else None,
+            "latest_text": messages[0].get("text", "")[:500] if messages else "",
+            "speakers": [message.get("user") for message in messages],
+            "local_choice": decision.employee_id,
+            "confidence": decision.confidence,
+            "reason": decision.reason,
+            "scores": decision.scores,
+            "escalated": decision.escalate,
+            "source": source,
+            "chosen": employee_id,
+            "agreed": decision.employee_id == employee_id,
+            "llm_response": llm_response,
+            "elapsed_ms": round(elapsed * 1000, 3),
+        }
+        try:
+            with self._lock:
+                os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+                with open(self.log_path, 'a', encoding='utf-8') as file:
+                    file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"Could not write routing log: {e}")
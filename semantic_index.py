@@ -0,0 +1,118 @@
+import base64
+import threading
+
+import numpy as np
+
+from tracing import span, record_usage
+
+EMBED_MODEL = "embed-english-v3.0"
+EMBED_BATCH = 96  # Cohere accepts at most 96 texts per embed call
+MAX_EMBED_CHARS = 2000  # Long memory entries are embedded by their start
+
+
+def cohere_embedder(cohere_client, model=EMBED_MODEL):
+    """embed(texts, input_type) backed by a Cohere client."""
+    def embed(texts, input_type):
+        return record_usage(cohere_client.embed(texts=texts, model=model, input_type=input_type, truncate="END")).embeddings
+    return embed
+
+
+class SemanticIndex:
+    """Embedding index over short text items: a growing NumPy matrix of unit vectors, searched by cosine similarity.
+
+    add() only embeds items whose key it hasn't seen, in batches, and appends them to the matrix (which grows
+    by doubling). search() embeds the query and scores every item with one matrix-vector product, then takes
+    the top k with argpartition. Embeddings go through the shared LLM cache, so re-indexing after a restart
+    doesn't pay for them again.
+    """
+
+    def __init__(self, embed, llm_cache=None, model=EMBED_MODEL, initial_capacity=256):
+        self.embed = embed
+        self.llm_cache = llm_cache
+        self.model = model
+        self.items = []  # Row i of the matrix belongs to items[i]
+        self.positions = {}  # key -> row
+        self.vectors = None
+        self.capacity = initial_capacity
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, items):
+        """Indexes dicts with a unique "key" and a "text" (other fields are handed back by search). Returns how many were new."""
+        new, keys = [], set()
+        for item in items:
+            if item["key"] in self.positions or item["key"] in keys or not item["text"].strip():
+                continue
+            keys.add(item["key"])
+            new.append(item)
+        if not new:
+            return 0
+        vectors = self.embed_texts([item["text"] for item in new], "search_document")
+        with self._lock:
+            # Another thread may have indexed some of these while we were embedding
+            fresh = [(item, vector) for item, vector in zip(new, vectors) if item["key"] not in self.positions]
+            if fresh:
+                self._append(np.vstack([vector for _, vector in fresh]))
+                for item, _ in fresh:
+                    self.positions[item["key"]] = len(self.items)
+                    self.items.append(item)
+        return len(fresh)
+
+    def search(self, query, k=5, exclude=(), min_score=0.0):
+        """Returns up to k (item, score) pairs, best first, skipping items whose key is in `exclude`."""
+        if not self.items or not query.strip():
+            return []
+        query_vector = self.embed_texts([query], "search_query")[0]
+        with self._lock:
+            size = len(self.items)
+            scores = self.vectors[:size] @ query_vector
+            excluded = [self.positions[key] for key in exclude if key in self.positions]
+            scores[excluded] = -np.inf
+            k = min(k, size)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self.items[index], float(scores[index])) for index in top if scores[index] > min_score]
+
+    def embed_texts(self, texts, input_type):
+        """Unit-length float32 embeddings for `texts`, from the cache where possible and in batches otherwise."""
+        texts = [text[:MAX_EMBED_CHARS] for text in texts]
+        vectors = [None] * len(texts)
+        cache = self.llm_cache if self.llm_cache is not None and not self.llm_cache.bypass else None
+        keys = [self.llm_cache.make_key("cohere", self.model, text, {"input_type": input_type}) for text in texts] if cache else []
+
+        misses = []
+        for index in range(len(texts)):
+            value = cache.get(keys[index]) if cache and not cache.refresh else None
+            if value is not None:
+                vectors[index] = np.frombuffer(base64.b64decode(value), dtype=np.float32)
+            else:
+                misses.append(index)
+
+        for start in range(0, len(misses), EMBED_BATCH):
+            batch = misses[start:start + EMBED_BATCH]
+            with span("llm.embed", model=self.model, input_type=input_type, texts=len(batch), cached=len(texts) - len(misses)):
+                embeddings = self.embed([texts[index] for index in batch], input_type)
+            for index, vector in zip(batch, embeddings):
+                vectors[index] = np.asarray(vector, dtype=np.float32)
+                if cache:
+                    cache.set(keys[index], base64.b64encode(vectors[index].tobytes()).decode("ascii"))
+
+        matrix = np.vstack(vectors)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    def _append(self, vectors):
+        size = len(self.items)
+        if self.vectors is None:
+            self.capacity = max(self.capacity, len(vectors))
+            self.vectors = np.zeros((self.capacity, vectors.shape[1]), dtype=np.float32)
+        elif size + len(vectors) > len(self.vectors):
+            capacity = len(self.vectors)
+            while capacity < size + len(vectors):
+                capacity *= 2
+            grown = np.zeros((capacity, self.vectors.shape[1]), dtype=np.float32)
+            grown[:size] = self.vectors[:size]
+            self.vectors = grown
+        self.vectors[size:size + len(vectors)] = vectors
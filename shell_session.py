@@ -0,0 +1,207 @@
+import os
+import re
+import time
+import uuid
+import atexit
+import codecs
+import fcntl
+import select
+import signal
+import termios
+import subprocess
+
+COMMAND_TIMEOUT = 120.0  # Seconds a command may run before it's interrupted
+MAX_OUTPUT = 64 * 1024  # Characters of output kept per command: the head and tail halves, the middle is dropped
+INTERRUPT_GRACE = 2.0  # Seconds to wait for the shell to come back after Ctrl-C before restarting it
+SYNC_ATTEMPTS = 4
+READ_SIZE = 4096
+
+
+class CommandResult:
+    def __init__(self, output, exit_code, timed_out=False, truncated=0):
+        self.output = output
+        self.exit_code = exit_code
+        self.timed_out = timed_out
+        self.truncated = truncated  # Characters dropped from the middle of the output
+
+    def status(self):
+        if self.timed_out:
+            return "timed out"
+        return "shell exited" if self.exit_code is None else f"exit code {self.exit_code}"
+
+    def __str__(self):
+        return f"{self.output.rstrip()}\n[{self.status()}]".lstrip()
+
+
+class _Capture:
+    """Keeps the first and last `limit / 2` characters written to it."""
+
+    def __init__(self, limit):
+        self.half = limit // 2
+        self.head = []
+        self.head_size = 0
+        self.tail = ""
+        self.dropped = 0
+
+    def write(self, text):
+        if self.head_size < self.half:
+            taken = text[:self.half - self.head_size]
+            self.head.append(taken)
+            self.head_size += len(taken)
+            text = text[len(taken):]
+        self.tail += text
+        if len(self.tail) > self.half:
+            self.dropped += len(self.tail) - self.half
+            self.tail = self.tail[-self.half:]
+
+    def value(self):
+        gap = f"\n[... {self.dropped} characters truncated ...]\n" if self.dropped else ""
+        return "".join(self.head) + gap + self.tail
+
+
+class ShellSession:
+    """One long-lived bash on a pseudo-terminal, so cd, exported variables and activated environments carry over
+    between commands and each command skips shell startup.
+
+    run() writes the command followed by a printf of a per-session marker and $?, then reads the terminal until
+    the marker comes back, which gives the exit code. Output is passed to `on_output` as it arrives. A command
+    that runs past its timeout gets Ctrl-C; if the shell doesn't answer after that it's restarted (state lost).
+    stdin is /dev/null for commands, so nothing can sit waiting for input.
+    """
+
+    def __init__(self, cwd=None, env=None, timeout=COMMAND_TIMEOUT, max_output=MAX_OUTPUT):
+        self.cwd = cwd
+        self.env = env
+        self.timeout = timeout
+        self.max_output = max_output
+        self.process = None
+        self.fd = None
+        self._marker = uuid.uuid4().hex
+        # The marker is printed in two halves so the command text itself can never match it, and numbered so a
+        # late marker from an interrupted command isn't taken for the current one's
+        self._pattern = re.compile(rf"\n?__SHELL_DONE_{self._marker}_(\d+)__ (-?\d+)\n")
+        self._sequence = 0
+        self._pending = ""
+        atexit.register(self.close)
+
+    def start(self):
+        master, slave = os.openpty()
+        attributes = termios.tcgetattr(slave)
+        attributes[3] &= ~termios.ECHO  # Don't echo commands back into the output
+        termios.tcsetattr(slave, termios.TCSANOW, attributes)
+        env = dict(os.environ if self.env is None else self.env, PS1="", PS2="", PROMPT_COMMAND="", TERM="dumb",
+                   PAGER="cat", GIT_PAGER="cat", HISTFILE="")
+        self.process = subprocess.Popen(
+            ["bash", "--noprofile", "--norc", "--noediting", "-i"],
+            stdin=slave, stdout=slave, stderr=slave, cwd=self.cwd, env=env,
+            start_new_session=True,
+            preexec_fn=lambda: fcntl.ioctl(0, termios.TIOCSCTTY, 0),  # The pty becomes the controlling terminal, so Ctrl-C works
+        )
+        os.close(slave)
+        self.fd = master
+        self._pending = ""
+        if self._sync(INTERRUPT_GRACE * 5) is None:  # Swallow anything bash prints on startup
+            self.close()
+            raise RuntimeError("Shell session did not start")
+
+    def working_directory(self):
+        """The shell's current directory (it follows the commands' cd)."""
+        if not self.alive():
+            return self.cwd or os.getcwd()
+        try:
+            return os.readlink(f"/proc/{self.process.pid}/cwd")
+        except OSError:
+            return self.run("pwd", timeout=INTERRUPT_GRACE).output.strip()
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def run(self, command, timeout=None, on_output=None):
+        """Runs `command` in the session and returns a CommandResult once it finishes or times out."""
+        if not self.alive():
+            self.close()
+            self.start()
+        timeout = self.timeout if timeout is None else timeout
+        capture = _Capture(self.max_output)
+        deadline = time.monotonic() + timeout
+        self._write(f"{{ {command}\n}} < /dev/null\n{self._sentinel()}")
+        exit_code = self._read_until_marker(deadline, capture, on_output)
+        if exit_code is None and time.monotonic() < deadline:
+            exit_code = self.process.wait()  # The command ended the shell, e.g. `exit 3`
+        if exit_code is not None:
+            return CommandResult(capture.value(), exit_code, truncated=capture.dropped)
+        # Timed out: interrupt the foreground job and check the shell is still answering. Bash may drop input
+        # that arrives while it handles the interrupt, so the check is sent a few times.
+        os.write(self.fd, b"\x03")
+        for _ in range(SYNC_ATTEMPTS):
+            if self._sync(INTERRUPT_GRACE / SYNC_ATTEMPTS) is not None:
+                break
+        else:
+            print(f"Shell did not recover from interrupting `{command}`, restarting it.")
+            self.close()
+        return CommandResult(capture.value(), None, timed_out=True, truncated=capture.dropped)
+
+    def _sentinel(self):
+        self._sequence += 1
+        return f"printf '\\n%s%s %s\\n' __SHELL_DONE_ '{self._marker}_{self._sequence}__' \"$?\"\n"
+
+    def _write(self, text):
+        data = text.encode()
+        while data:
+            data = data[os.write(self.fd, data):]
+
+    def _sync(self, timeout):
+        """Sends a bare marker and drops everything up to it. Returns its exit code, or None if it never came."""
+        self._write(self._sentinel())
+        return self._read_until_marker(time.monotonic() + timeout, _Capture(0), None)
+
+    def _read_until_marker(self, deadline, capture, on_output):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        keep = len(self._marker) + 32  # Enough to hold a marker split across reads
+        while True:
+            match = self._pattern.search(self._pending)
+            if match:
+                self._emit(self._pending[:match.start()], capture, on_output)
+                self._pending = self._pending[match.end():]
+                if int(match.group(1)) == self._sequence:
+                    return int(match.group(2))
+                continue  # A stale marker; drop it
+            if len(self._pending) > keep:
+                self._emit(self._pending[:-keep], capture, on_output)
+                self._pending = self._pending[-keep:]
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            ready, _, _ = select.select([self.fd], [], [], remaining)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except OSError:  # EIO: the shell exited
+                data = b""
+            if not data:
+                self._emit(self._pending, capture, on_output)
+                self._pending = ""
+                return None
+            self._pending += decoder.decode(data).replace("\r\n", "\n")
+
+    @staticmethod
+    def _emit(text, capture, on_output):
+        if not text:
+            return
+        capture.write(text)
+        if on_output is not None:
+            on_output(text)
+
+    def close(self):
+        if self.process is not None:
+            if self.process.poll() is None:
+                try:
+                    os.killpg(self.process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            self.process.wait()
+            self.process = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
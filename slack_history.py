@@ -0,0 +1,82 @@
+from tracing import span
+
+
+class ChannelHistory:
+    """Keeps a local, deduplicated transcript of a Slack channel and only asks Slack for messages newer than the last one seen."""
+
+    def __init__(self, channel_id, window=6, max_transcript=500):
+        self.channel_id = channel_id
+        self.window_size = window  # How many messages the first fetch pulls in
+        self.max_transcript = max_transcript  # Oldest messages are dropped past this
+        self.latest_ts = None  # ts of the newest message seen so far, used as the `oldest=` cursor
+        self.transcript = []  # Messages oldest -> newest
+        self._seen = set()
+
+    def fetch(self, slack_client):
+        """Fetches new messages with the sync WebClient. Returns the new messages, oldest first."""
+        messages = []
+        cursor = None
+        with span("slack.conversations_history", channel=self.channel_id) as current:
+            while True:
+                response = slack_client.conversations_history(**self._request_args(cursor))
+                current.add("pages")
+                messages.extend(response['messages'])
+                cursor = self._next_cursor(response)
+                if not cursor:
+                    break
+            new = self._merge(messages)
+            current.set(messages=len(messages), new_messages=len(new))
+        return new
+
+    async def afetch(self, async_slack_client):
+        """Async version of fetch."""
+        messages = []
+        cursor = None
+        with span("slack.conversations_history", channel=self.channel_id) as current:
+            while True:
+                response = await async_slack_client.conversations_history(**self._request_args(cursor))
+                current.add("pages")
+                messages.extend(response['messages'])
+                cursor = self._next_cursor(response)
+                if not cursor:
+                    break
+            new = self._merge(messages)
+            current.set(messages=len(messages), new_messages=len(new))
+        return new
+
+    def window(self, size=None):
+        """Returns the last `size` messages newest first, the same shape conversations_history gives."""
+        size = size or self.window_size
+        return self.transcript[-size:][::-1]
+
+    def _request_args(self, cursor):
+        if self.latest_ts is None:
+            # First fetch for this channel: just grab the recent window, no paging
+            return {"channel": self.channel_id, "limit": self.window_size}
+        args = {"channel": self.channel_id, "oldest": self.latest_ts, "limit": 100}
+        if cursor:
+            args["cursor"] = cursor
+        return args
+
+    def _next_cursor(self, response):
+        if self.latest_ts is None or not response.get('has_more'):
+            return None
+        return (response.get('response_metadata') or {}).get('next_cursor') or None
+
+    def _merge(self, messages):
+        new = []
+        for message in sorted(messages, key=lambda m: float(m['ts'])):
+            if message['ts'] in self._seen:
+                continue
+            self._seen.add(message['ts'])
+            new.append(message)
+
+        if new:
+            self.transcript.extend(new)
+            self.transcript.sort(key=lambda m: float(m['ts']))
+            if len(self.transcript) > self.max_transcript:
+                for message in self.transcript[:-self.max_transcript]:
+                    self._seen.discard(message['ts'])
+                self.transcript = self.transcript[-self.max_transcript:]
+            self.latest_ts = self.transcript[-1]['ts']
+        return new
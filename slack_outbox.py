@@ -0,0 +1,256 @@
+import os
+import time
+import atexit
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from slack_sdk.errors import SlackApiError
+
+from tracing import span, current_span
+
+# Slack's rate limits per Web API method as (requests per second, burst). chat.postMessage is limited per
+# channel (about one message a second with short bursts), the tiered methods per workspace.
+METHOD_LIMITS = {
+    "chat_postMessage": (1.0, 3),
+    "chat_update": (50 / 60, 3),  # Tier 3
+    "files_upload_v2": (20 / 60, 2),  # Tier 2
+}
+PER_CHANNEL_METHODS = {"chat_postMessage"}
+DEFAULT_LIMIT = (20 / 60, 1)  # Tier 2, for anything not listed above
+
+# Errors worth retrying with backoff; everything else (channel_not_found, invalid_auth, ...) won't get better
+RETRYABLE_ERRORS = {"ratelimited", "service_unavailable", "fatal_error", "internal_error", "request_timeout"}
+
+MAX_COALESCED_CHARS = 3500  # Slack starts splitting messages past ~4000 characters
+
+
+class TokenBucket:
+    """Thread-safe token bucket. A 429's Retry-After blocks the whole bucket until it passes."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Takes a token if one is available. Returns 0 on success, otherwise the seconds to wait before retrying."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def block(self, seconds):
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+class OutgoingMessage:
+    def __init__(self, method, kwargs, mergeable=True):
+        self.method = method
+        self.kwargs = kwargs
+        self.mergeable = mergeable
+        self.futures = [Future()]
+        self.attempts = 0
+        self.parent = current_span()  # Sends happen on the lane thread, so the poster's span is carried along
+        self.queued_at = time.monotonic()
+
+    def can_merge(self, other):
+        """Only plain text posts to the same place (same thread, same options) are merged, and a later edit
+        of the same message replaces an earlier one that hasn't gone out yet."""
+        if not self.mergeable or not other.mergeable:
+            return False
+        if self.method == other.method == "chat_update":
+            return self.kwargs.get("ts") == other.kwargs.get("ts")
+        if self.method != "chat_postMessage" or other.method != "chat_postMessage":
+            return False
+        if "blocks" in self.kwargs or "attachments" in self.kwargs or "blocks" in other.kwargs or "attachments" in other.kwargs:
+            return False
+        rest = {key: value for key, value in self.kwargs.items() if key != "text"}
+        other_rest = {key: value for key, value in other.kwargs.items() if key != "text"}
+        return rest == other_rest and len(self.kwargs.get("text", "")) + len(other.kwargs.get("text", "")) + 2 <= MAX_COALESCED_CHARS
+
+    def merge(self, other):
+        if self.method == "chat_update":
+            self.kwargs = other.kwargs
+        else:
+            self.kwargs = dict(self.kwargs, text=f"{self.kwargs.get('text', '')}\n\n{other.kwargs.get('text', '')}")
+        self.futures.extend(other.futures)
+
+
+class ChannelLane:
+    """One channel's queue and the background thread that drains it in order."""
+
+    def __init__(self, outbox, channel):
+        self.outbox = outbox
+        self.channel = channel
+        self.queue = deque()
+        self.sending = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self.run, name=f"slack-outbox-{channel}", daemon=True)
+        self.thread.start()
+
+    def put(self, message):
+        with self.cond:
+            self.queue.append(message)
+            self.cond.notify_all()
+
+    def idle(self):
+        return not self.queue and not self.sending
+
+    def run(self):
+        throttled = False
+        while True:
+            with self.cond:
+                while not self.queue:
+                    self.cond.wait()
+                head = self.queue[0]
+
+            wait = self.outbox.bucket(self.channel, head.method).reserve()
+            if wait:
+                throttled = True
+                time.sleep(min(wait, 1.0))
+                continue
+
+            with self.cond:
+                message = self.queue.popleft()
+                # Messages that piled up while we were held back by the rate limit go out as one post
+                while throttled and self.outbox.coalesce and self.queue and message.can_merge(self.queue[0]):
+                    message.merge(self.queue.popleft())
+                self.sending = True
+            throttled = False
+
+            try:
+                if not self.outbox.send(self.channel, message):
+                    with self.cond:
+                        self.queue.appendleft(message)  # Rate limited or transient failure: retry it before anything newer
+            except Exception as e:  # Keep the lane alive whatever happens; the message's callers get the error
+                self.outbox.finish(message, exception=e)
+            finally:
+                with self.cond:
+                    self.sending = False
+                    self.cond.notify_all()
+
+
+class SlackOutbox:
+    """Background Slack sender: post() queues a message and returns immediately with a Future for the response.
+
+    Every channel gets its own ordered queue drained by a worker thread. Sends are paced with token buckets
+    that follow Slack's per-method limits, a 429 pauses the method for its Retry-After and the message is
+    retried (never dropped), and text posts that back up behind the limit are coalesced into one message.
+    Pending messages are flushed at interpreter exit.
+    """
+
+    def __init__(self, slack_client, coalesce=True, max_attempts=5, flush_timeout=None, limits=None):
+        self.client = slack_client
+        self.limits = limits or METHOD_LIMITS  # method -> (requests per second, burst)
+        self.coalesce = coalesce
+        self.max_attempts = max_attempts
+        self.flush_timeout = flush_timeout if flush_timeout is not None else float(os.getenv("SLACK_OUTBOX_FLUSH_TIMEOUT", "30"))
+        self.lanes = {}
+        self.buckets = {}
+        self._lock = threading.Lock()
+        atexit.register(self.flush, self.flush_timeout)
+
+    def bucket(self, channel, method):
+        key = (method, channel) if method in PER_CHANNEL_METHODS else (method, None)
+        with self._lock:
+            if key not in self.buckets:
+                self.buckets[key] = TokenBucket(*self.limits.get(method, DEFAULT_LIMIT))
+            return self.buckets[key]
+
+    def lane(self, channel):
+        with self._lock:
+            if channel not in self.lanes:
+                self.lanes[channel] = ChannelLane(self, channel)
+            return self.lanes[channel]
+
+    def post(self, channel, method="chat_postMessage", mergeable=True, **kwargs):
+        """Queues a Web API call (chat_postMessage by default) for `channel`. Returns a Future of the SlackResponse.
+
+        mergeable=False keeps the call out of coalescing, e.g. for a post whose ts will be edited later.
+        """
+        message = OutgoingMessage(method, kwargs, mergeable)
+        self.lane(channel).put(message)
+        return message.futures[0]
+
+    def send(self, channel, message):
+        """Makes one attempt. Returns True when the message is done with (sent or given up on), False to retry it."""
+        message.attempts += 1
+        with span(f"slack.{message.method}", message.parent, channel=channel, attempt=message.attempts,
+                  request_chars=len(message.kwargs.get("text") or ""), coalesced=len(message.futures),
+                  queued_seconds=time.monotonic() - message.queued_at) as current:
+            return self._send(channel, message, current)
+
+    def _send(self, channel, message, current):
+        try:
+            response = getattr(self.client, message.method)(channel=channel, **message.kwargs)
+        except SlackApiError as e:
+            error = e.response.get("error") if hasattr(e.response, "get") else str(e)
+            if e.response.status_code == 429 or error == "ratelimited":
+                retry_after = self.retry_after(e.response)
+                print(f"Slack rate limited {message.method} in {channel}; retrying in {retry_after:.0f}s")
+                current.set(rate_limited=True, retry_after=retry_after)
+                self.bucket(channel, message.method).block(retry_after)
+                message.attempts -= 1  # Rate limiting doesn't count against the retry budget
+                return False
+            current.set(slack_error=error)
+            if error in RETRYABLE_ERRORS and message.attempts < self.max_attempts:
+                time.sleep(min(2 ** message.attempts, 30))
+                return False
+            print(f"Failed to send message to Slack: {error}")
+            return self.finish(message, exception=e)
+        except OSError as e:  # Connection errors and timeouts
+            current.set(slack_error=type(e).__name__)
+            if message.attempts < self.max_attempts:
+                time.sleep(min(2 ** message.attempts, 30))
+                return False
+            print(f"Failed to send message to Slack: {e}")
+            return self.finish(message, exception=e)
+        except Exception as e:  # SlackClientError, bad kwargs, ...: not worth retrying, but mustn't kill the lane
+            current.set(slack_error=type(e).__name__)
+            print(f"Failed to send message to Slack: {e}")
+            return self.finish(message, exception=e)
+        return self.finish(message, result=response)
+
+    @staticmethod
+    def retry_after(response):
+        for key, value in (response.headers or {}).items():
+            if key.lower() == "retry-after":
+                try:
+                    return max(float(value), 1.0)
+                except ValueError:
+                    break
+        return 30.0
+
+    @staticmethod
+    def finish(message, result=None, exception=None):
+        for future in message.futures:
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+        return True
+
+    def flush(self, timeout=None):
+        """Blocks until every queued message has been sent (or given up on). Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for lane in list(self.lanes.values()):
+            with lane.cond:
+                while not lane.idle():
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        print(f"Gave up flushing {len(lane.queue)} Slack message(s) for {lane.channel}")
+                        return False
+                    lane.cond.wait(remaining)
+        return True
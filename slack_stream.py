@@ -0,0 +1,138 @@
+import json
+import time
+import threading
+from concurrent.futures import Future
+
+from tracing import span
+
+PLACEHOLDER = "_typing…_"
+CURSOR = " …"  # Shown after partial text so it's clear the message is still being written
+FAILED_TEXT = "_(couldn't finish this reply)_"
+UPDATE_INTERVAL = 1.0  # Seconds between chat.update calls for one message; chat.update is Tier 3 (~50 a minute)
+MIN_UPDATE_CHARS = 20  # Don't bother editing the message for less new text than this
+
+
+def partial_json_field(text, field):
+    """The value of string `field` in an incomplete JSON object, as far as it has streamed in, or None.
+
+    Used to show the "full" answer of a fused answer/summary response while it's still being generated.
+    """
+    start = text.find(f'"{field}"')
+    if start == -1:
+        return None
+    colon = text.find(":", start + len(field) + 2)
+    quote = text.find('"', colon + 1) if colon != -1 else -1
+    if quote == -1 or text[colon + 1:quote].strip():
+        return None
+    end, escaped = quote + 1, False
+    while end < len(text):
+        if escaped:
+            escaped = False
+        elif text[end] == "\\":
+            escaped = True
+        elif text[end] == '"':
+            break
+        end += 1
+    raw = text[quote + 1:end]
+    # Drop a trailing escape sequence that hasn't fully arrived yet (at most 6 characters, e.g. é)
+    for cut in range(min(len(raw), 6) + 1):
+        try:
+            return json.loads(f'"{raw[:len(raw) - cut]}"')
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+class StreamingMessage:
+    """A Slack message that fills in while its text is generated.
+
+    start() queues a placeholder post; update() is called with the text so far and edits the message
+    with chat_update, at most every UPDATE_INTERVAL seconds and never with more than one edit in flight;
+    finish() queues the final text. Everything goes through the agent's SlackOutbox, so nothing here
+    blocks on Slack. Use it as a context manager: on an exception the message is closed with FAILED_TEXT.
+    """
+
+    def __init__(self, outbox, channel, placeholder=PLACEHOLDER, interval=UPDATE_INTERVAL, min_chars=MIN_UPDATE_CHARS):
+        self.outbox = outbox
+        self.channel = channel
+        self.placeholder = placeholder
+        self.interval = interval
+        self.min_chars = min_chars
+        self.text = ""
+        self.shown = ""
+        self.updates = 0
+        self.posted = None  # Future of the placeholder post, its response carries the message ts
+        self.pending = None  # Future of the edit in flight
+        self.finished = None
+        self.last_update = 0
+        self.first_text = None
+        self._started = None
+        self._trace = None  # The slack.stream span's context manager, and the span itself
+        self._span = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self._trace = span("slack.stream", channel=self.channel)
+        self._span = self._trace.__enter__()
+        return self.start()
+
+    def __exit__(self, exc_type, exc, traceback):
+        if self.finished is None:
+            self.finish(FAILED_TEXT if exc_type else self.text or FAILED_TEXT)
+        return self._trace.__exit__(exc_type, exc, traceback)
+
+    def start(self):
+        self._started = time.perf_counter()
+        # Never merged with neighbouring posts: the placeholder's ts is edited later
+        self.posted = self.outbox.post(self.channel, text=self.placeholder, mergeable=False)
+        return self
+
+    def ts(self):
+        """The placeholder's ts once Slack has accepted it, otherwise None."""
+        if self.posted is None or not self.posted.done() or self.posted.exception() is not None:
+            return None
+        return self.posted.result()["ts"]
+
+    def update(self, text):
+        """Records the text generated so far and edits the message if it's time to."""
+        with self._lock:
+            self.text = text
+            if time.monotonic() - self.last_update < self.interval or len(text) - len(self.shown) < self.min_chars:
+                return
+            if self.pending is not None and not self.pending.done():
+                return
+            ts = self.ts()
+            if ts is None:
+                return  # Placeholder not posted yet; the text keeps accumulating
+            if self.first_text is None:
+                self.first_text = time.perf_counter() - self._started
+            self.shown, self.last_update = text, time.monotonic()
+            self.updates += 1
+            self.pending = self.outbox.post(self.channel, method="chat_update", ts=ts, text=text + CURSOR)
+
+    def finish(self, text=None):
+        """Queues the final text (the streamed text if none is given). Returns a Future of the last Slack response."""
+        with self._lock:
+            text = self.text if text is None else text
+            self.text = text
+            self.finished = Future()
+            if self.first_text is None:
+                self.first_text = time.perf_counter() - self._started
+        if self._span is not None:
+            self._span.set(updates=self.updates, first_text_seconds=self.first_text, chars=len(text))
+        self.posted.add_done_callback(lambda posted: self._send_final(posted, text))
+        return self.finished
+
+    def _send_final(self, posted, text):
+        """Runs once the placeholder post is done: edits it to the final text, or posts fresh if the placeholder failed."""
+        if posted.exception() is not None:
+            future = self.outbox.post(self.channel, text=text)
+        else:
+            future = self.outbox.post(self.channel, method="chat_update", ts=posted.result()["ts"], text=text)
+        future.add_done_callback(self._resolve)
+
+    def _resolve(self, future):
+        if future.exception() is not None:
+            self.finished.set_exception(future.exception())
+        else:
+            self.finished.set_result(future.result())
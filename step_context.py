@@ -0,0 +1,71 @@
+from collections import deque
+
+from helpers import extractive_summary
+
+RECENT_STEPS = 5  # Steps always shown in full (well, head and tail of their output)
+FOLD_BATCH = 3  # Steps folded into the running summary at a time, once that many are past the recent window
+HEAD_CHARS = 800  # Of a step's output, kept from the start ...
+TAIL_CHARS = 800  # ... and from the end; errors and exit codes are usually at the end
+MAX_SUMMARY_CHARS = 2000
+
+
+def clip(text, head=HEAD_CHARS, tail=TAIL_CHARS):
+    """The first `head` and last `tail` characters of `text`, with a note of how much was cut in between."""
+    if len(text) <= head + tail:
+        return text
+    return f"{text[:head]}\n[... {len(text) - head - tail} characters omitted ...]\n{text[-tail:]}"
+
+
+class StepContext:
+    """Context for a step-by-step agent loop that stays about the same size however many steps run.
+
+    Only the newest steps are kept as they happened, each with just the head and tail of a long output. Once
+    FOLD_BATCH steps have dropped out of that window they're folded, together with the previous summary, into
+    one running summary via `summarize(text)` (an extract if that fails). render() is that summary followed by
+    the recent steps.
+    """
+
+    def __init__(self, summarize=None, recent_steps=RECENT_STEPS, fold_batch=FOLD_BATCH, head_chars=HEAD_CHARS,
+                 tail_chars=TAIL_CHARS, max_summary_chars=MAX_SUMMARY_CHARS):
+        self.summarize = summarize or extractive_summary
+        self.recent_steps = recent_steps
+        self.fold_batch = fold_batch
+        self.head_chars = head_chars
+        self.tail_chars = tail_chars
+        self.max_summary_chars = max_summary_chars
+        self.steps = deque()
+        self.summary = ""
+        self.folded = 0  # Steps that only live on in the summary
+
+    def add_step(self, action, result):
+        self.steps.append(f"Action: {action}\nResult: {clip(str(result), self.head_chars, self.tail_chars)}")
+        self._maybe_fold()
+
+    def add_note(self, note):
+        """Something that isn't an executed action, e.g. a skipped suggestion."""
+        self.steps.append(note)
+        self._maybe_fold()
+
+    def _maybe_fold(self):
+        if len(self.steps) < self.recent_steps + self.fold_batch:
+            return
+        batch = [self.steps.popleft() for _ in range(self.fold_batch)]
+        text = "\n".join(batch)
+        if self.summary:
+            text = f"Summary so far:\n{self.summary}\n\nSteps since then:\n{text}"
+        try:
+            summary = self.summarize(text)
+        except Exception as e:
+            print(f"Context summarization failed, keeping an extract instead: {e}")
+            summary = None
+        if not summary or not summary.strip():
+            summary = extractive_summary(text)
+        self.summary = clip(summary.strip(), self.max_summary_chars // 2, self.max_summary_chars // 2)
+        self.folded += len(batch)
+
+    def render(self):
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of {self.folded} earlier steps:\n{self.summary}")
+        parts.extend(self.steps)
+        return "\n".join(parts)
@@ -4,51 +4,174 @@ import re
 import json
 from groq import Groq
 from dotenv import load_dotenv
+from llm_cache import get_cache
+from project_index import ProjectIndex
+from file_scanner import FileScanner
+from context_select import select_context
+from prompt_budget import PromptBudget, Section
+from patching import PatchError, apply_change
+from file_transaction import FileTransaction
+from git_backend import GitBackend
+from clients import get_registry
+from tracing import span, annotate, record_usage
 
 load_dotenv()
 
+# Prompt pieces per edit format. "full" asks for whole original/updated files, "search_replace" for hunks only,
+# so the output scales with the size of the change instead of the size of the file.
+EDIT_FORMATS = {
+    "full": {
+        "instructions": """- **Output Format**: Provide the changes in a JSON format where keys are file paths and values are objects with "original" and "updated" keys.
+- **Instructions**:
+  - Only include files that need to be changed or created.
+  - For new files, the "original" content should be an empty string.
+  - Ensure the JSON is valid and properly escaped.
+  - Do not include any explanations or additional text.""",
+        "examples": '''
+Example task: Update the header to mention a cooking app
+
+Example changes:
+{
+  "app/page.js": {
+    "original": "export default function Home() {\\n  return (\\n    <main className=\\"flex min-h-screen flex-col items-center justify-between p-24\\">\\n      <h1 className=\\"text-4xl font-bold\\">Welcome to Our App</h1>\\n    </main>\\n  )\\n}",
+    "updated": "export default function Home() {\\n  return (\\n    <main className=\\"flex min-h-screen flex-col items-center justify-between p-24\\">\\n      <h1 className=\\"text-4xl font-bold\\">Welcome to Our Cooking App</h1>\\n    </main>\\n  )\\n}"
+  }
+}
+
+Example task: Add a new footer component with contact information
+
+Example changes:
+{
+  "components/Footer.js": {
+    "original": "",
+    "updated": "export default function Footer() {\\n  return (\\n    <footer className=\\"bg-gray-800 text-white p-4\\">\\n      <p>Contact us at contact@example.com</p>\\n    </footer>\\n  )\\n}"
+  },
+  "app/page.js": {
+    "original": "export default function Home() {\\n  return (\\n    <main>\\n      {/* Content */}\\n    </main>\\n  )\\n}",
+    "updated": "import Footer from '../components/Footer';\\n\\nexport default function Home() {\\n  return (\\n    <>\\n      <main>\\n        {/* Content */}\\n      </main>\\n      <Footer />\\n    </>\\n  )\\n}"
+  }
+}
+''',
+    },
+    "search_replace": {
+        "instructions": """- **Output Format**: Provide the changes in a JSON format where keys are file paths and values are objects with an "edits" list. Each edit has a "search" block copied exactly from the current file and the "replace" block that should take its place.
+- **Instructions**:
+  - Only include files that need to be changed or created.
+  - Keep each "search" block short: just the lines being changed plus a line of context if needed to make it unique.
+  - For new files, use a single edit with an empty "search" and the whole file as "replace".
+  - Ensure the JSON is valid and properly escaped.
+  - Do not include any explanations or additional text.""",
+        "examples": '''
+Example task: Update the header to mention a cooking app
+
+Example changes:
+{
+  "app/page.js": {
+    "edits": [
+      {
+        "search": "      <h1 className=\\"text-4xl font-bold\\">Welcome to Our App</h1>",
+        "replace": "      <h1 className=\\"text-4xl font-bold\\">Welcome to Our Cooking App</h1>"
+      }
+    ]
+  }
+}
+
+Example task: Add a new footer component with contact information
+
+Example changes:
+{
+  "components/Footer.js": {
+    "edits": [
+      {
+        "search": "",
+        "replace": "export default function Footer() {\\n  return (\\n    <footer className=\\"bg-gray-800 text-white p-4\\">\\n      <p>Contact us at contact@example.com</p>\\n    </footer>\\n  )\\n}"
+      }
+    ]
+  },
+  "app/page.js": {
+    "edits": [
+      {
+        "search": "export default function Home() {",
+        "replace": "import Footer from '../components/Footer';\\n\\nexport default function Home() {"
+      },
+      {
+        "search": "    <main>\\n      {/* Content */}\\n    </main>",
+        "replace": "    <>\\n      <main>\\n        {/* Content */}\\n      </main>\\n      <Footer />\\n    </>"
+      }
+    ]
+  }
+}
+''',
+    },
+}
+
 class SWEAgent:
-    def __init__(self, project_path):
+    def __init__(self, project_path, context_budget=3000, scanner=None, edit_format="search_replace"):
         self.project_path = project_path
-        self.groq = Groq(api_key=os.getenv("GROQ_API_KEY"))
+        self.edit_format = edit_format  # "search_replace" (hunks) or "full" (whole files), see EDIT_FORMATS
+        self.scanner = scanner or FileScanner(project_path)  # Ignore rules, size caps and the read thread pool
+        self.context_budget = context_budget  # Tokens of file contents sent to the model per task
+        self.prompt_budget = PromptBudget("groq", "llama3-70b-8192", min_output_tokens=1500)
+        self.groq = get_registry().groq(os.getenv("GROQ_API_KEY"))
         self.project_map = {}
+        self.llm_cache = get_cache()
+        self.index = ProjectIndex(project_path)  # Persistent path/mtime/size index so unchanged files are not re-read
+        self._scanned_bytes = 0
+        self.git = GitBackend(project_path)  # Persistent Repo handle, opened on first use
+        self.changed_paths = []  # Files written by the last implement_feature, staged by commit_changes
 
     def map_directory(self):
         print("Mapping app/ and components/ directories...")
-        self.project_map = {
-            'app': self._scan_directory(os.path.join(self.project_path, 'app')),
-            'components': self._scan_directory(os.path.join(self.project_path, 'components'))
-        }
+        with span("swe.map_directory") as current:
+            self.project_map = {}
+            self._scanned_bytes = 0  # The scanner's total size cap covers the whole map
+            for root in ('app', 'components'):
+                directory = os.path.join(self.project_path, root)
+                seen = []
+                self.project_map[root] = self._scan_directory(directory, seen)
+                self.index.prune(directory, seen)
+            print(f"Re-read {self.index.reads} changed file(s).")
+            current.set(files_read=self.index.reads, bytes_scanned=self._scanned_bytes)
+            self.index.save()
         return self.project_map
 
-    def _scan_directory(self, directory):
+    def _scan_directory(self, directory, seen=None):
         if not os.path.exists(directory):
             return {}
-        
+
+        files, over_cap, self._scanned_bytes = self.scanner.within_total(
+            self.scanner.walk(directory), self._scanned_bytes
+        )
+
+        # Fresh index entries are reused; only new or changed files are read, in parallel
+        records = {}
+        stale = {}
+        for path, stat in files:
+            record = self.index.lookup(path, stat)
+            if record is None:
+                stale[path] = stat
+            else:
+                records[path] = record
+        for path, record in self.scanner.read_many(list(stale)).items():
+            self.index.store(path, record, stale[path])
+            self.index.reads += 1
+            records[path] = record
+        for path, stat in over_cap:
+            records[path] = self.scanner.skipped(path, "total size cap reached", stat.st_size)
+
         structure = {}
-        for item in os.listdir(directory):
-            path = os.path.join(directory, item)
-            if os.path.isdir(path):
-                structure[item] = self._scan_directory(path)
-            elif os.path.isfile(path):
-                structure[item] = self._read_file(path)
+        for path, stat in files + over_cap:
+            parts = os.path.relpath(path, directory).split(os.sep)
+            node = structure
+            for part in parts[:-1]:
+                node = node.setdefault(part, {})
+            node[parts[-1]] = records[path]
+            if seen is not None:
+                seen.append(path)
         return structure
 
     def _read_file(self, file_path):
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-            return {
-                'content': content,
-                'size': len(content),
-                'extension': os.path.splitext(file_path)[1]
-            }
-        except Exception as e:
-            return {
-                'error': str(e),
-                'size': 0,
-                'extension': os.path.splitext(file_path)[1]
-            }
+        return self.scanner.read_file(file_path)
 
     def _extract_json(self, text):
         try:
@@ -67,66 +190,44 @@ class SWEAgent:
         if not self.project_map:
             self.map_directory()
 
-        project_context = json.dumps(self.project_map)
-        few_shot_example = '''
-Example task: Update the header to mention a cooking app
-
-Example changes:
-{
-  "app/page.js": {
-    "original": "export default function Home() {\\n  return (\\n    <main className=\\"flex min-h-screen flex-col items-center justify-between p-24\\">\\n      <h1 className=\\"text-4xl font-bold\\">Welcome to Our App</h1>\\n    </main>\\n  )\\n}",
-    "updated": "export default function Home() {\\n  return (\\n    <main className=\\"flex min-h-screen flex-col items-center justify-between p-24\\">\\n      <h1 className=\\"text-4xl font-bold\\">Welcome to Our Cooking App</h1>\\n    </main>\\n  )\\n}"
-  }
-}
-
-Example task: Add a new footer component with contact information
-
-Example changes:
-{
-  "components/Footer.js": {
-    "original": "",
-    "updated": "export default function Footer() {\\n  return (\\n    <footer className=\\"bg-gray-800 text-white p-4\\">\\n      <p>Contact us at contact@example.com</p>\\n    </footer>\\n  )\\n}"
-  },
-  "app/page.js": {
-    "original": "export default function Home() {\\n  return (\\n    <main>\\n      {/* Content */}\\n    </main>\\n  )\\n}",
-    "updated": "import Footer from '../components/Footer';\\n\\nexport default function Home() {\\n  return (\\n    <>\\n      <main>\\n        {/* Content */}\\n      </main>\\n      <Footer />\\n    </>\\n  )\\n}"
-  }
-}
-'''
-
-        prompt = f"""You are a skilled software engineer working on a Next.js project. Analyze the given project structure and file contents, then generate the necessary code changes based on the task.
-
-- **Output Format**: Provide the changes in a JSON format where keys are file paths and values are objects with "original" and "updated" keys.
-- **Instructions**:
-  - Only include files that need to be changed or created.
-  - For new files, the "original" content should be an empty string.
-  - Ensure the JSON is valid and properly escaped.
-  - Do not include any explanations or additional text.
-
-Project structure and contents:
-{project_context}
+        # Only the files most relevant to the task go in with full contents, the rest are listed by path
+        relevant_files, other_files = select_context(
+            self.project_map, task_description, self.context_budget, measure=self.prompt_budget.count
+        )
+        project_context = json.dumps(relevant_files)
+        other_context = "\n".join(f"- {path}" for path in other_files) or "(none)"
 
-Few-shot examples:
-{few_shot_example}
+        edit_format = EDIT_FORMATS[self.edit_format]
+        few_shot_example = edit_format["examples"]
+        instructions = f"""You are a skilled software engineer working on a Next.js project. Analyze the given project structure and file contents, then generate the necessary code changes based on the task.
 
-Task:
-{task_description}
+{edit_format["instructions"]}
 
-Provide the code changes to implement this task in the same format as the examples above."""
+Most relevant project files and their contents:
+"""
+        # Lowest priority is trimmed first: the path listing, then the examples, then file contents
+        prompt = self.prompt_budget.fit([
+            Section("instructions", instructions),
+            Section("files", project_context, priority=3),
+            Section("other_files", f"\n\nOther project files (contents omitted):\n{other_context}", priority=1),
+            Section("examples", f"\n\nFew-shot examples:\n{few_shot_example}", priority=2),
+            Section("task", f"\n\nTask:\n{task_description}\n\nProvide the code changes to implement this task in the same format as the examples above."),
+        ])
+        max_tokens = self.prompt_budget.max_output(prompt, 4000)
 
-        chat_completion = self.groq.chat.completions.create(
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            model="llama3-70b-8192",
-            temperature=0.2,
-            max_tokens=4000,
+        response = self.llm_cache.cached(
+            "groq", "llama3-70b-8192", prompt, {"temperature": 0.2, "max_tokens": max_tokens},
+            lambda: record_usage(self.groq.chat.completions.create(
+                messages=[
+                    {"role": "user", "content": prompt}
+                ],
+                model="llama3-70b-8192",
+                temperature=0.2,
+                max_tokens=max_tokens,
+            )).choices[0].message.content
         )
-
-        response = chat_completion.choices[0].message.content
-        print("Raw response from Groq:")
-        print(response)
         changes = self._extract_json(response)
+        annotate(files_changed=len(changes))
         return changes
 
     def propose_changes(self, task_description):
@@ -134,54 +235,99 @@ Provide the code changes to implement this task in the same format as the exampl
         print("\nProposed changes:")
         for file_path, content in changes.items():
             print(f"File: {file_path}")
-            print("Original Content:")
-            print(content['original'])
-            print("\nUpdated Content:")
-            print(content['updated'])
+            if 'edits' in content or 'diff' in content:
+                for edit in content.get('edits') or [{'search': '', 'replace': content['diff']}]:
+                    print("Search:")
+                    print(edit.get('search', ''))
+                    print("\nReplace:")
+                    print(edit.get('replace', ''))
+            else:
+                print("Original Content:")
+                print(content['original'])
+                print("\nUpdated Content:")
+                print(content['updated'])
             print("-" * 50)
         return changes
 
     def implement_feature(self, code_snippets):
-        for file_path, content in code_snippets.items():
-            full_path = os.path.join(self.project_path, file_path)
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        """Applies a changeset all-or-nothing. Returns False (and leaves the tree untouched) if any file fails."""
+        transaction = FileTransaction()
+        written = {}
+        try:
+            for file_path, content in code_snippets.items():
+                full_path = os.path.join(self.project_path, file_path)
 
-            if os.path.exists(full_path):
-                self._modify_file(full_path, content['original'], content['updated'])
-            else:
-                self._create_new_file(full_path, content['updated'])
-    
-    def _create_new_file(self, file_path, code):
-        with open(file_path, 'w', encoding='utf-8') as file:
-            file.write(code)
-        print(f"Created new file: {file_path}")
+                if 'edits' in content or 'diff' in content:
+                    new_code = self._patch_file(full_path, content)
+                elif os.path.exists(full_path):
+                    new_code = self._modify_file(full_path, content['original'], content['updated'])
+                else:
+                    new_code = content['updated']
+                transaction.write(full_path, new_code)
+                written[file_path] = (full_path, new_code)
+            transaction.commit()
+        except Exception as e:
+            transaction.rollback()
+            print(f"Changeset was not applied, all files rolled back: {e}")
+            return False
+
+        self.changed_paths = [os.path.relpath(full_path, self.project_path) for full_path, _ in written.values()]
+        for file_path, (full_path, new_code) in written.items():
+            print(f"Wrote file: {full_path}")
+            # Keep the index and the in-memory map current without re-reading the file
+            self.index.update_file(full_path, new_code)
+            self._update_project_map(file_path, self.index.lookup(full_path))
+        self.index.save()
+        return True
+
+    def _update_project_map(self, file_path, record):
+        parts = os.path.normpath(file_path).split(os.sep)
+        if not self.project_map or parts[0] not in self.project_map:
+            return
+        node = self.project_map
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = record
     
     def _modify_file(self, file_path, original_code, new_code):
+        """Checks a full-file change against the current content and returns the content to write."""
         with open(file_path, 'r', encoding='utf-8') as file:
             current_code = file.read()
 
         if current_code.strip() != original_code.strip():
-            print(f"Warning: Current content of {file_path} does not match the expected original content.")
-            return
+            raise PatchError(f"Current content of {file_path} does not match the expected original content.")
+        return new_code
+
+    def _patch_file(self, file_path, change):
+        """Applies search/replace or unified diff hunks to a file's current content and returns the result."""
+        current_code = ""
+        if os.path.exists(file_path):
+            with open(file_path, 'r', encoding='utf-8') as file:
+                current_code = file.read()
 
-        with open(file_path, 'w', encoding='utf-8') as file:
-            file.write(new_code)
-        print(f"Modified file: {file_path}")
+        try:
+            return apply_change(current_code, change)
+        except PatchError as e:
+            raise PatchError(f"Could not apply edits to {file_path}: {e}")
     
     def run_tests(self):
         result = subprocess.run(["npm", "test"], cwd=self.project_path, capture_output=True, text=True)
         print(result.stdout)
         return result.returncode == 0
     
-    def commit_changes(self):
+    def commit_changes(self, message="Implemented new feature"):
+        """Stages just the files from the last changeset and commits them in-process. Returns the commit sha or None."""
+        if not self.changed_paths:
+            print("No changed files to commit.")
+            return None
         try:
-            print("trace1")
-            subprocess.run(["git", "add", "."], cwd=self.project_path)
-            print("trace2")
-            subprocess.run(["git", "commit", "-m", "Implemented new feature"], cwd=self.project_path)
-            print("trace3")
-        except:
-            print("could not add and commit")
+            sha = self.git.commit(self.changed_paths, message)
+            print(f"Committed {len(self.changed_paths)} file(s) ({self.git.report_timings()})")
+            self.changed_paths = []
+            return sha
+        except Exception as e:
+            print(f"could not add and commit: {e}")
+            return None
 
 # if __name__ == "__main__":
 #     agent = SWEAgent("../../stealth-startup-dev/landing")
@@ -1,50 +1,75 @@
-import subprocess
+"""Step-by-step terminal agent. Run it from the repo root so the shared modules import: python -m tools.engineering.terminal"""
 import os
-from groq import Groq
+
+from prompt_budget import PromptBudget, Section, compact_whitespace
+from clients import get_registry
+from shell_session import ShellSession
+from step_context import StepContext
 
 # Initialize Groq client
-client = Groq(api_key="groq api key")
+client = get_registry().groq("groq api key")
+prompt_budget = PromptBudget("groq", "llama3-70b-8192")
+
+SYSTEM_PROMPT = "You are an AI assistant that suggests executable commands or simple actions to accomplish tasks step by step. Provide one command or action at a time."
+SUMMARY_PROMPT = """Condense these notes from a terminal session into at most 8 short lines. Keep what's needed to carry on
+with the task: the current directory, files created or changed, commands that failed and why, and what is left to do."""
 
-def execute_command(command):
-    """Execute a shell command and return the output."""
-    result = subprocess.run(command, shell=True, capture_output=True, text=True)
-    return result.stdout, result.stderr
+def execute_command(shell, command, on_output=None):
+    """Execute a shell command in the persistent session and return its CommandResult (output and exit code)."""
+    return shell.run(command, on_output=on_output)
 
-def edit_file(filename, content):
-    """Edit a file using direct file writing."""
+def edit_file(filename, content, cwd=None):
+    """Edit a file using direct file writing. Relative paths are relative to `cwd` (the shell's directory)."""
+    filename = os.path.join(cwd or os.getcwd(), filename)
     with open(filename, 'w') as f:
         f.write(content)
     return f"File {filename} has been created/updated."
 
 def ai_agent(task, context=""):
     """AI agent to interpret tasks, suggest actions, and evaluate completion."""
-    prompt = f"""Task: {task}
-Previous Context: {context}
+    # The context is trimmed from the front (oldest steps) when the prompt would not fit next to the system prompt
+    prompt = prompt_budget.fit([
+        Section("task", f"Task: {task}\nPrevious Context: "),
+        Section("context", context, priority=1, keep="tail", compact=compact_whitespace),
+        Section("instructions", """
 
 Suggest the next step to complete the task. Provide a single, executable command or a short description of an action.
 If the task is complete, respond with 'TASK COMPLETED'.
 
-Suggested action:"""
+Suggested action:"""),
+    ], reserve_output_tokens=100 + prompt_budget.count(SYSTEM_PROMPT))
     
     response = client.chat.completions.create(
         messages=[
-            {"role": "system", "content": "You are an AI assistant that suggests executable commands or simple actions to accomplish tasks step by step. Provide one command or action at a time."},
+            {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": prompt}
         ],
         model="llama3-70b-8192",
-        max_tokens=100
+        max_tokens=prompt_budget.max_output(SYSTEM_PROMPT + prompt, 100)
     )
     
     return response.choices[0].message.content.strip()
 
-def execute_action(action):
-    """Execute the suggested action and return the result."""
+def summarize_steps(text):
+    """Summarizer for the context's older steps."""
+    prompt = f"{SUMMARY_PROMPT}\n\n{text}"
+    response = client.chat.completions.create(
+        messages=[{"role": "user", "content": prompt}],
+        model="llama3-70b-8192",
+        max_tokens=prompt_budget.max_output(prompt, 300)
+    )
+    return response.choices[0].message.content.strip()
+
+def execute_action(shell, action, on_output=None):
+    """Execute the suggested action in `shell` and return the result. Command output is passed to `on_output` as it arrives."""
     if action.startswith("edit:"):
         _, filename, content = action.split(":", 2)
-        return edit_file(filename, content.strip())
+        return edit_file(filename, content.strip(), shell.working_directory())
     else:
-        output, error = execute_command(action)
-        return output if output else error
+        return str(execute_command(shell, action, on_output))
+
+def show_output(text):
+    print(text, end="", flush=True)
 
 def get_human_approval(action):
     """Ask for human approval before executing an action."""
@@ -60,12 +85,15 @@ def get_human_approval(action):
         else:
             print("Invalid input. Please enter 'y', 'n', or 'm'.")
 
-def main():
+def main(shell=None):
+    # One shell for the whole session, so cd, exports and activated environments carry over between steps
+    shell = shell or ShellSession(timeout=float(os.getenv("TERMINAL_COMMAND_TIMEOUT", "120")))
     task = input("Enter a task: ")
-    context = ""
+    # Recent steps in full, older ones folded into a running summary, so the prompt stays about the same size
+    context = StepContext(summarize=summarize_steps)
     
     while True:
-        action = ai_agent(task, context)
+        action = ai_agent(task, context.render())
         
         if action == "TASK COMPLETED":
             print("AI suggests the task is completed. Do you agree?")
@@ -74,19 +102,19 @@ def main():
                 print("Task completed successfully!")
                 break
             else:
-                context += "\nHuman disagreed with task completion."
+                context.add_note("Human disagreed with task completion.")
                 continue
         
         approved, action_to_execute = get_human_approval(action)
         
         if approved:
             print(f"Executing: {action_to_execute}")
-            result = execute_action(action_to_execute)
-            print(f"Result: {result}")
-            context += f"\nAction: {action_to_execute}\nResult: {result}"
+            result = execute_action(shell, action_to_execute, on_output=show_output)
+            print(f"\nResult: {result.splitlines()[-1] if result else ''}")  # The output itself was streamed above
+            context.add_step(action_to_execute, result)
         else:
             print("Action skipped.")
-            context += f"\nAction suggested but skipped: {action}"
+            context.add_note(f"Action suggested but skipped: {action}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
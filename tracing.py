@@ -0,0 +1,274 @@
+import os
+import json
+import time
+import atexit
+import random
+import threading
+import contextvars
+from contextlib import contextmanager
+
+MAX_SAMPLES = 2048  # Per histogram; past this the samples are a uniform reservoir of everything observed
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed unit of work. Spans nest through a context variable, so asyncio tasks and asyncio.to_thread
+    calls inherit their parent automatically; pass `parent=` explicitly when handing work to another thread."""
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else os.urandom(8).hex()
+        self.span_id = os.urandom(8).hex()
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self.duration = None
+        self.error = None
+        self._start = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, key, amount=1):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "start": self.start_time,
+            "duration": self.duration,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class Histogram:
+    def __init__(self, max_samples=MAX_SAMPLES):
+        self.max_samples = max_samples
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.samples = []
+        self._random = random.Random(0)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if len(self.samples) < self.max_samples:
+            self.samples.append(value)
+        else:
+            index = self._random.randrange(self.count)
+            if index < self.max_samples:
+                self.samples[index] = value
+
+    def percentile(self, fraction):
+        """Nearest-rank percentile over the samples."""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[max(0, min(len(ordered) - 1, int(fraction * len(ordered) + 0.5) - 1))]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "min": self.min,
+            "p50": self.percentile(0.50),
+            "p90": self.percentile(0.90),
+            "p99": self.percentile(0.99),
+            "max": self.max,
+        }
+
+
+class MetricsRegistry:
+    """In-process counters and percentile histograms, fed by every finished span."""
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value):
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(value)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record(self, span):
+        """Span duration and call/error counts, numeric attributes as histograms, true flags as counters."""
+        self.increment(f"{span.name}.calls")
+        if span.error:
+            self.increment(f"{span.name}.errors")
+        self.observe(f"{span.name}.seconds", span.duration)
+        for key, value in span.attributes.items():
+            if value is True:
+                self.increment(f"{span.name}.{key}")
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.observe(f"{span.name}.{key}", value)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "histograms": {name: histogram.summary() for name, histogram in self.histograms.items()},
+            }
+
+    def report(self):
+        """Span latencies (p50/p90/p99 and total time) sorted by where the time went, then the counters."""
+        snapshot = self.snapshot()
+        timings = [(name[:-len(".seconds")], stats) for name, stats in snapshot["histograms"].items() if name.endswith(".seconds")]
+        lines = [f"{'span':<36}{'calls':>7}{'total s':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}"]
+        for name, stats in sorted(timings, key=lambda item: -item[1]["count"] * item[1]["mean"]):
+            lines.append(f"{name:<36}{stats['count']:>7}{stats['count'] * stats['mean']:>10.2f}"
+                         f"{stats['p50'] * 1000:>10.1f}{stats['p90'] * 1000:>10.1f}{stats['p99'] * 1000:>10.1f}")
+        counters = [f"{name}={count}" for name, count in sorted(snapshot["counters"].items()) if not name.endswith(".calls")]
+        if counters:
+            lines.append("Counters: " + ", ".join(counters))
+        return "\n".join(lines)
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+
+
+class JsonlExporter:
+    """Appends finished spans to a JSONL file, one object per line."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class Tracer:
+    """Creates spans, feeds them to the metrics registry when they finish and exports them (if an exporter is set)."""
+
+    def __init__(self, exporter=None, metrics=None):
+        self.exporter = exporter
+        self.metrics = metrics or MetricsRegistry()
+
+    @contextmanager
+    def span(self, name, parent=None, **attributes):
+        span = Span(name, parent if parent is not None else _current_span.get(), attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            self.finish(span)
+
+    def finish(self, span):
+        span.duration = time.perf_counter() - span._start
+        if span.attributes.get("http_requests", 0) > 1:
+            span.set(retries=span.attributes["http_requests"] - 1)
+        self.metrics.record(span)
+        if self.exporter is not None:
+            try:
+                self.exporter.export(span)
+            except OSError as e:
+                print(f"Could not export span {span.name}: {e}")
+
+
+_default_tracer = None
+
+
+def get_tracer():
+    """Process-wide tracer. Metrics are always collected; spans are only exported when TRACE_PATH names a JSONL file."""
+    global _default_tracer
+    if _default_tracer is None:
+        exporter = None
+        if os.getenv("TRACE_PATH"):
+            exporter = JsonlExporter(os.getenv("TRACE_PATH"))
+            atexit.register(exporter.close)
+        _default_tracer = Tracer(exporter)
+    return _default_tracer
+
+
+def get_metrics():
+    return get_tracer().metrics
+
+
+def span(name, parent=None, **attributes):
+    """Context manager for a span under the current one, e.g. `with span("git.push", files=3) as s: ...`."""
+    return get_tracer().span(name, parent, **attributes)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def annotate(**attributes):
+    """Sets attributes on the current span, if there is one."""
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+def record_usage(response):
+    """Copies token usage from a Groq (`usage`) or Cohere (`meta.billed_units`) response onto the current span. Returns the response."""
+    usage = getattr(response, "usage", None)
+    if getattr(usage, "prompt_tokens", None) is not None:
+        annotate(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens or 0)
+        return response
+    billed = getattr(getattr(response, "meta", None), "billed_units", None)
+    if billed is not None:
+        annotate(prompt_tokens=int(billed.input_tokens or 0), completion_tokens=int(billed.output_tokens or 0))
+    return response
+
+
+def _count_request(request):
+    current = _current_span.get()
+    if current is not None:
+        current.add("http_requests")
+        current.add("request_bytes", int(request.headers.get("content-length") or 0))
+
+
+def _count_response(response):
+    current = _current_span.get()
+    if current is not None:
+        current.add("response_bytes", int(response.headers.get("content-length") or 0))
+        if response.status_code >= 400:
+            current.add("http_errors")
+
+
+async def _acount_request(request):
+    _count_request(request)
+
+
+async def _acount_response(response):
+    _count_response(response)
+
+
+# httpx event hooks for the shared provider pools: request count (so SDK-internal retries show up) and payload sizes
+HTTP_HOOKS = {"request": [_count_request], "response": [_count_response]}
+ASYNC_HTTP_HOOKS = {"request": [_acount_request], "response": [_acount_response]}